@@ -4,6 +4,8 @@ import subprocess
 import matplotlib.pyplot as plt
 import numpy as np
 
+from raster_image import drawRaster
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('-c', '--conf', type=str, help='Path to conf file')
@@ -22,7 +24,7 @@ if __name__ == '__main__':
 
     timer = 0.0
     time = np.linspace(0, 3, 60)
-    ord_spikes = [[] for i in range(50)]
+    ord_times, ord_neurons = [], []
     ord_counts = [[0] for i in range(5)]
     last_time = 0.0
     counts = [0 for i in range(5)]
@@ -41,7 +43,8 @@ if __name__ == '__main__':
         with open('ordinal.dat', 'r') as spike_file:
             for event in spike_file:
                 t, neuron = event.split(' ')
-                ord_spikes[int(neuron)].append(float(t))
+                ord_times.append(float(t))
+                ord_neurons.append(int(neuron))
 
                 while (float(t) - timer) >= 0:
                     timer += 0.0001
@@ -62,7 +65,7 @@ if __name__ == '__main__':
     fig, axs = plt.subplots(2, 1)
     colors1 = [f'C{i//10}' for i in range(50)]
     axs[0].set_xlim(-0.1, 3.1)
-    axs[0].eventplot(ord_spikes, linelengths = 0.8, linewidths = 1.0, colors = colors1)
+    drawRaster(axs[0], np.array(ord_times), np.array(ord_neurons), 50, 3.0, colors1)
     axs[1].set_xlim(-0.1, 3.1)
     axs[1].plot(time, ord_counts[0], time, ord_counts[1], time, ord_counts[2], time, ord_counts[3], time, ord_counts[4])
     plt.show()
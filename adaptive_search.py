@@ -0,0 +1,155 @@
+import itertools
+
+import numpy as np
+
+from allocation import resolveAllocation
+from sweep import SweepResult, robustness, runCells
+
+
+def wilsonInterval(successes, trials, z=1.96):
+    '''Wilson score interval (low, high) of a success rate, (0, 1) without trials. Works on arrays.'''
+    successes = np.asarray(successes, dtype=np.float64)
+    trials = np.asarray(trials, dtype=np.float64)
+    n = np.maximum(trials, 1)
+    p = successes / n
+    center = (p + z**2 / (2*n)) / (1 + z**2 / n)
+    half = z * np.sqrt(p*(1 - p)/n + z**2 / (4*n**2)) / (1 + z**2 / n)
+    low = np.where(trials > 0, np.clip(center - half, 0.0, 1.0), 0.0)
+    high = np.where(trials > 0, np.clip(center + half, 0.0, 1.0), 1.0)
+    return low, high
+
+
+class RepeatedBuild:
+    '''Picklable wrapper of a cell builder that overrides the number of trials of the cell, and its
+    seed when one is given. Otherwise a seed set by build is shifted by seed_offset, so rungs of
+    runAdaptiveSweep do not repeat the trials of the previous ones.'''
+
+    def __init__(self, build, repetition, seed=None, seed_offset=0):
+        self.build = build
+        self.repetition = repetition
+        self.seed = seed
+        self.seed_offset = seed_offset
+
+    def __call__(self, **params):
+        cell = self.build(**params)
+        snn = cell.sim if hasattr(cell, 'sim') else cell
+        if hasattr(cell, 'repete'):
+            cell.repete = self.repetition
+        snn.iter = self.repetition
+        if self.seed is not None:
+            snn.seed = self.seed
+        elif snn.seed is not None:
+            snn.seed += self.seed_offset
+        return cell
+
+
+def runAdaptiveSweep(grid, build, item, target, initial=2, eta=2, max_repetition=32, z=1.96, seed=None,
+                     evaluate=robustness, workers=None, thread=None, engine='flysim', scratch_root=None):
+    '''Successive-halving version of runSweep for robustness counts.
+
+    Every cell first runs initial trials. After each rung, cells whose Wilson interval on
+    the success rate evaluate(cell)[item] / trials lies below target are dropped, the others
+    run eta times more trials than in the previous rung, until they reach max_repetition
+    trials in total. Trials of all rungs are pooled. The values of the returned SweepResult
+    hold (estimate, low, high, trials) of every cell. With a seed, rung k uses seed + k.
+    workers and thread left as None are resolved once, from the plan for the first rung,
+    which runs the most cells.'''
+    axes = {name: list(values) for name, values in grid.items()}
+    cells = [dict(zip(axes, combination)) for combination in itertools.product(*axes.values())]
+    successes = np.zeros(len(cells), dtype=np.int64)
+    trials = np.zeros(len(cells), dtype=np.int64)
+    active = np.arange(len(cells))
+    repetition = initial
+    workers, thread = resolveAllocation(lambda: RepeatedBuild(build, initial, seed, 0)(**cells[0]), engine, workers, thread)
+    for rung in itertools.count():
+        if not active.size:
+            break
+        repetition = min(repetition, max_repetition - trials[active].max())
+        rung_build = RepeatedBuild(build, repetition, None if seed is None else seed + rung, rung)
+        results = runCells([cells[c] for c in active], rung_build, evaluate, workers, thread, engine, scratch_root)
+        successes[active] += [result[item] for result in results]
+        trials[active] += repetition
+        low, high = wilsonInterval(successes[active], trials[active], z)
+        active = active[(high >= target) & (trials[active] < max_repetition)]
+        repetition *= eta
+    low, high = wilsonInterval(successes, trials, z)
+    estimates = np.stack((successes / np.maximum(trials, 1), low, high, trials), axis=-1)
+    shape = tuple(len(values) for values in axes.values())
+    return SweepResult(axes, estimates.reshape(shape + (4,)))
+
+
+def printEstimates(result):
+    '''Print the estimate and interval of every cell of a runAdaptiveSweep result.'''
+    for index in itertools.product(*(range(len(values)) for values in result.axes.values())):
+        params = ', '.join(f'{name}={values[i]}' for (name, values), i in zip(result.axes.items(), index))
+        estimate, low, high, trials = result.values[index]
+        print(f'{params}: {estimate:.2f} [{low:.2f}, {high:.2f}] over {int(trials)} trials')
+
+
+class RepetitionController:
+    '''Sequential stopping of the trials of an SNNSequenceControl.
+
+    Trials run in batches of batch and the robustness counts of calculateRobustness are
+    pooled, until the Wilson interval of every success rate x[i] / trials has a half width
+    of at most tolerance or max_trials trials ran. With a seed on the network, batch k runs
+    with seed + k. trials holds the number of trials used.'''
+
+    def __init__(self, ssc, batch=10, max_trials=100, tolerance=0.05, z=1.96):
+        self.ssc = ssc
+        self.batch = batch
+        self.max_trials = max_trials
+        self.tolerance = tolerance
+        self.z = z
+        self.counts = np.zeros(ssc.length, dtype=np.int64)
+        self.trials = 0
+        self.batches = 0
+
+    def update(self, x, trials):
+        '''Add the robustness counts of trials more trials.'''
+        self.counts += np.asarray(x, dtype=np.int64)
+        self.trials += trials
+        self.batches += 1
+
+    def getIntervals(self):
+        return wilsonInterval(self.counts[1:], self.trials, self.z)
+
+    def isSettled(self):
+        if self.trials >= self.max_trials:
+            return True
+        if self.trials == 0:
+            return False
+        low, high = self.getIntervals()
+        return bool(np.all((high - low) / 2 <= self.tolerance))
+
+    def runBatch(self, thread=1, engine='flysim', cache=None):
+        trials = min(self.batch, self.max_trials - self.trials)
+        seed = self.ssc.sim.seed
+        if seed is None:
+            # Every unseeded batch is a new sample, a cached one would be pooled again and again.
+            cache = None
+        self.ssc.repete = self.ssc.sim.iter = trials
+        if seed is not None:
+            self.ssc.sim.seed = seed + self.batches
+        try:
+            self.ssc.startSimulation(thread, engine, cache)
+        finally:
+            self.ssc.sim.seed = seed
+        self.update(self.ssc.calculateRobustness(), trials)
+
+    def run(self, thread=1, engine='flysim', cache=None):
+        '''Run batches until the rates settle, return the pooled counts like calculateRobustness.'''
+        while not self.isSettled():
+            self.runBatch(thread, engine, cache)
+        return [int(count) for count in self.counts]
+
+    def getRates(self):
+        return self.counts / max(self.trials, 1)
+
+
+def controlledRobustness(cell, engine='flysim', thread=1, batch=10, max_trials=100, tolerance=0.05):
+    '''Sweep evaluation that takes the simulated trials of the cell as the first batch and adds
+    batches until the rates settle. Returns the rates, as the number of trials differs per cell.'''
+    controller = RepetitionController(cell, batch, max_trials, tolerance)
+    controller.update(cell.calculateRobustness(), cell.repete)
+    controller.run(thread, engine)
+    return controller.getRates().tolist()
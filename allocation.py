@@ -0,0 +1,140 @@
+import argparse
+import importlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+PLAN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'allocation_plans.json')
+
+
+def getCoreCount():
+    '''Cores this process may run on, which can be fewer than os.cpu_count() under a scheduler.'''
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count()
+
+
+def getCellSize(cell):
+    '''(neurons, trials) of a sweep cell, an SNNSequenceControl, a NetworkTemplate or a FlysimSNN.'''
+    cell = cell.cell if hasattr(cell, 'cell') else cell
+    snn = cell.sim if hasattr(cell, 'sim') else cell
+    return int(snn.registry.populations.column('N').sum()), snn.iter
+
+
+def getCandidates(cores, engine):
+    '''(threads per job, jobs at once) pairs to calibrate. Only flysim runs several threads,
+    the numpy engine is tried with fewer jobs than cores against memory bandwidth.'''
+    counts = sorted({2**i for i in range(int(np.log2(cores)) + 1)} | {cores})
+    if engine == 'flysim':
+        return [(thread, cores // thread) for thread in counts]
+    return [(1, workers) for workers in counts]
+
+
+class AllocationPlans:
+    '''Thread and job allocations chosen by calibrate, kept in a JSON file.
+
+    Every plan holds the engine, the cores, the neurons and trials of the calibrated cell,
+    the chosen thread and workers and the throughput of all candidates. find returns the
+    plan of the same engine and cores whose network size and trials are closest.'''
+
+    def __init__(self, path=PLAN_FILE):
+        self.path = os.path.abspath(path)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path) as stream:
+            return json.load(stream)
+
+    def store(self, plan):
+        '''Add plan, replacing the plan of the same engine, cores, neurons and trials.'''
+        key = ('engine', 'cores', 'neurons', 'repetition')
+        plans = [old for old in self.load() if any(old[name] != plan[name] for name in key)]
+        plans.append(plan)
+        with open(self.path, 'w') as stream:
+            json.dump(plans, stream, indent=1)
+
+    def find(self, engine, cores, neurons, repetition):
+        plans = [plan for plan in self.load() if plan['engine'] == engine and plan['cores'] == cores]
+        if not plans:
+            return None
+        distance = lambda plan: abs(np.log2(max(neurons, 1) / max(plan['neurons'], 1))) + abs(np.log2(max(repetition, 1) / max(plan['repetition'], 1)))
+        return min(plans, key=distance)
+
+
+def resolveAllocation(getCell, engine, workers=None, thread=None, path=PLAN_FILE):
+    '''Return (workers, thread) with the ones left as None taken from the saved plan closest to
+    the cell getCell() returns, or all cores this process may run on and one thread without a plan.'''
+    plan = None
+    if (workers is None or thread is None) and os.path.exists(path):
+        neurons, repetition = getCellSize(getCell())
+        plan = AllocationPlans(path).find(engine, getCoreCount(), neurons, repetition)
+    if workers is None:
+        workers = plan['workers'] if plan else getCoreCount()
+    if thread is None:
+        thread = plan['thread'] if plan else 1
+    return workers, thread
+
+
+def runCalibrationCell(build, params, thread, engine, scratch_root):
+    # Imported here, sweep looks up the plans of this module.
+    from sweep import runCell, robustness
+    return runCell(build, robustness, params, thread, engine, scratch_root, False, None)
+
+
+def calibrate(build, params, engine='flysim', cores=None, rounds=1, scratch_root=None, path=PLAN_FILE):
+    '''Time build(**params) cells under every candidate allocation and save the fastest as a plan.
+
+    For each (thread, workers) candidate, a pool of workers processes is started and warmed
+    up, then rounds * workers cells run through it with thread threads each. The cells per
+    hour of the candidate are the cells run over the wall time. Calibrate with a cell of
+    the network size and trials of the sweep, the plan is looked up by them.'''
+    cores = cores if cores else getCoreCount()
+    neurons, repetition = getCellSize(build(**params))
+    scratch = tempfile.mkdtemp(prefix='calibration_', dir=scratch_root)
+    measured = []
+    try:
+        for thread, workers in getCandidates(cores, engine):
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for future in [pool.submit(os.getpid) for i in range(workers)]:
+                    future.result()
+                start = time.perf_counter()
+                futures = [pool.submit(runCalibrationCell, build, params, thread, engine, scratch) for i in range(rounds * workers)]
+                for future in futures:
+                    future.result()
+                elapsed = time.perf_counter() - start
+            measured.append({'thread': thread, 'workers': workers, 'cells_per_hour': rounds * workers * 3600 / elapsed})
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    best = max(measured, key=lambda candidate: candidate['cells_per_hour'])
+    plan = {'engine': engine, 'cores': cores, 'neurons': neurons, 'repetition': repetition,
+            'thread': best['thread'], 'workers': best['workers'], 'cells_per_hour': best['cells_per_hour'], 'measured': measured}
+    AllocationPlans(path).store(plan)
+    return plan
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Calibrate the threads per simulation and simulations at once for a sweep cell, and save the plan.')
+    parser.add_argument('build', type=str, help='Cell builder as module:function, e.g. stimulus_search:buildCosCell')
+    parser.add_argument('params', type=str, nargs='*', help='Parameters of the cell as name=value')
+    parser.add_argument('-e', '--engine', choices=['flysim', 'numpy'], default='flysim', help='Simulation engine')
+    parser.add_argument('-c', '--cores', type=int, default=None, help='Cores to allocate, all available by default')
+    parser.add_argument('-r', '--rounds', type=int, default=1, help='Cells per job of every candidate')
+    parser.add_argument('-o', '--output', type=str, default=PLAN_FILE, help='Path to the plan file')
+    args = parser.parse_args()
+
+    module, name = args.build.split(':')
+    build = getattr(importlib.import_module(module), name)
+    params = {}
+    for param in args.params:
+        key, value = param.split('=', 1)
+        params[key] = json.loads(value)
+    plan = calibrate(build, params, args.engine, args.cores, args.rounds, path=args.output)
+    for candidate in plan['measured']:
+        print(f"{candidate['thread']:3d} threads x {candidate['workers']:3d} jobs: {candidate['cells_per_hour']:10.1f} cells/hour")
+    print(f"Plan for {plan['neurons']} neurons and {plan['repetition']} trials: {plan['thread']} threads x {plan['workers']} jobs, saved in {args.output}")
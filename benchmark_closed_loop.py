@@ -0,0 +1,81 @@
+import argparse
+import gc
+import sys
+
+from simulation_session import SimulationSession
+from ssc import SNNSequenceControl
+
+
+def getWinner(rates, threshold=20.0):
+    '''The population firing most, or None when none fires above threshold Hz.'''
+    winner = max(rates, key=rates.get)
+    return winner if rates[winner] > threshold else None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Drive the 5-node drone_v1 SSC through its whole Task sequence step by step like a vehicle control loop, '
+                                                 'exit with 1 if the sequence is wrong or a tick takes longer than the tick.')
+    parser.add_argument('-t', '--tick', type=float, default=10.0, help='Control tick (ms)')
+    parser.add_argument('-d', '--duration', type=float, default=5000.0, help='Longest simulated time (ms)')
+    parser.add_argument('--hold', type=float, default=300.0, help='Time a Task is held before commanding the next one (ms)')
+    parser.add_argument('--retry', type=float, default=150.0, help='Time without a transition before commanding it again (ms)')
+    parser.add_argument('-s', '--strength', type=float, default=350.0, help='CurrentStatus drive of a command (Hz)')
+    parser.add_argument('-w', '--weight-strength', type=float, default=200.0, help='Extra drive per unit of task weight of the active Task (Hz)')
+    parser.add_argument('--width', type=float, default=30.0, help='Duration of a command (ms)')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the session')
+    args = parser.parse_args()
+
+    task_weights = [1, 1, 4, 4, 1]
+    ssc = SNNSequenceControl(5, fork_pos_len_w=[(2, 1, 1)], task_weights=task_weights, experiment_time=args.duration, repetition=1, filename_base='drone_v1')
+    session = SimulationSession(ssc.sim, seed=args.seed, use_protocol=False)
+    tasks = [name for name in session.names if name.startswith('Task') and name[4:5].isdigit()]
+    expected = [f'Task{id}' for id in range(ssc.length)]
+    weights = dict(zip(expected, task_weights))
+    # Keep the objects of the network out of the collections during the loop, a full
+    # collection of them takes longer than a tick.
+    gc.collect()
+    gc.freeze()
+
+    # Start the attractor at 100 ms. Once a Task was held for hold ms, command the next
+    # one with a drive growing with the weight of the active Task, which holds the
+    # TaskTarget against CurrentStatus, and command it again after retry ms without a
+    # transition. A Task counts as active once it wins two ticks in a row.
+    inputs = {100.0: ('Ordinal0', 400), 150.0: ('Ordinal0', 0)}
+    active, candidate = [], None
+    held_since = command_time = None
+    commands = 0
+    while session.time < args.duration - 1e-9:
+        if active and active[-1] != expected[-1] and session.time - held_since >= args.hold - 1e-9 and \
+           (command_time is None or session.time - command_time >= args.retry - 1e-9):
+            inputs[session.time] = ('CurrentStatus', args.strength + args.weight_strength * weights.get(active[-1], 1))
+            inputs[session.time + args.width] = ('CurrentStatus', 0)
+            command_time = session.time
+            commands += 1
+        for input_time in sorted(t for t in inputs if t <= session.time + 1e-9):
+            population, hz = inputs.pop(input_time)
+            session.setInput(population, 'AMPA', hz)
+        session.step(args.tick)
+        winner = getWinner(session.readRates(tasks))
+        if winner is not None and winner == candidate and (not active or active[-1] != winner):
+            active.append(winner)
+            held_since, command_time = session.time, None
+        candidate = winner
+        session.readSpikes()
+        if active and active[-1] == expected[-1] and session.time - held_since >= args.hold - 1e-9:
+            break
+
+    stats = session.getLatencyStats()
+    print(f"active Task sequence: {' -> '.join(active)} after {commands} commands, {session.time:.0f} ms")
+    print(f"{stats['steps']} ticks of {args.tick} ms: mean {stats['mean']:.2f} ms, p50 {stats['p50']:.2f} ms, "
+          f"p95 {stats['p95']:.2f} ms, p99 {stats['p99']:.2f} ms, max {stats['max']:.2f} ms")
+    print(f"real-time factor {stats['realtime_factor']:.1f}x, p99 tick uses {100*stats['p99']/args.tick:.0f}% of the tick")
+
+    failed = False
+    if active != expected:
+        print(f"[Error] The Task sequence is not {' -> '.join(expected)}.")
+        failed = True
+    for name in ('p99', 'max'):
+        if stats[name] > args.tick:
+            print(f'[Error] The {name} tick latency {stats[name]:.2f} ms exceeds the {args.tick} ms tick.')
+            failed = True
+    sys.exit(1 if failed else 0)
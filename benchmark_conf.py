@@ -0,0 +1,165 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from ssc import SNNSequenceControl
+
+
+class BaselinePopulation:
+    '''Frozen copy of the conf generation of the former NeuralPopulation: receptor and
+    connection text formatted when added and accumulated with +=.'''
+
+    def __init__(self, name, n, c, taum, restpot, resetpot, threshold):
+        self.Name = name
+        self.N = n
+        self.Capacitance = c
+        self.Taum = taum
+        self.RestingPotential = restpot
+        self.ResetPotential = resetpot
+        self.Threshold = threshold
+        self.receptorConf = ''
+        self.connectionConf = ''
+
+    def haveReceptor(self, receptor_type, tau, revpot, freqext, meanexteff, meanextconn):
+        self.receptorConf += f'Receptor: {receptor_type}\n' + \
+                             f'Tau={tau}\n' + \
+                             f'RevPot={revpot}\n' + \
+                             f'FreqExt={freqext}\n' + \
+                             f'MeanExtEff={meanexteff}\n' + \
+                             f'MeanExtCon={meanextconn}\n' + \
+                             'EndReceptor\n'
+
+    def innervate(self, target, receptor, mean_effect, weight):
+        self.connectionConf += f'TargetPopulation: {target}\n' + \
+                               f'TargetReceptor={receptor}\n' + \
+                               f'MeanEff={mean_effect}\n' + \
+                               f'weight={weight}\n' + \
+                               'EndTargetPopulation\n'
+
+    def getConf(self):
+        out = f'NeuralPopulation: {self.Name}\n' + \
+              f'N={self.N}\n' + \
+              f'C={self.Capacitance}\n' + \
+              f'Taum={self.Taum}\n' + \
+              f'RestPot={self.RestingPotential}\n' + \
+              f'ResetPot={self.ResetPotential}\n' + \
+              f'Threshold={self.Threshold}\n\n' + \
+              self.receptorConf + '\n' + \
+              self.connectionConf + '\n' + \
+              'EndNeuralPopulation\n\n'
+        return out
+
+
+def buildBaseline(snn):
+    '''BaselinePopulations and event dicts holding the network and protocol of snn, as the former FlysimSNN kept them.'''
+    populations = []
+    for population in snn.getPopulations():
+        baseline = BaselinePopulation(population.Name, population.N, population.Capacitance, population.Taum,
+                                      population.RestingPotential, population.ResetPotential, population.Threshold)
+        for receptor in population.receptors:
+            baseline.haveReceptor(receptor.type, receptor.Tau, receptor.ReversePotential, receptor.FreqExt, receptor.MeanExtEff, receptor.MeanExtCon)
+        for connection in population.targets:
+            baseline.innervate(connection.Target, connection.Receptor, connection.MeanEff, connection.Weight)
+        populations.append(baseline)
+    events = [dict(event) for event in snn.protocol.events]
+    return populations, events
+
+
+def concatenateConf(populations):
+    '''Frozen copy of the former getAllConf: the whole file grown population by population.'''
+    conf = ''
+    for population in populations:
+        conf += population.getConf()
+    return conf
+
+
+def concatenatePro(protocol, events):
+    '''Frozen copy of the former getPro: one string grown event by event.'''
+    out = ''
+    if protocol.groups:
+        out += 'DefineMacro\n\n'
+        for group_name, group_member in protocol.groups.items():
+            out += f'GroupName:{group_name}\n' + \
+                   f"GroupMembers:{','.join(group_member)}\n" + \
+                   'EndGroupMembers\n\n'
+        out += 'EndDefineMacro\n\n'
+    for event in events:
+        out += f"EventTime {event['time']}\n" + \
+               f"Type={event['type']}\n" + \
+               "Label=#1#\n" + \
+               f"Population:{event['to']}\n"
+        if event['type'] == 'ChangeExtFreq':
+            out += f"Receptor:{event['receptor']}\n" + \
+                   f"FreqExt={event['hz']}\n"
+        elif event['type'] == 'ChangeMembraneNoise':
+            out += f"GaussMean:{event['mean']}\n" + \
+                   f"GaussSTD:{event['std']}\n"
+        out += 'EndEvent\n\n'
+    out += f"EventTime {protocol.endTime}\n" + \
+           'Type=EndTrial\n' + \
+           'Label=End_of_the_trial\n' + \
+           'EndEvent\n\n'
+    if protocol.outfiles:
+        out += 'OutControl\n'
+        for outfile in protocol.outfiles:
+            out += f"FileName:{outfile['name']}\n" + \
+                   f"Type={outfile['type']}\n"
+            if outfile['type'] == 'FiringRate':
+                out += f"FiringRateWinodw={outfile['window']}\n" + \
+                       f"PrintStep={outfile['step']}\n"
+            out += f"population:{outfile['population']}\n" + \
+                   'EndOutputFile\n\n'
+        out += 'EndOutControl\n'
+    return out
+
+
+def buildNetwork(length, branch_every, pulses):
+    forks = [(pos, 9) for pos in range(0, length, branch_every)]
+    ssc = SNNSequenceControl(length, fork_pos_len_w=forks, experiment_time=pulses*20, repetition=1, filename_base='benchmark')
+    ssc.sim.protocol.periodicStimuli(0, pulses*20, 20, 5, 'spike', 'Next', 'AMPA', 250)
+    return ssc
+
+
+def timeWrite(path, write):
+    start = time.perf_counter()
+    with open(path, 'w') as stream:
+        write(stream)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time conf/pro generation of a large branched SSC.')
+    parser.add_argument('-l', '--length', type=int, default=1000, help='Number of trunk nodes')
+    parser.add_argument('-b', '--branch-every', type=int, default=10, help='Distance between branch points')
+    parser.add_argument('-p', '--pulses', type=int, default=5000, help='Number of periodic pulses, two events each')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='Fresh networks to time, the best time is reported')
+    args = parser.parse_args()
+
+    times = {'baseline conf': [], 'baseline pro': [], 'streamed conf': [], 'streamed pro': []}
+    directory = tempfile.mkdtemp(prefix='benchmark_conf_')
+    try:
+        for repeat in range(args.repeat):
+            start = time.perf_counter()
+            ssc = buildNetwork(args.length, args.branch_every, args.pulses)
+            build_time = time.perf_counter() - start
+            populations, events = buildBaseline(ssc.sim)
+            times['baseline conf'].append(timeWrite(os.path.join(directory, 'baseline.conf'), lambda stream: stream.write(concatenateConf(populations))))
+            times['baseline pro'].append(timeWrite(os.path.join(directory, 'baseline.pro'), lambda stream: stream.write(concatenatePro(ssc.sim.protocol, events))))
+            times['streamed conf'].append(timeWrite(os.path.join(directory, 'benchmark.conf'), ssc.sim.writeConf))
+            times['streamed pro'].append(timeWrite(os.path.join(directory, 'benchmark.pro'), ssc.sim.protocol.writePro))
+        print(f'{len(ssc.sim.getPopulations())} populations, {len(ssc.sim.protocol.events)} events, built in {build_time:.2f} s')
+
+        for name in ('conf', 'pro'):
+            with open(os.path.join(directory, f'baseline.{name}')) as baseline, open(os.path.join(directory, f'benchmark.{name}')) as streamed_file:
+                if baseline.read() != streamed_file.read():
+                    print(f'[Warning] The streamed {name} file differs from the baseline one.')
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    print('Best of fresh networks, the baseline receptor and connection text is formatted beforehand, as the baseline did while building:')
+    for name, values in times.items():
+        print(f'{name:14s} {min(values)*1000:8.1f} ms')
+    for name in ('conf', 'pro'):
+        if min(times[f'streamed {name}']) > min(times[f'baseline {name}']):
+            print(f'[Warning] The streamed {name} writer is slower than the baseline.')
@@ -0,0 +1,133 @@
+import argparse
+import json
+import platform
+import time
+
+import numpy as np
+
+from ssc import SNNSequenceControl
+
+CONFIGURATIONS = ('linear', 'branched', 'cos')
+
+
+def buildConfiguration(name, repetition=10):
+    '''The standard SSC setups of raster_example.py, with the attractor started at 100 ms.'''
+    if name == 'linear':
+        ssc = SNNSequenceControl(5, transitions=4, experiment_time=3000, repetition=repetition, filename_base='latency_linear')
+        ssc.setTransitionPeriod(1000, 50, 500)
+        ssc.generateTransitionStimuli('spike', 'AMPA', 250)
+    elif name == 'branched':
+        ssc = SNNSequenceControl(5, transitions=7, fork_pos_len_w=[(2, 3)], experiment_time=5000, repetition=repetition, filename_base='latency_branched')
+        ssc.setTransitionPeriod(1000, 50, 500)
+        ssc.setSwitchEvents([1700], [50])
+        ssc.generateExceptionSwitches('spike', 'AMPA', 300)
+        ssc.generateTransitionStimuli('spike', 'AMPA', 250)
+    elif name == 'cos':
+        ssc = SNNSequenceControl(5, transitions=4, task_weights=[0.5, 0.8, 1.0, 1.3, 1.5], experiment_time=3000, repetition=repetition, filename_base='latency_cos')
+        ssc.setTransitionPeriod(1000, [60, 70, 90, 120], 500)
+        ssc.generateTransitionStimuli('spike', 'AMPA', 250)
+    else:
+        raise Exception(f'Unknown configuration {name}.')
+    ssc.spawnAttractor(100, 50, 'spike', 'AMPA', 400)
+    return ssc
+
+
+def getTransitionOnsets(ssc):
+    '''Onsets (ms) of the transition stimuli and of the branch switches, in time order.'''
+    onsets = [ssc.stimulus['start'] + i*ssc.stimulus['interval'] for i in range(ssc.transitions)]
+    onsets.extend(start for start, duration, pos in ssc.stimulus['individual'])
+    return sorted(onsets)
+
+
+def getWinners(store, trial, node_offsets, total_time, window=10.0, threshold=0.5):
+    '''Node with more than threshold of the spikes of the nodes in the window ending at every ms, -1 if none.
+
+    node_offsets are the (first, last) neuron ids of the population of every node.'''
+    num_bin = int(np.ceil(total_time))
+    times, neurons = store.getTrial(trial)
+    bins = np.minimum((times * 1000.0).astype(np.int64), num_bin - 1)
+    counts = np.zeros((num_bin, len(node_offsets)), dtype=np.int64)
+    for node, (first, last) in enumerate(node_offsets):
+        mask = (neurons >= first) & (neurons < last)
+        counts[:, node] = np.bincount(bins[mask], minlength=num_bin)
+    cumulative = np.concatenate((np.zeros((1, len(node_offsets)), dtype=np.int64), np.cumsum(counts, axis=0)))
+    width = max(1, int(round(window)))
+    windowed = cumulative[1:] - cumulative[np.maximum(np.arange(1, num_bin + 1) - width, 0)]
+    ratios = windowed / np.maximum(windowed.sum(axis=1, keepdims=True), 1)
+    return np.where(ratios.max(axis=1) > threshold, ratios.argmax(axis=1), -1)
+
+
+def getTransitionLatencies(winners, onsets, total_time):
+    '''Delay (ms) from every onset until another node than the one winning at the onset wins,
+    before the next onset; NaN when no transition happened.'''
+    bounds = list(onsets[1:]) + [total_time]
+    latencies = []
+    for onset, bound in zip(onsets, bounds):
+        start = int(onset)
+        before = winners[start - 1] if start > 0 else -1
+        changed = np.flatnonzero((winners[start:int(bound)] != before) & (winners[start:int(bound)] >= 0))
+        latencies.append(float(changed[0]) if changed.size else np.nan)
+    return latencies
+
+
+def summarize(latencies):
+    latencies = np.asarray(latencies, dtype=np.float64)
+    done = latencies[~np.isnan(latencies)]
+    summary = {'count': int(latencies.size), 'failed': int(latencies.size - done.size)}
+    if done.size:
+        summary.update({'mean': float(done.mean()), 'p50': float(np.percentile(done, 50)),
+                        'p95': float(np.percentile(done, 95)), 'p99': float(np.percentile(done, 99)), 'max': float(done.max())})
+    return summary
+
+
+def benchmarkConfiguration(name, repetition=10, engine='numpy', thread=1, seed=1, window=10.0):
+    ssc = buildConfiguration(name, repetition)
+    ssc.sim.seed = seed
+    start = time.perf_counter()
+    ssc.startSimulation(thread, engine)
+    wall_time = time.perf_counter() - start
+
+    store = ssc.sim.getSpikeStore(f'{ssc.log_filename_base}_all.dat')
+    offsets = ssc.sim.getPopulationOffsets()
+    names = [population.Name for population in ssc.sim.getPopulations()]
+    total_time = ssc.stimulus['total_time']
+    onsets = getTransitionOnsets(ssc)
+    result = {'trials': repetition, 'transitions': len(onsets), 'populations': len(names), 'neurons': int(offsets[-1])}
+    for kind in ('Ordinal', 'Task'):
+        nodes = [p for p, population in enumerate(names) if population.startswith(kind) and population[len(kind):][:1].isdigit()]
+        node_offsets = [(offsets[p], offsets[p+1]) for p in nodes]
+        latencies = []
+        for trial in range(store.numTrials):
+            winners = getWinners(store, trial, node_offsets, total_time, window)
+            latencies.extend(getTransitionLatencies(winners, onsets, total_time))
+        result[kind.lower()] = summarize(latencies)
+    simulated = total_time / 1000.0 * repetition
+    result.update({'wall_time': wall_time, 'simulated_time': simulated, 'realtime_factor': simulated / wall_time,
+                   'spikes': int(len(store.times)), 'spikes_per_second': len(store.times) / wall_time,
+                   'neuron_seconds_per_second': offsets[-1] * simulated / wall_time})
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure SSC transition latencies and simulator throughput, written as JSON.')
+    parser.add_argument('-c', '--configurations', nargs='+', choices=CONFIGURATIONS, default=list(CONFIGURATIONS), help='SSC setups to run')
+    parser.add_argument('-n', '--num-trial', type=int, default=10, help='Number of trials per setup')
+    parser.add_argument('-e', '--engine', choices=['flysim', 'numpy'], default='numpy', help='Simulation engine')
+    parser.add_argument('-t', '--thread', type=int, default=1, help='Number of flysim threads')
+    parser.add_argument('-s', '--seed', type=int, default=1, help='Random seed')
+    parser.add_argument('-w', '--window', type=float, default=10.0, help='Sliding window of the bump detection (ms)')
+    parser.add_argument('-o', '--output', type=str, default='latency_benchmark.json', help='Path to the JSON report')
+    args = parser.parse_args()
+
+    report = {'engine': args.engine, 'seed': args.seed, 'window_ms': args.window, 'python': platform.python_version(),
+              'machine': platform.machine(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'configurations': {}}
+    for name in args.configurations:
+        result = benchmarkConfiguration(name, args.num_trial, args.engine, args.thread, args.seed, args.window)
+        report['configurations'][name] = result
+        for kind in ('ordinal', 'task'):
+            summary = result[kind]
+            percentiles = ', '.join(f'{key} {summary[key]:.0f} ms' for key in ('p50', 'p95', 'p99') if key in summary)
+            print(f"{name} {kind}: {percentiles} ({summary['failed']}/{summary['count']} failed)")
+        print(f"{name}: {result['wall_time']:.2f} s wall, {result['realtime_factor']:.2f}x real time, {result['spikes_per_second']:.0f} spikes/s")
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2)
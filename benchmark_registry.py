@@ -0,0 +1,198 @@
+import argparse
+import time
+import tracemalloc
+
+import networkx as nx
+
+from compiled_network import CompiledNetwork
+from flysim_format import FlysimSNN
+
+
+class BaselineSNN:
+    '''Frozen copy of the network building and conf text of the former networkx FlysimSNN.'''
+
+    def __init__(self, trial_time, iterations):
+        self.network = nx.DiGraph()
+        self.iter = iterations
+        self.id_counter = 0
+
+    def addNeuron(self, name, n=1, c=0.5, leakyC=2.5, taum=20, threshold=-50, restpot=-70, resetpot=-55, refracperiod=20, spikedly=0, selfconnect=False, layer=None):
+        conf = BaselinePopulation(name, n, c, leakyC, taum, threshold, restpot, resetpot, refracperiod, spikedly, selfconnect)
+        self.network.add_node(name, id=self.id_counter, spike_count=0, config=conf)
+        self.id_counter += 1
+        if layer:
+            self.network.nodes[name]['layer'] = layer
+
+    def addReceptor(self, neuron_name, receptpr_type, tau=10, revpot=0, freqext=0.0, meanexteff=0.0, meanextconn=1.0):
+        if self.isNeuronExist(neuron_name):
+            neuron = self.getNeuron(neuron_name)
+            neuron['config'].haveReceptor(receptpr_type, tau, revpot, freqext, meanexteff, meanextconn)
+
+    def addCoonection(self, source_name, target_name, receptor, mean_effect=0.0, weight=1.0, connectivity=1.0):
+        if self.isNeuronExist(source_name) and self.isNeuronExist(target_name):
+            self.network.add_edge(source_name, target_name)
+            neuron = self.getNeuron(source_name)
+            neuron['config'].innervate(target_name, receptor, mean_effect, weight, connectivity)
+
+    def getNeuron(self, neuron_name):
+        try:
+            return self.network.nodes[neuron_name]
+        except:
+            return None
+
+    def getAllConf(self):
+        conf = ''
+        for neuron_name, neural_population in self.network.nodes(data='config'):
+            conf += neural_population.getConf()
+        return conf
+
+    def isNeuronExist(self, neuron_name):
+        if self.getNeuron(neuron_name) == None:
+            return False
+        else:
+            return True
+
+
+class BaselinePopulation:
+    '''Frozen copy of the former NeuralPopulation: one object per receptor and target, their text appended with +=.'''
+
+    def __init__(self, name, n=1, c=0.5, leakyC=10, taum=20, threshold=-50, restpot=-70, resetpot=-55, refracperiod=20, spikedly=0, selfconnect=False):
+        self.Name = name
+        self.N = n
+        self.Capacitance = c
+        self.LeakyConductance = leakyC
+        self.Taum = taum
+        self.Threshold = threshold
+        self.RestingPotential = restpot
+        self.ResetPotential = resetpot
+        self.RefractoryPeriod = refracperiod
+        self.SpikeDelay = spikedly
+        self.SelfConnection = selfconnect
+        self.receptorConf = ''
+        self.connectionConf = ''
+
+    class Receptor:
+        types = ('AMPA', 'GABA', 'NMDA', 'Ach', 'GluCl', 'Gap', 'Sine')
+
+        def __init__(self, receptpr_type, tau, revpot, freqext, meanexteff, meanextconn):
+            if self.isReceptorType(receptpr_type):
+                self._legal = True
+            else:
+                print('[Error] Unknown receptor, skip.')
+                self._legal = False
+            self.type = receptpr_type
+            self.Tau = tau
+            self.ReversePotential = revpot
+            self.FreqExt = freqext
+            self.MeanExtEff = meanexteff
+            self.MeanExtCon = meanextconn
+
+        def isReceptorType(self, type_name):
+            return type_name in self.types
+
+        def getConf(self):
+            if self._legal:
+                out = f'Receptor: {self.type}\n' + \
+                      f'Tau={self.Tau}\n' + \
+                      f'RevPot={self.ReversePotential}\n' + \
+                      f'FreqExt={self.FreqExt}\n' + \
+                      f'MeanExtEff={self.MeanExtEff}\n' + \
+                      f'MeanExtCon={self.MeanExtCon}\n' + \
+                      'EndReceptor\n'
+            else:
+                out = ''
+            return out
+
+    class TargetPopulation:
+        def __init__(self, name, receptor, mean_effect, weight, connectivity):
+            self.Target = name
+            self.Receptor = receptor
+            self.MeanEff = mean_effect
+            self.Weight = weight
+            self.Connectivity = connectivity
+
+        def getConf(self):
+            out = f'TargetPopulation: {self.Target}\n' + \
+                  f'TargetReceptor={self.Receptor}\n' + \
+                  f'MeanEff={self.MeanEff}\n' + \
+                  f'weight={self.Weight}\n' + \
+                  'EndTargetPopulation\n'
+            return out
+
+    def haveReceptor(self, receptor_type, tau, revpot, freqext, meanexteff, meanextconn):
+        receptor = self.Receptor(receptor_type, tau, revpot, freqext, meanexteff, meanextconn)
+        self.receptorConf += receptor.getConf()
+
+    def innervate(self, target, receptor, mean_effect, weight, connectivity):
+        connection = self.TargetPopulation(target, receptor, mean_effect, weight, connectivity)
+        self.connectionConf += connection.getConf()
+
+    def getConf(self):
+        out = f'NeuralPopulation: {self.Name}\n' + \
+              f'N={self.N}\n' + \
+              f'C={self.Capacitance}\n' + \
+              f'Taum={self.Taum}\n' + \
+              f'RestPot={self.RestingPotential}\n' + \
+              f'ResetPot={self.ResetPotential}\n' + \
+              f'Threshold={self.Threshold}\n\n' + \
+              self.receptorConf + '\n' + \
+              self.connectionConf + '\n' + \
+              'EndNeuralPopulation\n\n'
+        return out
+
+
+def build(network_class, num_pop, fan_out):
+    '''A ring of num_pop populations with three receptors each, every population innervating the next fan_out ones.'''
+    snn = network_class(1000, 1)
+    for i in range(num_pop):
+        snn.addNeuron(f'Pop{i}', 50, 0.5, 25, 20, -50, -70, -55)
+        for receptor_type, tau, revpot in (('AMPA', 2, 0), ('GABA', 5, -70), ('NMDA', 100, 0)):
+            snn.addReceptor(f'Pop{i}', receptor_type, tau, revpot, 0.0, 2.1, 1.0)
+    for i in range(num_pop):
+        for j in range(1, fan_out + 1):
+            snn.addCoonection(f'Pop{i}', f'Pop{(i + j) % num_pop}', 'AMPA', 2.0, 1.0, 0.1)
+    return snn
+
+
+def measure(network_class, num_pop, fan_out, repeats):
+    '''Return (conf, build s, first getAllConf s, later getAllConf s, peak traced MB of build and conf), the best times of repeats fresh networks.'''
+    build_times, first_times, again_times = [], [], []
+    for i in range(repeats):
+        start = time.perf_counter()
+        snn = build(network_class, num_pop, fan_out)
+        built = time.perf_counter()
+        conf = snn.getAllConf()
+        first = time.perf_counter()
+        snn.getAllConf()
+        build_times.append(built - start)
+        first_times.append(first - built)
+        again_times.append(time.perf_counter() - first)
+    tracemalloc.start()
+    build(network_class, num_pop, fan_out).getAllConf()
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return conf, min(build_times), min(first_times), min(again_times), peak
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare building a network and writing its conf with the population registry and with the baseline networkx objects.')
+    parser.add_argument('-p', '--populations', type=int, nargs='+', default=[20, 1000, 10000], help='Numbers of populations')
+    parser.add_argument('-f', '--fan-out', type=int, default=3, help='Target populations of every population')
+    parser.add_argument('-r', '--repeats', type=int, default=5, help='Fresh networks per measurement, the best time is kept')
+    args = parser.parse_args()
+
+    for num_pop in args.populations:
+        for label, network_class in (('baseline', BaselineSNN), ('registry', FlysimSNN)):
+            conf, build_time, first_time, again_time, peak = measure(network_class, num_pop, args.fan_out, args.repeats)
+            total = build_time + first_time
+            print(f'{label:>8s} {num_pop:6d} populations: build {build_time*1000:9.2f} ms, first conf {first_time*1000:9.2f} ms, '
+                  f'build + conf {total*1000:9.2f} ms, conf again {again_time*1000:8.2f} ms, peak {peak:6.1f} MB')
+            if label == 'baseline':
+                baseline_conf = conf
+            elif conf != baseline_conf:
+                print('[Warning] The conf text differs from the baseline.')
+
+    snn = build(FlysimSNN, args.populations[-1], args.fan_out)
+    start = time.perf_counter()
+    compiled = CompiledNetwork(snn.registry, snn.seed)
+    print(f'registry: compiled {compiled.num_neuron} neurons, {compiled.synapses.nnz} synapses in {time.perf_counter() - start:.2f} s')
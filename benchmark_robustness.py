@@ -0,0 +1,85 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from lif_engine import LIFEngine
+from ssc import SNNSequenceControl
+
+
+def synthesizeTaskSpikes(ssc, rate=100, background=2, seed=0, silence=0.0):
+    '''Spike records of an ideal chain: the Task population of the active node fires at rate,
+    every other Task neuron at the background rate. Trials randomly stall at some transition.
+    With silence (s), the active node pauses that long in the middle of its activity, which
+    leaves a silent gap over several windows when there is no background.'''
+    rng = np.random.default_rng(seed)
+    total_time = ssc.stimulus['total_time'] / 1000
+    base_id = ssc.sim.getNeuron('Ordinal0')['id'] * ssc.population_size
+    onsets = [(ssc.stimulus['start'] + i*ssc.stimulus['interval']) / 1000 for i in range(ssc.transitions)]
+    records = []
+    for trial in range(ssc.repete):
+        stall = rng.integers(1, ssc.transitions + 2)
+        bounds = [0.0] + onsets[:stall-1] + [total_time]
+        for node in range(ssc.length):
+            for neuron in range(ssc.population_size):
+                id = base_id + 3*ssc.population_size*node + ssc.population_size + neuron
+                times = rng.uniform(0, total_time, rng.poisson(background*total_time))
+                if node < len(bounds) - 1:
+                    t0, t1 = bounds[node], bounds[node+1]
+                    active = rng.uniform(t0, t1, rng.poisson(rate*(t1-t0)))
+                    pause = (t0 + t1 - silence) / 2
+                    times = np.concatenate((times, active[(active < pause) | (active >= pause + silence)]))
+                trial_records = np.zeros(times.size, dtype=LIFEngine.record_dtype)
+                trial_records['trial'] = trial
+                trial_records['time'] = np.round(times, 4)
+                trial_records['neuron'] = id
+                records.append(trial_records)
+    records = np.concatenate(records)
+    return records[np.lexsort((records['time'], records['trial']))]
+
+
+def checkSparseRasters(num_trial=20):
+    '''Compare the loop and the vectorized calculateRobustness on dense rasters, sparse ones with
+    silent windows and ones with gaps over several windows. Return whether they agree on all.'''
+    cases = [('dense', 100, 2, 0.0), ('sparse', 5, 0, 0.0), ('very sparse', 2, 0, 0.0), ('multi-window gaps', 10, 0, 0.15)]
+    agree = True
+    for name, rate, background, silence in cases:
+        ssc = SNNSequenceControl(6, transitions=5, experiment_time=4000, repetition=num_trial)
+        ssc.setTransitionPeriod(500, 50, 500)
+        ssc.sim.outputs[f'{ssc.log_filename_base}_task.dat'] = synthesizeTaskSpikes(ssc, rate, background, seed=1, silence=silence)
+        vectorized = ssc.calculateRobustness()
+        legacy = ssc.calculateRobustnessLegacy()
+        agree = agree and legacy == vectorized
+        print(f'{name:>18s}: loop {legacy}, vectorized {vectorized}')
+    return agree
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the loop and the vectorized calculateRobustness.')
+    parser.add_argument('-l', '--length', type=int, default=20, help='Number of nodes')
+    parser.add_argument('-n', '--num-trial', type=int, default=100, help='Number of trials')
+    parser.add_argument('--check', action='store_true', help='Only compare both on sparse rasters, exit with 1 if they differ')
+    args = parser.parse_args()
+
+    if args.check:
+        if not checkSparseRasters():
+            print('[Error] The vectorized counts differ from the loop.')
+            sys.exit(1)
+        sys.exit(0)
+
+    ssc = SNNSequenceControl(args.length, transitions=args.length-1, experiment_time=10000, repetition=args.num_trial)
+    ssc.setTransitionPeriod(500, 50, 500)
+    ssc.sim.outputs[f'{ssc.log_filename_base}_task.dat'] = synthesizeTaskSpikes(ssc)
+    print(f"{len(ssc.sim.outputs[f'{ssc.log_filename_base}_task.dat'])} spikes, {args.num_trial} trials, {args.length} nodes")
+
+    start = time.perf_counter()
+    legacy = ssc.calculateRobustnessLegacy()
+    legacy_time = time.perf_counter() - start
+    start = time.perf_counter()
+    vectorized = ssc.calculateRobustness()
+    vectorized_time = time.perf_counter() - start
+
+    print(f'loop:       {legacy_time:.3f} s {legacy}')
+    print(f'vectorized: {vectorized_time:.3f} s {vectorized}')
+    print(f'speed-up:   {legacy_time/vectorized_time:.1f}x, identical: {legacy == vectorized}')
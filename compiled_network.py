@@ -0,0 +1,176 @@
+import numpy as np
+
+
+class SparseMatrix:
+    '''Compressed sparse row matrix in plain numpy arrays, row i holds indices[indptr[i]:indptr[i+1]].'''
+
+    def __init__(self, indptr, indices, data, shape):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.shape = shape
+
+    @classmethod
+    def fromEntries(cls, rows, columns, data, shape):
+        order = np.argsort(rows, kind='stable')
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=shape[0])))).astype(np.int64)
+        return cls(indptr, columns[order].astype(np.int64), data[order].astype(np.float64), shape)
+
+    @property
+    def nnz(self):
+        return len(self.indices)
+
+    def gather(self, rows):
+        '''Return (position in rows, column, value) of all entries of the given rows.'''
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 1:
+            # One row, e.g. the only neuron firing in a time step of a small network: slice it.
+            start, end = self.indptr[rows[0]], self.indptr[rows[0] + 1]
+            return np.zeros(end - start, dtype=np.int64), self.indices[start:end], self.data[start:end]
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        position = np.repeat(np.arange(len(rows)), lengths)
+        entry = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths - starts, lengths)
+        return position, self.indices[entry], self.data[entry]
+
+    def dot(self, vector):
+        '''Return vector @ matrix, e.g. the input every neuron receives from a spike count vector.'''
+        rows = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+        return np.bincount(self.indices, weights=self.data * vector[rows], minlength=self.shape[1])
+
+    def toDense(self):
+        dense = np.zeros(self.shape)
+        np.add.at(dense, (np.repeat(np.arange(self.shape[0]), np.diff(self.indptr)), self.indices), self.data)
+        return dense
+
+
+class CompiledNetwork:
+    '''Array form of a FlysimSNN, shared by the in-process engines and analyses.
+
+    Neuron parameters are per-neuron columns, receptor parameters (receptor type, population)
+    arrays and the synapses one CSR matrix over source neurons whose column r*N + n is
+    receptor r of neuron n. Each target population entry connects every source neuron to
+    every target neuron with probability Connectivity, sampled once per compilation, with
+    the conductance increment MeanEff*weight. Build it with FlysimSNN.compile().'''
+
+    conductance_types = ('AMPA', 'GABA', 'NMDA', 'Ach', 'GluCl')
+    receptor_arrays = {'Tau': 'tau', 'ReversePotential': 'revpot', 'FreqExt': 'init_freq_ext', 'MeanExtEff': 'ext_eff', 'MeanExtCon': 'ext_conn'}
+
+    def __init__(self, registry, seed=None):
+        self.names = list(registry.names)
+        self.pop_index = dict(registry.index)
+        self.seed = seed
+        self.version = registry.version
+        self.buildNeurons(registry)
+        self.buildReceptors(registry)
+        self.buildSynapses(registry, np.random.default_rng(seed))
+
+    def buildNeurons(self, registry):
+        populations = registry.populations
+        self.sizes = populations.column('N').astype(np.int64)
+        self.num_pop = len(registry)
+        self.num_neuron = int(self.sizes.sum())
+        self.offsets = np.concatenate(([0], np.cumsum(self.sizes))).astype(np.int64)
+        self.pop_of_neuron = np.repeat(np.arange(self.num_pop), self.sizes)
+        self.capacitance = populations.column('Capacitance')[self.pop_of_neuron]
+        self.taum = populations.column('Taum')[self.pop_of_neuron]
+        self.threshold = populations.column('Threshold')[self.pop_of_neuron]
+        self.restpot = populations.column('RestingPotential')[self.pop_of_neuron]
+        self.resetpot = populations.column('ResetPotential')[self.pop_of_neuron]
+        self.refracperiod = populations.column('RefractoryPeriod')[self.pop_of_neuron]
+
+    def buildReceptors(self, registry):
+        receptors = registry.receptors
+        rows, _ = registry.groupRows(receptors, 'population')
+        codes = receptors.column('type').astype(np.int64)[rows]
+        types = []
+        for code in codes:
+            receptor_type = registry.type_names[code]
+            if receptor_type not in self.conductance_types:
+                print(f'[Warning] {receptor_type} receptor is not supported by the numpy engine, skip.')
+            elif receptor_type not in types:
+                types.append(receptor_type)
+        self.receptor_types = types
+        self.receptor_index = {receptor_type: r for r, receptor_type in enumerate(types)}
+        # Receptor row of every registry type code, -1 for the unsupported ones.
+        self.receptor_of_code = np.array([self.receptor_index.get(name, -1) for name in registry.type_names], dtype=np.int64)
+        shape = (len(types), self.num_pop)
+        self.tau = np.ones(shape)
+        self.revpot = np.zeros(shape)
+        self.has_receptor = np.zeros(shape, dtype=bool)
+        self.init_freq_ext = np.zeros(shape)
+        self.ext_eff = np.zeros(shape)
+        self.ext_conn = np.zeros(shape)
+        r = self.receptor_of_code[codes] if codes.size else np.zeros(0, dtype=np.int64)
+        keep = r >= 0
+        r, rows = r[keep], rows[keep]
+        p = receptors.column('population').astype(np.int64)[rows]
+        # Later duplicates of a receptor overwrite the earlier ones, as assignment in row order does.
+        self.has_receptor[r, p] = True
+        for field, array in self.receptor_arrays.items():
+            getattr(self, array)[r, p] = receptors.column(field)[rows]
+        self.is_nmda = np.array([receptor_type == 'NMDA' for receptor_type in types], dtype=bool)
+
+    def buildSynapses(self, registry, rng):
+        targets = registry.targets
+        entries, _ = registry.groupRows(targets, 'source')
+        sources = targets.column('source').astype(np.int64)[entries]
+        destinations = targets.column('target').astype(np.int64)[entries]
+        receptors = self.receptor_of_code[targets.column('receptor').astype(np.int64)[entries]] if entries.size else np.zeros(0, dtype=np.int64)
+        connectivity = targets.column('Connectivity')[entries]
+        increments = (targets.column('MeanEff') * targets.column('Weight'))[entries]
+        valid = (receptors >= 0) & (connectivity > 0)
+        valid[valid] = self.has_receptor[receptors[valid], destinations[valid]]
+        rows, columns, data, entry_rows = [], [], [], []
+        for entry, source, t, r, p, increment in zip(entries[valid], sources[valid], destinations[valid], receptors[valid], connectivity[valid], increments[valid]):
+            num_source, num_target = self.sizes[source], self.sizes[t]
+            if p >= 1:
+                pre, post = np.divmod(np.arange(num_source * num_target), num_target)
+            else:
+                pre, post = np.nonzero(rng.random((num_source, num_target)) < p)
+            rows.append(pre + self.offsets[source])
+            columns.append(r * self.num_neuron + post + self.offsets[t])
+            data.append(np.full(pre.size, increment, dtype=np.float64))
+            entry_rows.append(np.full(pre.size, entry, dtype=np.int32))
+        empty = np.zeros(0, dtype=np.int64)
+        rows = np.concatenate(rows) if rows else empty
+        columns = np.concatenate(columns) if columns else empty
+        data = np.concatenate(data) if data else np.zeros(0)
+        entry_rows = np.concatenate(entry_rows) if entry_rows else np.zeros(0, dtype=np.int32)
+        self.synapses = SparseMatrix.fromEntries(rows, columns, data, (self.num_neuron, len(self.receptor_types) * self.num_neuron))
+        # Registry target row of every synapse, in the order of the CSR entries.
+        self.synapse_rows = entry_rows[np.argsort(rows, kind='stable')]
+
+    def patchReceptors(self, registry, rows):
+        '''Copy the parameters of registry receptor rows into the receptor arrays after they changed.'''
+        receptors = registry.receptors
+        for row in rows:
+            r = self.receptor_of_code[receptors.get('type', row)]
+            if r < 0:
+                continue
+            p = receptors.get('population', row)
+            for field, array in self.receptor_arrays.items():
+                getattr(self, array)[r, p] = receptors.get(field, row)
+        self.version = registry.version
+
+    def patchSynapses(self, registry, entries):
+        '''Recompute the increments MeanEff*weight of the given synapse entries after their target rows changed.
+        Changes of Connectivity need a new compilation.'''
+        targets = registry.targets
+        increments = targets.column('MeanEff') * targets.column('Weight')
+        self.synapses.data[entries] = increments[self.synapse_rows[entries]]
+        self.version = registry.version
+
+    def getMatrix(self, receptor_type):
+        '''Return the (source neuron, target neuron) CSR weight matrix of one receptor type.'''
+        r = self.receptor_index[receptor_type]
+        rows = np.repeat(np.arange(self.num_neuron), np.diff(self.synapses.indptr))
+        keep = self.synapses.indices // self.num_neuron == r
+        return SparseMatrix.fromEntries(rows[keep], self.synapses.indices[keep] - r * self.num_neuron,
+                                        self.synapses.data[keep], (self.num_neuron, self.num_neuron))
+
+    def getInput(self, neurons):
+        '''Return (position in neurons, receptor, target neuron, increment) of the synapses of the given source neurons.'''
+        position, column, weight = self.synapses.gather(neurons)
+        receptor, target = np.divmod(column, self.num_neuron)
+        return position, receptor, target, weight
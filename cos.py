@@ -1,33 +1,72 @@
 import argparse
+from functools import partial
 
 from matplotlib import colors
 import matplotlib.pyplot as plt
 import matplotlib.cm as cm
 import numpy as np
 
+from adaptive_search import controlledRobustness
+from job_queue import SweepQueue, runQueuedSweep
+from network_template import NetworkTemplate, runTemplateSweep
 from ssc import SNNSequenceControl
+from sweep import robustness, runSweep
+
+
+def buildCell(duration, strength, weight):
+    ssc = SNNSequenceControl(3, transitions=2, task_weights=[weight, weight, weight], experiment_time=2000, repetition=10)
+    ssc.setTransitionPeriod(300, duration, 700)
+    ssc.generateTransitionStimuli('spike', 'AMPA', strength)
+    ssc.spawnAttractor(100, 50, 'spike', 'AMPA', 400)
+    return ssc
+
+def buildTemplate():
+    '''buildCell with the stimulus duration, strength and task weight as template parameters.'''
+    ssc = buildCell(50, 0, 0.0)
+    template = NetworkTemplate(ssc)
+    onsets, offsets = zip(*ssc.transition_events)
+    template.declareEvents('strength', onsets, 'hz')
+    template.declareEvents('duration', offsets, 'time', [onset['time'] for onset in onsets])
+    template.declareConnection('weight', [f'Task{i}' for i in range(ssc.length)], 'TaskTarget')
+    return template
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-w', '--workers', type=int, default=None, help='Number of parallel jobs, all cores by default')
+    parser.add_argument('-e', '--engine', choices=['flysim', 'numpy'], default='flysim', help='Simulation engine')
+    parser.add_argument('--tolerance', type=float, help='Add batches of 10 trials to a cell until its success rates are known within this half width')
+    parser.add_argument('--max-trials', type=int, default=100, help='Trials per cell at most with --tolerance')
+    parser.add_argument('--db', type=str, help='SQLite job queue keeping the cell results, finished cells are skipped on a restart')
+    parser.add_argument('--plot-only', action='store_true', help='Plot the results stored in --db without simulating')
+    parser.add_argument('--template', action='store_true', help='Build the network once per worker and patch its parameters for every cell')
+    args = parser.parse_args()
 
-    for duration in [50, 100, 150, 200, 300, 500]:
-        results1 = []
-        results2 = []
-        #for weight in np.logspace(0.1, 10, 10):
-        for strength in range(0, 900, 50):
-            row1 = []
-            row2 = []
-            for weight in np.arange(0.0, 0.5, 0.01):
-                ssc = SNNSequenceControl(3, transitions=2, task_weights=[weight, weight, weight], experiment_time=2000, repetition=10)
-                ssc.setTransitionPeriod(300, duration, 700)
-                ssc.generateTransitionStimuli('spike', 'AMPA', strength)
-                ssc.spawnAttractor(100, 50, 'spike', 'AMPA', 400)
-                ssc.startSimulation()
-                x0, x1, x2 = ssc.calculateRobustness()
-                row1.append(x1/10)
-                row2.append(x2/10)
-                #ssc.plotRaster()
-            results1.insert(0, row1)
-            results2.insert(0, row2)
+    duration_list = [50, 100, 150, 200, 300, 500]
+    #for weight in np.logspace(0.1, 10, 10):
+    grid = {'duration': duration_list, 'strength': range(0, 900, 50), 'weight': np.arange(0.0, 0.5, 0.01)}
+    if args.tolerance:
+        name = 'cos_adaptive'
+        evaluate = partial(controlledRobustness, engine=args.engine, max_trials=args.max_trials, tolerance=args.tolerance)
+    else:
+        name = 'cos'
+        evaluate = robustness
+    if args.plot_only:
+        if not args.db:
+            raise Exception('--plot-only needs the --db of the sweep.')
+        sweep = SweepQueue(args.db).getSweepResult(name)
+    elif args.db:
+        sweep = runQueuedSweep(args.db, name, grid, buildCell, evaluate, workers=args.workers, engine=args.engine)
+    elif args.template:
+        sweep = runTemplateSweep(grid, buildTemplate, evaluate, workers=args.workers, engine=args.engine)
+    else:
+        sweep = runSweep(grid, buildCell, evaluate, workers=args.workers, engine=args.engine)
+    if args.tolerance:
+        # controlledRobustness gives rates, scale them like the counts of 10 trials.
+        sweep.values = sweep.values*10
+    for duration in duration_list:
+        scan = sweep.select(duration=duration)
+        results1 = scan.heatmap(1)/10
+        results2 = scan.heatmap(2)/10
 
         fig, axs = plt.subplots(1, 2)
         images = []
@@ -0,0 +1,229 @@
+import heapq
+
+import numpy as np
+
+from lif_engine import LIFEngine
+
+
+class EventEngine(LIFEngine):
+    '''Event-driven engine for mostly quiet networks, run directly: EventEngine(snn).run(iterations)
+    returns the outputs like LIFEngine.run.
+
+    A priority queue holds protocol events, external Poisson arrivals and the predicted next
+    spike of every population. Only the populations touched by an event are integrated,
+    from their last update: the conductances decay exponentially in closed form and the
+    membrane equation is solved with the exponential Euler rule on a grid, which stays
+    stable for strong conductances (the NMDA Mg block is frozen at the last update). The
+    next spike of every neuron is found on a grid over a horizon and interpolated linearly;
+    populations still driven at the end of the horizon are predicted again then.
+    The cost thus grows with the number of spikes and input events, not neurons x steps.
+    Every event costs tens of numpy calls on one population, so it only beats the batched
+    numpy engine when few neurons fire. It is not an engine of FlysimSNN.start: the SSC
+    attractors fire at hundreds of Hz and run several times slower than with the numpy
+    engine. GaussSTD of the membrane noise and run callbacks are not supported and raise.'''
+
+    version = '3'
+    horizon = 5.0
+    resolution = 0.25
+    grid_points = 20
+
+    PROTOCOL, EXTERNAL, PREDICTION = 0, 1, 2
+
+    def __init__(self, snn, seed=None):
+        super().__init__(snn, seed=seed)
+        first = self.offsets[:-1]
+        self.pop_capacitance = self.capacitance[first]
+        self.pop_taum = self.taum[first]
+        self.pop_threshold = self.threshold[first]
+        self.pop_restpot = self.restpot[first]
+        self.pop_resetpot = self.resetpot[first]
+        self.pop_refracperiod = self.refracperiod[first]
+        self.sizes = np.diff(self.offsets)
+        self.grids = [np.linspace(0.0, 1.0, points + 1)[:, None] for points in range(self.grid_points + 1)]
+        if any(event['type'] == 'ChangeMembraneNoise' and event['std'] for event in self.events):
+            raise Exception('The event-driven engine does not model GaussSTD of the membrane noise, use the numpy engine.')
+
+    def resetTrial(self, rng):
+        self.rng = rng
+        self.queue = []
+        self.sequence = 0
+        self.freq_ext = self.init_freq_ext.copy()
+        self.noise_mean = np.zeros(self.num_pop)
+        self.t_last = np.zeros(self.num_pop)
+        self.v = [np.full(n, self.pop_restpot[p]) for p, n in enumerate(self.sizes)]
+        self.g = [np.zeros((len(self.receptor_types), n)) for n in self.sizes]
+        self.refractory_end = [np.full(n, -np.inf) for n in self.sizes]
+        self.prediction = [np.full(n, np.inf) for n in self.sizes]
+        self.prediction_version = np.zeros(self.num_pop, dtype=np.int64)
+        self.external_version = np.zeros(self.num_pop, dtype=np.int64)
+        self.spike_times, self.spike_neurons = [], []
+
+    def push(self, t, kind, p, r=0, version=0):
+        self.sequence += 1
+        heapq.heappush(self.queue, (t, self.sequence, kind, p, r, version))
+
+    def linearize(self, p):
+        '''Coefficients of the membrane equation of population p from its last update, or from the end of refractoriness.'''
+        start = np.maximum(self.refractory_end[p] - self.t_last[p], 0.0)
+        v = np.where(start > 0, self.pop_resetpot[p], self.v[p])
+        active = np.flatnonzero(self.g[p].any(axis=1))
+        g = self.g[p][active] * np.exp(-start / self.tau[active, p, None])
+        nmda = self.is_nmda[active]
+        if nmda.any():
+            g[nmda] /= 1.0 + np.exp(-0.062 * v) / 3.57
+        rate = g / (1000.0 * self.pop_capacitance[p])
+        rest = self.pop_restpot[p] + self.noise_mean[p] * self.pop_taum[p] / (1000.0 * self.pop_capacitance[p])
+        return start, v, active, rate, rest
+
+    def potential(self, p, linear, x):
+        '''Membrane potential of population p on grids x (points, neurons) starting at 0 after refractoriness.
+
+        With the conductances decaying exponentially the decay exponent A(x) is exact; the
+        input integral is summed with the exponential Euler rule over the grid intervals.'''
+        start, v, active, rate, rest = linear
+        tau = self.tau[active, p, None, None]
+        rate = rate[:, None, :]
+        exponent = x / self.pop_taum[p] + (rate * tau * -np.expm1(-x / tau)).sum(axis=0)
+        middle = np.exp(-(x[1:] + x[:-1]) / (2 * tau))
+        drive = rest / self.pop_taum[p] + (rate * self.revpot[active, p, None, None] * middle).sum(axis=0)
+        step = exponent[1:] - exponent[:-1]
+        weight = drive * (x[1:] - x[:-1]) * np.where(step > 1e-9, -np.expm1(-step) / np.maximum(step, 1e-9), 1.0)
+        if exponent[-1].max(initial=0.0) < 500:
+            total = np.cumsum(weight * np.exp(exponent[1:]), axis=0)
+            return np.concatenate(([v], (v + total) * np.exp(-exponent[1:])))
+        # Strong conductances, run the same rule as a recursion to stay in the float range.
+        potential = np.empty_like(x)
+        potential[0] = v
+        for k in range(len(step)):
+            potential[k+1] = potential[k] * np.exp(-step[k]) + weight[k]
+        return potential
+
+    def advance(self, p, t):
+        u = t - self.t_last[p]
+        if u <= 0:
+            return
+        linear = self.linearize(p)
+        start = linear[0]
+        points = min(int(np.ceil(u / self.resolution)), self.grid_points)
+        x = self.grids[points] * np.maximum(u - start, 0.0)
+        v = self.potential(p, linear, x)[-1]
+        self.v[p] = np.where(u > start, v, self.pop_resetpot[p])
+        self.g[p] *= np.exp(-u / self.tau[:, p, None])
+        self.t_last[p] = t
+
+    def predict(self, p, t):
+        '''Predict the next threshold crossings of population p, which was just advanced to t.'''
+        linear = self.linearize(p)
+        start, v, active, rate, rest = linear
+        self.prediction_version[p] += 1
+        # The potential stays between the start value, the rest and the reversal potentials
+        # of the active receptors, an inhibited or quiet population cannot fire.
+        ceiling = max(v.max(), rest, self.revpot[active, p].max(initial=-np.inf))
+        if ceiling < self.pop_threshold[p]:
+            self.prediction[p][:] = np.inf
+            return
+        n = self.sizes[p]
+        x = np.repeat(self.grids[self.grid_points] * self.horizon, n, axis=1)
+        potential = self.potential(p, linear, x)
+        above = potential >= self.pop_threshold[p]
+        crossed = above.any(axis=0)
+        first = above.argmax(axis=0)
+        previous = np.maximum(first - 1, 0)
+        columns = np.arange(n)
+        low, high = potential[previous, columns], potential[first, columns]
+        fraction = np.where(first > 0, (self.pop_threshold[p] - low) / np.maximum(high - low, 1e-12), 0.0)
+        crossing = x[previous, columns] + fraction * (x[first, columns] - x[previous, columns])
+        self.prediction[p] = np.where(crossed, t + start + crossing, np.inf)
+        driven = (rate * self.tau[active, p, None]).sum(axis=0).max(initial=0.0) > 1e-3 or rest >= self.pop_threshold[p] or (start > 0).any()
+        if crossed.any():
+            self.push(self.prediction[p].min(), self.PREDICTION, p, version=self.prediction_version[p])
+        elif driven:
+            self.push(t + self.horizon, self.PREDICTION, p, version=self.prediction_version[p])
+
+    def scheduleExternal(self, p, t):
+        self.external_version[p] += 1
+        rates = self.freq_ext[:, p] * self.ext_conn[:, p] * self.sizes[p] * self.has_receptor[:, p]
+        for r in np.flatnonzero(rates * self.ext_eff[:, p]):
+            self.push(t + self.rng.exponential(1000.0 / rates[r]), self.EXTERNAL, p, r, self.external_version[p])
+
+    def pushProtocol(self, index):
+        '''Queue only the next protocol event. Its sequence number is below those of all other
+        entries, so it comes first among entries of the same time as if queued at the start.'''
+        heapq.heappush(self.queue, (self.events[index]['time'], index - len(self.events), self.PROTOCOL, index, 0, 0))
+
+    def handleProtocol(self, t, index):
+        if index + 1 < len(self.events):
+            self.pushProtocol(index + 1)
+        event = self.events[index]
+        targets = self.resolveTargets(event['to'])
+        for p in targets:
+            self.advance(p, t)
+        self.applyEvent(event)
+        for p in targets:
+            self.scheduleExternal(p, t)
+            self.predict(p, t)
+
+    def handleExternal(self, t, p, r, version):
+        if version != self.external_version[p]:
+            return
+        self.advance(p, t)
+        self.g[p][r, self.rng.integers(self.sizes[p])] += self.ext_eff[r, p]
+        self.predict(p, t)
+        rate = self.freq_ext[r, p] * self.ext_conn[r, p] * self.sizes[p]
+        self.push(t + self.rng.exponential(1000.0 / rate), self.EXTERNAL, p, r, version)
+
+    def handlePrediction(self, t, p, version):
+        if version != self.prediction_version[p]:
+            return
+        self.advance(p, t)
+        fired = np.flatnonzero(self.prediction[p] <= t + 1e-9)
+        if fired.size:
+            self.spike_times.append(np.full(fired.size, t))
+            self.spike_neurons.append(fired + self.offsets[p])
+            self.v[p][fired] = self.pop_resetpot[p]
+            self.refractory_end[p][fired] = t + self.pop_refracperiod[p]
+            position, receptor, target, weight = self.network.getInput(fired + self.offsets[p])
+            target_pop = self.pop_of_neuron[target]
+            for q in np.unique(target_pop):
+                synapse = target_pop == q
+                if q != p:
+                    self.advance(q, t)
+                np.add.at(self.g[q], (receptor[synapse], target[synapse] - self.offsets[q]), weight[synapse])
+                if q != p:
+                    self.predict(q, t)
+        self.predict(p, t)
+
+    def runTrial(self, trial, rng):
+        self.resetTrial(rng)
+        if self.events:
+            self.pushProtocol(0)
+        for p in range(self.num_pop):
+            self.scheduleExternal(p, 0.0)
+            self.predict(p, 0.0)
+        while self.queue and self.queue[0][0] < self.protocol.endTime:
+            t, sequence, kind, p, r, version = heapq.heappop(self.queue)
+            self.events_processed += 1
+            if kind == self.PROTOCOL:
+                self.handleProtocol(t, p)
+            elif kind == self.EXTERNAL:
+                self.handleExternal(t, p, r, version)
+            else:
+                self.handlePrediction(t, p, version)
+        return self.buildTrialRecords(trial)
+
+    def buildTrialRecords(self, trial):
+        times, neurons = self.spike_times, self.spike_neurons
+        records = np.zeros(sum(n.size for n in neurons), dtype=self.record_dtype)
+        records['trial'] = trial
+        if neurons:
+            records['time'] = np.concatenate(times) / 1000.0
+            records['neuron'] = np.concatenate(neurons)
+        return records
+
+    def runTrials(self, trials=1, callback=None, callback_interval=10.0):
+        '''Simulate the trials one after another, each with its own generator spawned from the seed.'''
+        if callback is not None:
+            raise Exception('The event-driven engine does not support callbacks, use the numpy engine.')
+        rngs = [np.random.default_rng(seed) for seed in np.random.SeedSequence(self.seed).spawn(trials)]
+        records = [self.runTrial(trial, rng) for trial, rng in enumerate(rngs)]
+        return np.concatenate(records) if records else np.zeros(0, dtype=self.record_dtype)
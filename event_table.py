@@ -0,0 +1,242 @@
+import numpy as np
+
+from population_registry import ColumnTable
+
+
+class EventTable:
+    '''Columnar storage of the events of a StimulationProtocol.
+
+    Every event is a row of time, type, target, receptor, value (FreqExt or GaussMean) and
+    std (GaussSTD); targets and receptors are stored as codes of name lists. Rows stay in
+    insertion order, which the pro file keeps; getOrder gives the stable time order used by
+    the engines and the range queries, rebuilt after changes. A row takes about 54 bytes against some 600 of the dict
+    per event it replaces.'''
+
+    columns = ('time', 'type', 'target', 'receptor', 'value', 'std')
+    types = ('ChangeExtFreq', 'ChangeMembraneNoise')
+    # Event dict keys of every type and the columns holding them.
+    fields = {'ChangeExtFreq': {'hz': 'value'}, 'ChangeMembraneNoise': {'mean': 'value', 'std': 'std'}}
+
+    def __init__(self):
+        self.table = ColumnTable(self.columns)
+        self.target_names = []
+        self.target_codes = {}
+        self.receptor_names = []
+        self.receptor_codes = {}
+        self.version = 0
+        self.order_version = -1
+        self.order = np.zeros(0, dtype=np.int64)
+        self.times = np.zeros(0)
+
+    def __len__(self):
+        return len(self.table)
+
+    def getCode(self, names, codes, name):
+        if name not in codes:
+            codes[name] = len(names)
+            names.append(name)
+        return codes[name]
+
+    def add(self, time, type, to, receptor=None, value=0.0, std=0.0):
+        '''Append one event and return its row.'''
+        self.version += 1
+        receptor = -1 if receptor is None else self.getCode(self.receptor_names, self.receptor_codes, receptor)
+        return self.table.append(time, self.types.index(type), self.getCode(self.target_names, self.target_codes, to), receptor, value, std)
+
+    def addTrain(self, onsets, offsets, type, to, receptor=None, value=0.0, std=0.0, off_value=0.0, off_std=0.0):
+        '''Append an on event at every onset and an off event at every offset in one block,
+        in the order on, off, on, off... that single adds would give.'''
+        onsets, offsets = np.asarray(onsets), np.asarray(offsets)
+        count = 2 * len(onsets)
+        if not count:
+            return
+        self.version += 1
+        receptor = -1 if receptor is None else self.getCode(self.receptor_names, self.receptor_codes, receptor)
+        isInt = lambda value: isinstance(value, (int, np.integer))
+        times = np.empty(count)
+        times[0::2], times[1::2] = onsets, offsets
+        time_integral = np.empty(count, dtype=bool)
+        time_integral[0::2], time_integral[1::2] = onsets.dtype.kind in 'iu', offsets.dtype.kind in 'iu'
+        values = np.tile([value, off_value], len(onsets))
+        value_integral = np.tile([isInt(value), isInt(off_value)], len(onsets))
+        stds = np.tile([std, off_std], len(onsets))
+        std_integral = np.tile([isInt(std), isInt(off_std)], len(onsets))
+        self.table.extend({'time': times, 'type': self.types.index(type), 'target': self.getCode(self.target_names, self.target_codes, to),
+                           'receptor': receptor, 'value': values, 'std': stds},
+                          {'time': time_integral, 'type': True, 'target': True, 'receptor': True, 'value': value_integral, 'std': std_integral})
+
+    def set(self, name, row, value):
+        self.version += 1
+        self.table.set(name, row, value)
+
+    def getOrder(self):
+        '''Rows in time order, events at the same time in insertion order.'''
+        if self.order_version != self.version:
+            times = self.table.column('time')
+            self.order = np.argsort(times, kind='stable')
+            self.times = times[self.order]
+            self.order_version = self.version
+        return self.order
+
+    def getTimes(self):
+        '''Event times in time order.'''
+        self.getOrder()
+        return self.times
+
+    def getNext(self, t):
+        '''Position in time order of the first event at or after t ms, len(self) when there is none. O(log n).'''
+        return int(np.searchsorted(self.getTimes(), t, side='left'))
+
+    def getRange(self, t0, t1, to=None, type=None):
+        '''Rows, in time order, of the events in [t0, t1) ms, optionally only those of target to and of one type.'''
+        order = self.getOrder()
+        first, last = np.searchsorted(self.times, [t0, t1], side='left')
+        rows = order[first:last]
+        if to is not None:
+            rows = rows[self.table.column('target')[rows] == self.target_codes.get(to, -1)]
+        if type is not None:
+            rows = rows[self.table.column('type')[rows] == self.types.index(type)]
+        return rows
+
+    def getEvent(self, row):
+        return EventView(self, row)
+
+    def getEvents(self, rows=None):
+        '''Plain event dicts of the rows, all events in time order by default, e.g. for the engines.'''
+        rows = self.getOrder() if rows is None else rows
+        columns = {name: self.table.getValues(name) for name in self.columns}
+        events = []
+        for row in np.asarray(rows).tolist():
+            type = self.types[columns['type'][row]]
+            event = {'time': columns['time'][row], 'type': type, 'to': self.target_names[columns['target'][row]]}
+            if columns['receptor'][row] >= 0:
+                event['receptor'] = self.receptor_names[columns['receptor'][row]]
+            for key, column in self.fields[type].items():
+                event[key] = columns[column][row]
+            events.append(event)
+        return events
+
+    def mergeRedundant(self, groups=None):
+        '''Remove the events that do not change anything and return how many were removed:
+        events overwritten by a later event of the same target, type and receptor at the
+        same time, such as the off event of a pulse followed right away by the next on
+        event, and events setting the value the previous event already set.
+
+        Targets overlapping others through groups are left alone, as are the first events
+        of every target since the initial values live in the conf. Rows change, so event
+        views taken before, e.g. of a NetworkTemplate, become invalid.'''
+        groups = groups if groups is not None else {}
+        if not len(self):
+            return 0
+        order = self.getOrder()
+        type, target, receptor = (self.table.column(name)[order].astype(np.int64) for name in ('type', 'target', 'receptor'))
+        value, std, times = self.table.column('value')[order], self.table.column('std')[order], self.times
+        members = [set(groups.get(name, [name])) for name in self.target_names]
+        overlapping = [any(i != j and members[i] & members[j] for j in range(len(members))) for i in range(len(members))]
+        channel = (type * len(self.target_names) + target) * (len(self.receptor_names) + 1) + receptor + 1
+        by_channel = np.lexsort((np.arange(len(order)), channel))
+        keep = np.ones(len(order), dtype=bool)
+        previous = None
+        for k, position in enumerate(by_channel.tolist()):
+            next_position = by_channel[k+1] if k + 1 < len(by_channel) else None
+            same_channel = next_position is not None and channel[next_position] == channel[position]
+            if overlapping[target[position]]:
+                continue
+            if same_channel and times[next_position] == times[position]:
+                keep[position] = False
+                continue
+            if previous is not None and channel[previous] == channel[position] and value[previous] == value[position] and std[previous] == std[position]:
+                keep[position] = False
+                continue
+            previous = position
+        removed = int(np.count_nonzero(~keep))
+        if removed:
+            self.version += 1
+            self.table.take(np.sort(order[keep]))
+        return removed
+
+
+class EventView:
+    '''Dict-like view of one event of an EventTable, writes go to its columns.'''
+    __slots__ = ('table', 'row')
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    @property
+    def type(self):
+        return self.table.types[int(self.table.table.get('type', self.row))]
+
+    def keys(self):
+        keys = ['time', 'type', 'to']
+        if self.table.table.get('receptor', self.row) >= 0:
+            keys.append('receptor')
+        return keys + list(self.table.fields[self.type])
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __getitem__(self, key):
+        table = self.table
+        if key == 'time':
+            return table.table.get('time', self.row)
+        elif key == 'type':
+            return self.type
+        elif key == 'to':
+            return table.target_names[table.table.get('target', self.row)]
+        elif key == 'receptor' and table.table.get('receptor', self.row) >= 0:
+            return table.receptor_names[table.table.get('receptor', self.row)]
+        elif key in table.fields[self.type]:
+            return table.table.get(table.fields[self.type][key], self.row)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        table = self.table
+        if key == 'time':
+            table.set('time', self.row, value)
+        elif key == 'to':
+            table.set('target', self.row, table.getCode(table.target_names, table.target_codes, value))
+        elif key == 'receptor':
+            table.set('receptor', self.row, table.getCode(table.receptor_names, table.receptor_codes, value))
+        elif key in table.fields[self.type]:
+            table.set(table.fields[self.type][key], self.row, value)
+        else:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __eq__(self, other):
+        return dict(self) == (dict(other) if isinstance(other, EventView) else other)
+
+
+class EventList:
+    '''The events of an EventTable as a sequence of EventViews in insertion order, what
+    StimulationProtocol.events used to be as a list of dicts.'''
+
+    def __init__(self, table):
+        self.table = table
+
+    def __len__(self):
+        return len(self.table)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [EventView(self.table, row) for row in range(len(self.table))[index]]
+        if index < 0:
+            index += len(self.table)
+        if not 0 <= index < len(self.table):
+            raise IndexError(index)
+        return EventView(self.table, index)
+
+    def __iter__(self):
+        return (EventView(self.table, row) for row in range(len(self.table)))
+
+    def append(self, event):
+        fields = self.table.fields[event['type']]
+        values = {column: event[key] for key, column in fields.items()}
+        self.table.add(event['time'], event['type'], event['to'], event.get('receptor'), **values)
@@ -0,0 +1,43 @@
+import numpy as np
+
+
+def getCumulativeCounts(store, populations, pop_offsets, total_time, resolution=1.0):
+    '''Cumulative spike counts of the given populations on bins of resolution ms, all trials at once.
+
+    Returns an int array (trials, bins + 1, populations) whose entry [k, b, i] counts the
+    spikes of population populations[i] in trial k before b*resolution ms. Window counts of
+    any length and position are differences of two entries.'''
+    num_bin = int(np.ceil(total_time / resolution - 1e-9))
+    column = np.full(pop_offsets[-1], -1, dtype=np.int64)
+    for i, p in enumerate(populations):
+        column[pop_offsets[p]:pop_offsets[p+1]] = i
+    columns = column[store.neurons]
+    bins = (store.times.astype(np.float64) * (1000.0 / resolution)).astype(np.int64)
+    valid = (columns >= 0) & (bins < num_bin)
+    flat = (store.getTrialIds()[valid].astype(np.int64) * num_bin + bins[valid]) * len(populations) + columns[valid]
+    counts = np.bincount(flat, minlength=store.numTrials * num_bin * len(populations))
+    counts = counts.reshape(store.numTrials, num_bin, len(populations))
+    cumulative = np.zeros((store.numTrials, num_bin + 1, len(populations)), dtype=np.int64)
+    np.cumsum(counts, axis=1, out=cumulative[:, 1:])
+    return cumulative
+
+
+def getWindowRates(cumulative, sizes, window, step, resolution=1.0):
+    '''Mean firing rate (Hz) per neuron in the window (ms) ending at every multiple of step (ms).
+
+    Returns (times in s, rates (trials, steps, populations)). Windows reaching before 0 are
+    cut at 0 but still divided by the full window, like a rate output starting at 0.'''
+    num_bin = cumulative.shape[1] - 1
+    ends = np.arange(step, num_bin * resolution + 1e-9, step)
+    end_bins = np.minimum(np.round(ends / resolution).astype(np.int64), num_bin)
+    start_bins = np.maximum(end_bins - int(round(window / resolution)), 0)
+    counts = cumulative[:, end_bins] - cumulative[:, start_bins]
+    return ends / 1000.0, counts / (np.asarray(sizes, dtype=np.float64) * window / 1000.0)
+
+
+def getFiringRates(store, populations, pop_offsets, window, step, total_time, resolution=1.0):
+    '''Sliding-window rates (Hz) of populations from a SpikeStore, see getWindowRates.
+    For several windows or steps, compute getCumulativeCounts once and call getWindowRates.'''
+    cumulative = getCumulativeCounts(store, populations, pop_offsets, total_time, resolution)
+    sizes = np.diff(pop_offsets)[populations]
+    return getWindowRates(cumulative, sizes, window, step, resolution)
@@ -1,38 +1,73 @@
-import subprocess
+import io
+import os
 
 import networkx as nx
 import numpy as np
 
+import profiling
+from compiled_network import CompiledNetwork
+from event_table import EventList, EventTable
+from lif_engine import LIFEngine
+from population_registry import PopulationRegistry
+from simulator_launcher import runCommand
+from spike_store import SpikeStore
+
+FLYSIM_TARGET = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'simulators', 'sim08_15', 'flysim.out')
+
 class FlysimSNN:
 
     def __init__(self, trial_time, iterations, dat_base_name='network', seed=None):
-        self.flysim_target = 'simulators/sim08_15/flysim.out'
+        self.flysim_target = FLYSIM_TARGET
         self.seed = seed
-        self.network = nx.DiGraph()
+        self.registry = PopulationRegistry()
+        self.graph = None
         self.subgraph = {}
         self.iter = iterations
         self.protocol = StimulationProtocol(trial_time)
-        self.id_counter = 0
         self.conf_name = f'{dat_base_name}.conf'
         self.pro_name = f'{dat_base_name}.pro'
-
-    def addNeuron(self, name, n=1, c=0.5, leakyC=2.5, taum=20, threshold=-50, restpot=-70, resetpot=-55, refracperiod=20, spikedly=0, selfconnect=False, layer=None):
-        conf = NeuralPopulation(name, n, c, leakyC, taum, threshold, restpot, resetpot, refracperiod, spikedly, selfconnect)
-        self.network.add_node(name, id=self.id_counter, spike_count=0, config=conf)
-        self.id_counter += 1
+        self.outputs = {}
+        self.spike_stores = {}
+        self.cache = None
+        self.compiled = None
+        # Seconds before a flysim run is killed and the number of further attempts after a crash or a timeout.
+        self.timeout = None
+        self.retries = 0
+
+    @property
+    def id_counter(self):
+        return len(self.registry)
+
+    @property
+    def network(self):
+        '''networkx view of the populations and connections, built on demand, e.g. for plotNetwork.'''
+        if self.graph is None or self.graph.graph['version'] != self.registry.version:
+            self.graph = nx.DiGraph(version=self.registry.version)
+            for name in self.registry.names:
+                node = self.getNeuron(name)
+                self.graph.add_node(name, **{key: node[key] for key in node.keys()})
+            names = self.registry.names
+            self.graph.add_edges_from((names[source], names[target]) for source, target in self.registry.getEdges())
+        return self.graph
+
+    def addNeuron(self, name, n=1, c=0.5, leakyC=2.5, taum=20, threshold=-50, restpot=-70, resetpot=-55, refracperiod=2, spikedly=0, selfconnect=False, layer=None):
+        if name in self.registry.index:
+            print(f'[Warning] Population {name} already exists, skip.')
+            return
+        id = self.registry.addPopulation(name, n, c, leakyC, taum, threshold, restpot, resetpot, refracperiod, spikedly, selfconnect,
+                                         text=NeuralPopulation.formatHeader(name, n, c, taum, restpot, resetpot, threshold))
         if layer:
-            self.network.nodes[name]['layer'] = layer
+            self.registry.layers[id] = layer
 
     def addReceptor(self, neuron_name, receptpr_type, tau=10, revpot=0, freqext=0.0, meanexteff=0.0, meanextconn=1.0):
-        if self.isNeuronExist(neuron_name):
-            neuron = self.getNeuron(neuron_name)
-            neuron['config'].haveReceptor(receptpr_type, tau, revpot, freqext, meanexteff, meanextconn)
+        id = self.registry.index.get(neuron_name)
+        if id is not None:
+            NeuralPopulation(self.registry, id).haveReceptor(receptpr_type, tau, revpot, freqext, meanexteff, meanextconn)
 
     def addCoonection(self, source_name, target_name, receptor, mean_effect=0.0, weight=1.0, connectivity=1.0):
-        if self.isNeuronExist(source_name) and self.isNeuronExist(target_name):
-            self.network.add_edge(source_name, target_name)
-            neuron = self.getNeuron(source_name)
-            neuron['config'].innervate(target_name, receptor, mean_effect, weight, connectivity)
+        id = self.registry.index.get(source_name)
+        if id is not None and target_name in self.registry.index:
+            NeuralPopulation(self.registry, id).innervate(target_name, receptor, mean_effect, weight, connectivity)
 
     def addStimulus(self, stimulus_type, time_point, to, *args):
         if self.isNeuronExist(to) or self.protocol.isGroupExist(to):
@@ -65,133 +100,345 @@ class FlysimSNN:
             return
 
     def getNeuron(self, neuron_name):
-        try:
-            return self.network.nodes[neuron_name]
-        except:
+        id = self.registry.index.get(neuron_name)
+        if id is None:
             return None
+        return PopulationRecord(self.registry, id)
+
+    def getPopulations(self):
+        return [NeuralPopulation(self.registry, id) for id in range(len(self.registry))]
+
+    def writeConf(self, stream):
+        NeuralPopulation.writePopulations(self.registry, stream, range(len(self.registry)))
 
     def getAllConf(self):
-        conf = ''
-        for neuron_name, neural_population in self.network.nodes(data='config'):
-            conf += neural_population.getConf()
-        return conf
+        conf = io.StringIO()
+        self.writeConf(conf)
+        return conf.getvalue()
 
     def generatePro(self):
-        with open(self.pro_name, 'w') as pro:
-            pro.write(self.protocol.getPro())
+        with profiling.phase('generatePro'), open(self.pro_name, 'w') as pro:
+            self.protocol.writePro(pro)
 
     def generateConf(self):
-        with open(self.conf_name, 'w') as conf:
-            conf.write(self.getAllConf())
+        with profiling.phase('generateConf'), open(self.conf_name, 'w') as conf:
+            self.writeConf(conf)
 
     def isNeuronExist(self, neuron_name):
-        if self.getNeuron(neuron_name) == None:
-            return False
-        else:
-            return True
+        return neuron_name in self.registry.index
+
+    def getTrialFileName(self, file_name, trial):
+        return file_name if trial == 0 else f'{file_name}_{trial+1}'
+
+    def compile(self):
+        '''Return the CompiledNetwork of the populations, built once until the network or the seed changes.'''
+        if self.compiled is None or self.compiled.seed != self.seed or self.compiled.version != self.registry.version:
+            with profiling.phase('compile'):
+                self.compiled = CompiledNetwork(self.registry, self.seed)
+        return self.compiled
+
+    def getPopulationOffsets(self):
+        return self.compile().offsets
+
+    def getSpikeStore(self, file_name):
+        '''Return the SpikeStore of a spike output, from memory after a numpy run or imported from the flysim files.'''
+        if file_name not in self.spike_stores:
+            offsets = self.getPopulationOffsets()
+            with profiling.phase('parseSpikes', file=file_name):
+                if file_name in self.outputs:
+                    store = SpikeStore.fromRecords(self.outputs[file_name], self.iter, offsets)
+                else:
+                    store = SpikeStore.fromFlysim(file_name, self.iter, offsets)
+            profiling.count('spikes_parsed', len(store.times))
+            self.spike_stores[file_name] = store
+        return self.spike_stores[file_name]
+
+    def getOutputFiles(self):
+        return [self.getTrialFileName(outfile['name'], trial) for outfile in self.protocol.outfiles for trial in range(self.iter)]
+
+    def getFiringRates(self, file_name):
+        '''Return (times in s, rates (trials, steps, populations)) of a FiringRate output, from memory
+        after a numpy run or read from the flysim files.'''
+        if file_name in self.outputs:
+            records = self.outputs[file_name]
+            times = records['time'][records['trial'] == 0]
+            return times, records['rate'].reshape(self.iter, len(times), -1)
+        data = [np.loadtxt(self.getTrialFileName(file_name, trial), ndmin=2) for trial in range(self.iter)]
+        return data[0][:, 0], np.stack([trial_data[:, 1:] for trial_data in data])
+
+    def saveOutputs(self):
+        '''Write the in-memory spike and rate outputs in the flysim text format, one file per trial.'''
+        with profiling.phase('saveOutputs'):
+            for file_name, records in self.outputs.items():
+                for trial in range(self.iter):
+                    trial_records = records[records['trial'] == trial]
+                    with open(self.getTrialFileName(file_name, trial), 'w') as dat:
+                        if 'rate' in records.dtype.names:
+                            dat.writelines(f'{t:.5f} ' + ' '.join(f'{rate:g}' for rate in rates) + '\n' for t, rates in zip(trial_records['time'], trial_records['rate']))
+                        else:
+                            dat.writelines(f'{t:.5f} {neuron}\n' for t, neuron in zip(trial_records['time'], trial_records['neuron']))
+
+    def start(self, thread=1, engine='flysim', save_outputs=True, cache=None):
+        '''Run the trials with flysim or the numpy engine. A SimulationCache given here or set on
+        self.cache short-cuts runs whose network, protocol, seed and repetitions were seen before.'''
+        if engine not in ('flysim', 'numpy'):
+            raise Exception(f'Unknown simulation engine {engine}.')
+        cache = cache if cache is not None else self.cache
+        if cache is not None and not cache.accepts(self):
+            cache = None
+        self.spike_stores = {}
+        if cache is not None:
+            with profiling.phase('cacheLoad'):
+                key = cache.getKey(self, engine)
+                hit = cache.load(key, self, engine)
+            if hit:
+                if engine != 'flysim' and save_outputs:
+                    self.saveOutputs()
+                return self.outputs
+        self.runEngine(thread, engine)
+        if cache is not None:
+            with profiling.phase('cacheStore'):
+                cache.store(key, self, engine)
+        if engine != 'flysim' and save_outputs:
+            self.saveOutputs()
+        return self.outputs
+
+    def runEngine(self, thread, engine):
+        with profiling.phase('simulate', engine=engine, trials=self.iter):
+            if engine == 'flysim':
+                self.outputs = {}
+                runCommand(self.getFlysimCommand(thread), self.timeout, self.retries)
+            else:
+                simulator = LIFEngine(self)
+                self.outputs = simulator.run(self.iter)
+                profiling.count('events_processed', simulator.events_processed)
+        profiling.count('protocol_events', len(self.protocol.table) * self.iter)
+
+    def getFlysimCommand(self, thread=1, iterations=None, seed=None):
+        iterations = self.iter if iterations is None else iterations
+        seed = self.seed if seed is None else seed
+        command = [self.flysim_target, '-conf', self.conf_name, '-pro', self.pro_name, '-rp', str(iterations), '-t', str(thread)]
+        if seed:
+            command.extend(['-udfsed', str(seed)])
+        return command
+    
 
-    def start(self, thread=1):
-        if self.seed:
-            subprocess.call([self.flysim_target, '-conf', self.conf_name, '-pro', self.pro_name, '-rp', str(self.iter), '-t', str(thread), '-udfsed', str(self.seed)])
+class PopulationRecord:
+    """Dict-like node of a population: id, config (its NeuralPopulation), spike_count and layer when set."""
+    __slots__ = ('registry', 'id')
+
+    def __init__(self, registry, id):
+        self.registry = registry
+        self.id = id
+
+    def keys(self):
+        keys = ['id', 'spike_count', 'config']
+        if self.id in self.registry.layers:
+            keys.append('layer')
+        return keys
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __getitem__(self, key):
+        if key == 'id':
+            return self.id
+        elif key == 'config':
+            return NeuralPopulation(self.registry, self.id)
+        elif key == 'spike_count':
+            return self.registry.populations.get('spike_count', self.id)
+        elif key == 'layer' and self.id in self.registry.layers:
+            return self.registry.layers[self.id]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key == 'layer':
+            self.registry.layers[self.id] = value
+        elif key == 'spike_count':
+            self.registry.set(self.registry.populations, 'spike_count', self.id, value)
         else:
-            subprocess.call([self.flysim_target, '-conf', self.conf_name, '-pro', self.pro_name, '-rp', str(self.iter), '-t', str(thread)])
-    
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+def columnProperty(table, name):
+    """Attribute reading and writing one column of a registry table at the row of the view."""
+    def getter(self):
+        return getattr(self.registry, table).get(name, self.row)
+
+    def setter(self, value):
+        self.registry.set(getattr(self.registry, table), name, self.row, value)
+    return property(getter, setter)
+
 
 class NeuralPopulation:
-    '''Only support LIF model ,and STP and LTP are not considered here.'''
-    def __init__(self, name, n=1, c=0.5, leakyC=10, taum=20, threshold=-50, restpot=-70, resetpot=-55, refracperiod=20, spikedly=0, selfconnect=False):
-        self.Name = name
-        self.N = n
-        self.Capacitance = c
-        self.LeakyConductance = leakyC
-        self.Taum = taum
-        self.Threshold = threshold
-        self.RestingPotential = restpot
-        self.ResetPotential = resetpot
-        self.RefractoryPeriod = refracperiod
-        self.SpikeDelay = spikedly
-        self.SelfConnection = selfconnect
-        self.receptorConf = ''
-        self.connectionConf = ''
+    '''Only support LIF model ,and STP and LTP are not considered here.
 
-    class Receptor:
+    A view of one population of a PopulationRegistry, the parameters live in its columns.'''
+    __slots__ = ('registry', 'row')
+
+    def __init__(self, registry, id):
+        self.registry = registry
+        self.row = id
+
+    @property
+    def Name(self):
+        return self.registry.names[self.row]
 
+    class Receptor:
+        __slots__ = ('registry', 'row')
         types = ('AMPA', 'GABA', 'NMDA', 'Ach', 'GluCl', 'Gap', 'Sine')
-       
-        def __init__(self, receptpr_type, tau, revpot, freqext, meanexteff, meanextconn):
-            if self.isReceptorType(receptpr_type):
-                self._legal = True
-            else:
-                print('[Error] Unknown receptor, skip.')
-                self._legal = False
-            self.type = receptpr_type
-            self.Tau = tau
-            self.ReversePotential = revpot
-            self.FreqExt = freqext
-            self.MeanExtEff = meanexteff
-            self.MeanExtCon = meanextconn
-                
-        def isReceptorType(self, type_name):
-            return type_name in self.types
+
+        def __init__(self, registry, row):
+            self.registry = registry
+            self.row = row
+
+        @property
+        def type(self):
+            return self.registry.type_names[self.registry.receptors.get('type', self.row)]
+
+        @classmethod
+        def isReceptorType(cls, type_name):
+            return type_name in cls.types
 
         def getConf(self):
-            if self._legal:
-                out = f'Receptor: {self.type}\n' + \
-                      f'Tau={self.Tau}\n' + \
-                      f'RevPot={self.ReversePotential}\n' + \
-                      f'FreqExt={self.FreqExt}\n' + \
-                      f'MeanExtEff={self.MeanExtEff}\n' + \
-                      f'MeanExtCon={self.MeanExtCon}\n' + \
-                      'EndReceptor\n'
-            else:
-                out = ''
-            return out
-                
+            return self.formatConf(self.type, self.Tau, self.ReversePotential, self.FreqExt, self.MeanExtEff, self.MeanExtCon)
+
+        @staticmethod
+        def formatConf(type, tau, revpot, freqext, meanexteff, meanextconn):
+            return (f'Receptor: {type}\nTau={tau}\nRevPot={revpot}\nFreqExt={freqext}\n'
+                    f'MeanExtEff={meanexteff}\nMeanExtCon={meanextconn}\nEndReceptor\n')
+
     class TargetPopulation:
-        def __init__(self, name, receptor, mean_effect, weight, connectivity):
-            self.Target = name
-            self.Receptor = receptor
-            self.MeanEff = mean_effect
-            self.Weight = weight
-            self.Connectivity = connectivity
-                
+        __slots__ = ('registry', 'row')
+
+        def __init__(self, registry, row):
+            self.registry = registry
+            self.row = row
+
+        @property
+        def Target(self):
+            return self.registry.names[self.registry.targets.get('target', self.row)]
+
+        @property
+        def Receptor(self):
+            return self.registry.type_names[self.registry.targets.get('receptor', self.row)]
+
         def getConf(self):
-            out = f'TargetPopulation: {self.Target}\n' + \
-                  f'TargetReceptor={self.Receptor}\n' + \
-                  f'MeanEff={self.MeanEff}\n' + \
-                  f'weight={self.Weight}\n' + \
-                  'EndTargetPopulation\n'
-            return out
+            return self.formatConf(self.Target, self.Receptor, self.MeanEff, self.Weight)
+
+        @staticmethod
+        def formatConf(target, receptor, mean_effect, weight):
+            return f'TargetPopulation: {target}\nTargetReceptor={receptor}\nMeanEff={mean_effect}\nweight={weight}\nEndTargetPopulation\n'
 
     def haveReceptor(self, receptor_type, tau, revpot, freqext, meanexteff, meanextconn):
-        receptor = self.Receptor(receptor_type, tau, revpot, freqext, meanexteff, meanextconn)
-        self.receptorConf += receptor.getConf()
+        if receptor_type not in self.Receptor.types:
+            print('[Error] Unknown receptor, skip.')
+            return
+        self.registry.addReceptor(self.row, receptor_type, tau, revpot, freqext, meanexteff, meanextconn,
+                                  text=self.Receptor.formatConf(receptor_type, tau, revpot, freqext, meanexteff, meanextconn))
 
     def innervate(self, target, receptor, mean_effect, weight, connectivity):
-        connection = self.TargetPopulation(target, receptor, mean_effect, weight, connectivity)
-        self.connectionConf += connection.getConf()
+        target_id = self.registry.index.get(target)
+        if target_id is None:
+            print(f'[Warning] Target population {target} does not exist, skip.')
+            return
+        self.registry.addTarget(self.row, target_id, receptor, mean_effect, weight, connectivity,
+                                text=self.TargetPopulation.formatConf(target, receptor, mean_effect, weight))
+
+    @property
+    def receptors(self):
+        return [self.Receptor(self.registry, row) for row in self.registry.receptor_rows[self.row]]
+
+    @property
+    def targets(self):
+        return [self.TargetPopulation(self.registry, row) for row in self.registry.target_rows[self.row]]
+
+    @property
+    def receptorConf(self):
+        return ''.join(receptor.getConf() for receptor in self.receptors)
+
+    @property
+    def connectionConf(self):
+        return ''.join(connection.getConf() for connection in self.targets)
+
+    def writeConf(self, stream):
+        self.writePopulations(self.registry, stream, [self.row])
+
+    @staticmethod
+    def writePopulations(registry, stream, ids):
+        '''Write the conf text of the given populations, formatting only those without a text kept in the registry.'''
+        missing = [id for id in ids if id not in registry.texts]
+        if missing:
+            NeuralPopulation.formatPopulations(registry, missing)
+        texts = registry.texts
+        stream.writelines([texts[id] for id in ids])
+
+    @staticmethod
+    def formatHeader(name, n, c, taum, restpot, resetpot, threshold):
+        return f'NeuralPopulation: {name}\nN={n}\nC={c}\nTaum={taum}\nRestPot={restpot}\nResetPot={resetpot}\nThreshold={threshold}\n\n'
+
+    @staticmethod
+    def formatPopulations(registry, ids):
+        '''Put the conf text of the given populations into registry.texts from the texts given with
+        their rows, formatting from the columns those that changed since.'''
+        headers, receptor_texts, target_texts = registry.headers, registry.receptor_texts, registry.target_texts
+        type_names, names = registry.type_names, registry.names
+        changed = [id for id in ids if headers[id] is None]
+        if changed:
+            columns = (registry.populations.getValues(name, changed) for name in ('N', 'Capacitance', 'Taum', 'RestingPotential', 'ResetPotential', 'Threshold'))
+            for id, *values in zip(changed, *columns):
+                headers[id] = NeuralPopulation.formatHeader(names[id], *values)
+        changed = [id for id in ids if receptor_texts[id] is None]
+        if changed:
+            rows = [row for id in changed for row in registry.receptor_rows[id]]
+            columns = (registry.receptors.getValues(name, rows) for name in ('type', 'Tau', 'ReversePotential', 'FreqExt', 'MeanExtEff', 'MeanExtCon'))
+            texts = iter([NeuralPopulation.Receptor.formatConf(type_names[type], *values) for type, *values in zip(*columns)])
+            for id in changed:
+                receptor_texts[id] = [next(texts) for row in registry.receptor_rows[id]]
+        changed = [id for id in ids if target_texts[id] is None]
+        if changed:
+            rows = [row for id in changed for row in registry.target_rows[id]]
+            columns = (registry.targets.getValues(name, rows) for name in ('target', 'receptor', 'MeanEff', 'Weight'))
+            texts = iter([NeuralPopulation.TargetPopulation.formatConf(names[target], type_names[receptor], *values) for target, receptor, *values in zip(*columns)])
+            for id in changed:
+                target_texts[id] = [next(texts) for row in registry.target_rows[id]]
+        for id in ids:
+            registry.texts[id] = headers[id] + ''.join(receptor_texts[id]) + '\n' + ''.join(target_texts[id]) + '\n' + 'EndNeuralPopulation\n\n'
+            # Only the whole text is kept from now on, a change formats the population from its columns.
+            headers[id] = receptor_texts[id] = target_texts[id] = None
 
     def getConf(self):
-        out = f'NeuralPopulation: {self.Name}\n' + \
-              f'N={self.N}\n' + \
-              f'C={self.Capacitance}\n' + \
-              f'Taum={self.Taum}\n' + \
-              f'RestPot={self.RestingPotential}\n' + \
-              f'ResetPot={self.ResetPotential}\n' + \
-              f'Threshold={self.Threshold}\n\n' + \
-              self.receptorConf + '\n' + \
-              self.connectionConf + '\n' + \
-              'EndNeuralPopulation\n\n'
-        return out
-             
+        out = io.StringIO()
+        self.writeConf(out)
+        return out.getvalue()
+
+
+for name in PopulationRegistry.population_columns:
+    setattr(NeuralPopulation, name, columnProperty('populations', name))
+for name in PopulationRegistry.receptor_columns[2:]:
+    setattr(NeuralPopulation.Receptor, name, columnProperty('receptors', name))
+for name in PopulationRegistry.target_columns[3:]:
+    setattr(NeuralPopulation.TargetPopulation, name, columnProperty('targets', name))
+
 class StimulationProtocol:
 
     def __init__(self, experiment_time):
         self.groups = {}
-        self.events = []
+        self.table = EventTable()
         self.outfiles = []
         self.endTime = experiment_time
 
+    @property
+    def events(self):
+        '''The events in insertion order as dict-like views of the EventTable.'''
+        return EventList(self.table)
+
     def addGroup(self, group_name, member_list):
         self.groups[group_name] = member_list
 
@@ -205,10 +452,10 @@ class StimulationProtocol:
         self.outfiles.append({'type': 'MemPot','name': file_name, 'population': target})
 
     def injectCurrent(self, time_point, to, mean, std):
-        self.events.append({'time': time_point, 'type': 'ChangeMembraneNoise', 'to': to, 'mean': mean, 'std': std})
+        return self.table.add(time_point, 'ChangeMembraneNoise', to, value=mean, std=std)
 
     def injectSpikes(self, time_point, to, receptor, hz):
-        self.events.append({'time': time_point, 'type': 'ChangeExtFreq', 'to': to, 'receptor': receptor, 'hz': hz})
+        return self.table.add(time_point, 'ChangeExtFreq', to, receptor, hz)
 
     def isGroupExist(self, group_name):
         try:
@@ -221,52 +468,59 @@ class StimulationProtocol:
         if end > self.endTime:
             print('[Warning] The end time of stimuli exceeds the experiment time, truncate the excess stimuli.')
             end = self.endTime
-        for time_point in np.arange(start, end, interval):
-            if stimuli_type == 'current':
-                self.injectCurrent(time_point, to, args[0], args[1])
-                self.injectCurrent(time_point+duration, to, 0.0, 0.0)
-            elif stimuli_type == 'spike':
-                self.injectSpikes(time_point, to, args[0], args[1])
-                self.injectSpikes(time_point+duration, to, args[0], 0.0)
+        onsets = np.arange(start, end, interval)
+        if stimuli_type == 'current':
+            self.table.addTrain(onsets, onsets + duration, 'ChangeMembraneNoise', to, value=args[0], std=args[1])
+        elif stimuli_type == 'spike':
+            self.table.addTrain(onsets, onsets + duration, 'ChangeExtFreq', to, args[0], args[1])
 
-    def getPro(self):
-        out = ''
+    def getEventsBetween(self, t0, t1, to=None):
+        '''Event views in time order of the events in [t0, t1) ms, only those of population or group to if given.'''
+        return [self.table.getEvent(row) for row in self.table.getRange(t0, t1, to).tolist()]
+
+    def mergeRedundantEvents(self):
+        '''Drop the events that change nothing, see EventTable.mergeRedundant.'''
+        return self.table.mergeRedundant(self.groups)
+
+    def writePro(self, out):
         if self.groups:
-            out += 'DefineMacro\n\n'
+            out.write('DefineMacro\n\n')
             for group_name, group_member in self.groups.items():
-                out += f'GroupName:{group_name}\n' + \
-                       f"GroupMembers:{','.join(group_member)}\n" + \
-                       'EndGroupMembers\n\n'
-            out += 'EndDefineMacro\n\n'
-        for event in self.events:
-            out += f"EventTime {event['time']}\n" + \
-                   f"Type={event['type']}\n" + \
-                   "Label=#1#\n" + \
-                   f"Population:{event['to']}\n"
-            if event['type'] == 'ChangeExtFreq':
-                out += f"Receptor:{event['receptor']}\n" + \
-                       f"FreqExt={event['hz']}\n"
-            elif event['type'] == 'ChangeMembraneNoise':
-                out += f"GaussMean:{event['mean']}\n" + \
-                       f"GaussSTD:{event['std']}\n"
-            out += 'EndEvent\n\n'
-        out += f"EventTime {self.endTime}\n" + \
-               'Type=EndTrial\n' + \
-               'Label=End_of_the_trial\n' + \
-               'EndEvent\n\n'
+                out.write(f'GroupName:{group_name}\n' + \
+                          f"GroupMembers:{','.join(group_member)}\n" + \
+                          'EndGroupMembers\n\n')
+            out.write('EndDefineMacro\n\n')
+        self.writeEvents(out)
+        out.write(f"EventTime {self.endTime}\n" + \
+                  'Type=EndTrial\n' + \
+                  'Label=End_of_the_trial\n' + \
+                  'EndEvent\n\n')
         if self.outfiles:
-            out += 'OutControl\n'
+            out.write('OutControl\n')
             for outfile in self.outfiles:
-                out += f"FileName:{outfile['name']}\n" + \
-                       f"Type={outfile['type']}\n"
+                out.write(f"FileName:{outfile['name']}\n" + \
+                          f"Type={outfile['type']}\n")
                 if outfile['type'] == 'FiringRate':
-                    out += f"FiringRateWinodw={outfile['window']}\n" + \
-                           f"PrintStep={outfile['step']}\n"
-                out += f"population:{outfile['population']}\n" + \
-                       'EndOutputFile\n\n'
-            out += 'EndOutControl\n'
+                    out.write(f"FiringRateWinodw={outfile['window']}\n" + \
+                              f"PrintStep={outfile['step']}\n")
+                out.write(f"population:{outfile['population']}\n" + \
+                          'EndOutputFile\n\n')
+            out.write('EndOutControl\n')
+
+    def writeEvents(self, out):
+        '''Write the events in insertion order, like the event list did, reading every column of the EventTable once
+        and formatting every event with one f-string into a single write.'''
+        table = self.table
+        types, targets, receptors = table.types, table.target_names, table.receptor_names
+        out.write(''.join([f'EventTime {time}\nType=ChangeExtFreq\nLabel=#1#\nPopulation:{targets[target]}\nReceptor:{receptors[receptor]}\nFreqExt={value}\nEndEvent\n\n'
+                           if types[type] == 'ChangeExtFreq' else
+                           f'EventTime {time}\nType=ChangeMembraneNoise\nLabel=#1#\nPopulation:{targets[target]}\nGaussMean:{value}\nGaussSTD:{std}\nEndEvent\n\n'
+                           for time, type, target, receptor, value, std in zip(*(table.table.getValues(name) for name in table.columns))]))
 
-        return out
+    def getPro(self):
+        out = io.StringIO()
+        self.writePro(out)
+        return out.getvalue()
 
 if __name__ == '__main__':
     sim = FlysimSNN(1000, 100, 'ssm')
@@ -0,0 +1,231 @@
+import argparse
+import io
+import os
+import sys
+import time
+
+from flysim_format import FlysimSNN, StimulationProtocol
+
+POPULATION_KEYS = {'N': 'n', 'C': 'c', 'Taum': 'taum', 'RestPot': 'restpot', 'ResetPot': 'resetpot',
+                   'Threshold': 'threshold', 'RefractoryPeriod': 'refracperiod', 'SpikeDly': 'spikedly',
+                   'SelfConnection': 'selfconnect'}
+RECEPTOR_KEYS = {'Tau': 'tau', 'RevPot': 'revpot', 'FreqExt': 'freqext', 'MeanExtEff': 'meanexteff', 'MeanExtCon': 'meanextconn'}
+TARGET_KEYS = {'TargetReceptor': 'receptor', 'MeanEff': 'mean_effect', 'weight': 'weight', 'Connectivity': 'connectivity'}
+PRO_KEYS = {'FileName': 'name', 'Type': 'type', 'Label': 'label', 'Population': 'to', 'population': 'population',
+            'Receptor': 'receptor', 'FreqExt': 'hz', 'GaussMean': 'mean', 'GaussSTD': 'std',
+            'FiringRateWinodw': 'window', 'PrintStep': 'step'}
+PRO_TEXT_FIELDS = ('name', 'type', 'label', 'to', 'population', 'receptor')
+NETWORK_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'networks')
+
+
+def parseValue(text):
+    '''Keep integers as int and the rest as float, so the regenerated text prints the same numbers.'''
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def splitLine(line):
+    '''Split a 'Key: value', 'Key=value' or 'Key value' line, comments (%) and blank lines give None.'''
+    line = line.strip()
+    if not line or line[0] == '%':
+        return None
+    for separator in (':', '=', ' '):
+        key, found, value = line.partition(separator)
+        if found:
+            return key.strip(), value.strip()
+    return line, ''
+
+
+def readLines(source):
+    if hasattr(source, 'read'):
+        return source.read().splitlines()
+    with open(source, 'r') as stream:
+        return stream.read().splitlines()
+
+
+def parseConf(source, snn):
+    '''Add the populations, receptors and targets of a .conf file (path or stream) to snn in one pass.
+    Targets are connected once all populations exist, so they may refer to later populations.'''
+    targets = []
+    name = population = receptor = target = None
+    for line in readLines(source):
+        item = splitLine(line)
+        if item is None:
+            continue
+        key, value = item
+        if key == 'NeuralPopulation':
+            name, population = value, {'leakyC': 10}
+        elif key == 'Receptor':
+            if population is not None:
+                snn.addNeuron(name, **population)
+                population = None
+            receptor = {'receptpr_type': value, 'tau': 10, 'revpot': 0, 'freqext': 0.0, 'meanexteff': 0.0, 'meanextconn': 1.0}
+        elif key == 'EndReceptor':
+            snn.addReceptor(name, **receptor)
+            receptor = None
+        elif key == 'TargetPopulation':
+            target = {'target_name': value, 'receptor': None, 'mean_effect': 0.0, 'weight': 1.0, 'connectivity': 1.0}
+        elif key == 'EndTargetPopulation':
+            targets.append((name, target))
+            target = None
+        elif key == 'EndNeuralPopulation':
+            if population is not None:
+                snn.addNeuron(name, **population)
+            name = population = None
+        elif receptor is not None and key in RECEPTOR_KEYS:
+            receptor[RECEPTOR_KEYS[key]] = parseValue(value)
+        elif target is not None and key in TARGET_KEYS:
+            target[TARGET_KEYS[key]] = parseValue(value)
+        elif population is not None and key in POPULATION_KEYS:
+            population[POPULATION_KEYS[key]] = parseValue(value)
+        else:
+            print(f'[Warning] Unknown conf line "{line.strip()}", skip.')
+
+    for source_name, target in targets:
+        if snn.isNeuronExist(target['target_name']):
+            snn.addCoonection(source_name, **target)
+        else:
+            print(f"[Warning] Target population {target['target_name']} of {source_name} does not exist.")
+    return snn
+
+
+def parsePro(source, protocol):
+    '''Add the groups, events and outputs of a .pro file (path or stream) to protocol in one pass.
+    The EndTrial event sets the experiment time.'''
+    section = None
+    entry = {}
+    for line in readLines(source):
+        item = splitLine(line)
+        if item is None:
+            continue
+        key, value = item
+        if key in ('DefineMacro', 'OutControl'):
+            section = key
+        elif key in ('EndDefineMacro', 'EndOutControl'):
+            section = None
+        elif key == 'EventTime':
+            entry = {'time': parseValue(value)}
+        elif key == 'EndEvent':
+            if entry['type'] == 'EndTrial':
+                protocol.endTime = entry['time']
+            elif entry['type'] == 'ChangeExtFreq':
+                protocol.injectSpikes(entry['time'], entry['to'], entry['receptor'], entry['hz'])
+            elif entry['type'] == 'ChangeMembraneNoise':
+                protocol.injectCurrent(entry['time'], entry['to'], entry['mean'], entry['std'])
+            else:
+                print(f"[Warning] Unknown event type {entry['type']}, skip.")
+            entry = {}
+        elif key == 'EndGroupMembers':
+            protocol.addGroup(entry['name'], entry['members'])
+            entry = {}
+        elif key == 'EndOutputFile':
+            if entry['type'] == 'FiringRate':
+                protocol.outputFiringRates(entry['name'], entry['population'], entry['window'], entry['step'])
+            elif entry['type'] == 'Spike':
+                protocol.outputSpikes(entry['name'], entry['population'])
+            elif entry['type'] == 'MemPot':
+                protocol.outputMembranePotential(entry['name'], entry['population'])
+            entry = {}
+        elif key == 'GroupName':
+            entry['name'] = value
+        elif key == 'GroupMembers':
+            entry['members'] = [member.strip() for member in value.split(',') if member.strip()]
+        elif key in PRO_KEYS:
+            field = PRO_KEYS[key]
+            entry[field] = value if field in PRO_TEXT_FIELDS else parseValue(value)
+        else:
+            print(f'[Warning] Unknown pro line "{line.strip()}" in {section or "events"}, skip.')
+    return protocol
+
+
+def loadNetwork(conf_name, pro_name=None, iterations=1, dat_base_name='network', seed=None, trial_time=0):
+    '''Rebuild a FlysimSNN from existing .conf and .pro files, e.g. to run them with the numpy engine.'''
+    snn = FlysimSNN(trial_time, iterations, dat_base_name, seed)
+    parseConf(conf_name, snn)
+    if pro_name is not None:
+        parsePro(pro_name, snn.protocol)
+    return snn
+
+
+def normalizeText(text):
+    '''Tokens of conf or pro text without comments, blank lines and number formatting.'''
+    tokens = []
+    for line in text.splitlines():
+        item = splitLine(line)
+        if item is not None:
+            tokens.append((item[0], parseValue(item[1])))
+    return tokens
+
+
+def checkRoundTrip(snn, conf_text=None, pro_text=None):
+    '''Parse the generated (or given original) text back and compare; returns {check: passed}.'''
+    conf, pro = snn.getAllConf(), snn.protocol.getPro()
+    checks = {'conf regenerated identically': parseConf(io.StringIO(conf), FlysimSNN(0, 1)).getAllConf() == conf,
+              'pro regenerated identically': parsePro(io.StringIO(pro), StimulationProtocol(0)).getPro() == pro}
+    if conf_text is not None:
+        checks['conf matches the file'] = normalizeText(conf_text) == normalizeText(conf)
+    if pro_text is not None:
+        checks['pro matches the file'] = normalizeText(pro_text) == normalizeText(pro)
+    return checks
+
+
+def findNetworks(directory=NETWORK_DIRECTORY):
+    '''(conf, pro or None) paths of every .conf file below directory, paired with the .pro file of the same name.'''
+    networks = []
+    for root, _, files in sorted(os.walk(directory)):
+        for name in sorted(files):
+            if name.endswith('.conf'):
+                pro_name = os.path.join(root, name[:-len('.conf')] + '.pro')
+                networks.append((os.path.join(root, name), pro_name if os.path.exists(pro_name) else None))
+    return networks
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check that flysim conf/pro files round-trip, exits with 1 when one does not.')
+    parser.add_argument('conf', type=str, nargs='?', help='Path to the conf file, every network of networks/ is checked when omitted')
+    parser.add_argument('pro', type=str, nargs='?', help='Path to the pro file')
+    parser.add_argument('-g', '--generate', action='store_true', help='Check a generated branched SSC instead')
+    parser.add_argument('-l', '--length', type=int, default=1000, help='Number of trunk nodes of the generated SSC')
+    args = parser.parse_args()
+
+    if args.generate:
+        from ssc import SNNSequenceControl
+        forks = [(pos, 9) for pos in range(0, args.length, 10)]
+        ssc = SNNSequenceControl(args.length, fork_pos_len_w=forks, experiment_time=100000, repetition=1, filename_base='roundtrip')
+        ssc.sim.protocol.periodicStimuli(0, 100000, 20, 5, 'current', 'Next', 10, 1)
+        ssc.sim.defineOutput('Spike', 'roundtrip_all.dat', 'AllPopulation')
+        sources = [('generated SSC', ssc.sim.getAllConf(), ssc.sim.protocol.getPro())]
+    else:
+        sources = []
+        for conf_name, pro_name in ([(args.conf, args.pro)] if args.conf else findNetworks()):
+            with open(conf_name, 'r') as stream:
+                conf_text = stream.read()
+            pro_text = None
+            if pro_name:
+                with open(pro_name, 'r') as stream:
+                    pro_text = stream.read()
+            sources.append((conf_name, conf_text, pro_text))
+    if not sources:
+        raise Exception(f'No conf file found in {NETWORK_DIRECTORY}.')
+
+    failed = []
+    for label, conf_text, pro_text in sources:
+        start = time.perf_counter()
+        snn = loadNetwork(io.StringIO(conf_text), None if pro_text is None else io.StringIO(pro_text))
+        elapsed = time.perf_counter() - start
+        print(f'{label}: {len(snn.registry)} populations, {len(snn.registry.getEdges())} connections, '
+              f'{len(snn.protocol.events)} events parsed in {elapsed:.3f} s')
+        for check, passed in checkRoundTrip(snn, conf_text, pro_text).items():
+            print(f'    {check}: {passed}')
+            if not passed:
+                failed.append(f'{label}: {check}')
+    if failed:
+        print(f'[Error] {len(failed)} round trip checks failed:\n' + '\n'.join(failed))
+        sys.exit(1)
+    print(f'All round trip checks of {len(sources)} networks passed.')
@@ -0,0 +1,290 @@
+import argparse
+import functools
+import importlib
+import itertools
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from allocation import resolveAllocation
+from sweep import SweepResult, runCell
+
+
+def toJson(value):
+    '''JSON form of the parameters and results of the cells, numpy values as plain numbers and lists.'''
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, range):
+        return list(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def getReference(function):
+    '''module:name reference of a module level function, or of a functools.partial of one with keyword arguments.'''
+    keywords = {}
+    if isinstance(function, functools.partial):
+        if function.args:
+            raise Exception('Only keyword arguments of a partial can be stored in the queue.')
+        keywords = function.keywords
+        function = function.func
+    module = function.__module__
+    if module == '__main__':
+        module = os.path.splitext(os.path.basename(sys.modules['__main__'].__file__))[0]
+    return json.dumps({'module': module, 'name': function.__qualname__, 'keywords': keywords}, default=toJson)
+
+
+def resolveReference(reference):
+    reference = json.loads(reference)
+    function = getattr(importlib.import_module(reference['module']), reference['name'])
+    return functools.partial(function, **reference['keywords']) if reference['keywords'] else function
+
+
+class SweepQueue:
+    '''Job queue of sweep cells in a SQLite file.
+
+    Every cell of a sweep is a row that workers claim, run and complete with its JSON result.
+    A claim records the host and pid of the worker and is a lease that the worker renews
+    while it runs the cell. A running cell is handed out again when its worker process on
+    the same host is gone, or when its lease has not been renewed for lease seconds, so
+    cells of crashed or interrupted workers are not lost. Submitting the same sweep again
+    keeps the finished cells. Several processes, also on other machines sharing the file,
+    can work on one queue.'''
+
+    def __init__(self, path, lease=600, timeout=60):
+        self.path = path
+        self.lease = lease
+        self.host = socket.gethostname()
+        self.connection = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.connection.execute('PRAGMA busy_timeout = %d' % (timeout * 1000))
+        self.connection.create_function('alive', 1, isAlive)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS sweeps (name TEXT PRIMARY KEY, axes TEXT, build TEXT, evaluate TEXT, engine TEXT, thread INTEGER);
+            CREATE TABLE IF NOT EXISTS cells (sweep TEXT, cell INTEGER, params TEXT, status TEXT, worker TEXT, host TEXT, pid INTEGER,
+                                              claimed REAL, finished REAL, result TEXT, error TEXT, PRIMARY KEY (sweep, cell));
+            CREATE INDEX IF NOT EXISTS cell_status ON cells (sweep, status);''')
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(cells)')]
+        for column, type in (('host', 'TEXT'), ('pid', 'INTEGER')):
+            if column not in columns:
+                self.connection.execute(f'ALTER TABLE cells ADD COLUMN {column} {type}')
+
+    def close(self):
+        self.connection.close()
+
+    def submit(self, name, grid, build, evaluate, engine='flysim', thread=1):
+        '''Add the cells of the grid {name: values} as pending, keep those already in the queue.'''
+        axes = {axis: list(values) for axis, values in grid.items()}
+        cells = [dict(zip(axes, combination)) for combination in itertools.product(*axes.values())]
+        with self.transaction():
+            row = self.connection.execute('SELECT axes FROM sweeps WHERE name = ?', (name,)).fetchone()
+            axes_json = json.dumps(axes, default=toJson)
+            if row is not None and row[0] != axes_json:
+                raise Exception(f'Sweep {name} is already queued with another grid.')
+            self.connection.execute('INSERT OR REPLACE INTO sweeps VALUES (?, ?, ?, ?, ?, ?)',
+                                    (name, axes_json, getReference(build), getReference(evaluate), engine, thread))
+            self.connection.executemany('INSERT OR IGNORE INTO cells (sweep, cell, params, status) VALUES (?, ?, ?, ?)',
+                                        ((name, cell, json.dumps(params, default=toJson), 'pending') for cell, params in enumerate(cells)))
+
+    def transaction(self):
+        return Transaction(self.connection)
+
+    def claim(self, name, worker):
+        '''Return (cell, params) of the next pending, expired or abandoned cell, now running for worker in this process, or None.'''
+        now = time.time()
+        with self.transaction():
+            row = self.connection.execute("SELECT cell, params FROM cells WHERE sweep = ? AND (status = 'pending' OR (status = 'running' AND "
+                                          "(claimed < ? OR (host = ? AND NOT alive(pid))))) ORDER BY cell LIMIT 1",
+                                          (name, now - self.lease, self.host)).fetchone()
+            if row is None:
+                return None
+            self.connection.execute("UPDATE cells SET status = 'running', worker = ?, host = ?, pid = ?, claimed = ? WHERE sweep = ? AND cell = ?",
+                                    (worker, self.host, os.getpid(), now, name, row[0]))
+        return row[0], json.loads(row[1])
+
+    def renew(self, name, cell, worker):
+        '''Extend the lease of a cell that worker is still running.'''
+        self.connection.execute("UPDATE cells SET claimed = ? WHERE sweep = ? AND cell = ? AND status = 'running' AND worker = ?",
+                                (time.time(), name, cell, worker))
+
+    def complete(self, name, cell, result):
+        self.connection.execute("UPDATE cells SET status = 'done', finished = ?, result = ?, error = NULL WHERE sweep = ? AND cell = ?",
+                                (time.time(), json.dumps(result, default=toJson), name, cell))
+
+    def fail(self, name, cell, error):
+        self.connection.execute("UPDATE cells SET status = 'failed', finished = ?, error = ? WHERE sweep = ? AND cell = ?",
+                                (time.time(), error, name, cell))
+
+    def retryFailed(self, name):
+        self.connection.execute("UPDATE cells SET status = 'pending' WHERE sweep = ? AND status = 'failed'", (name,))
+
+    def getSweep(self, name):
+        row = self.connection.execute('SELECT axes, build, evaluate, engine, thread FROM sweeps WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            raise Exception(f'Unknown sweep {name}.')
+        return {'axes': json.loads(row[0]), 'build': row[1], 'evaluate': row[2], 'engine': row[3], 'thread': row[4]}
+
+    def getProgress(self, name):
+        '''Return {status: number of cells}.'''
+        return dict(self.connection.execute('SELECT status, COUNT(*) FROM cells WHERE sweep = ? GROUP BY status', (name,)).fetchall())
+
+    def getResults(self, name, **fixed):
+        '''Return [(params, result)] of the finished cells whose parameters equal the given values.'''
+        query = "SELECT params, result FROM cells WHERE sweep = ? AND status = 'done'"
+        values = [name]
+        for axis, value in fixed.items():
+            query += ' AND json_extract(params, ?) = ?'
+            values.extend((f'$.{axis}', toJson(value) if isinstance(value, np.generic) else value))
+        return [(json.loads(params), json.loads(result)) for params, result in self.connection.execute(query + ' ORDER BY cell', values)]
+
+    def getSweepResult(self, name):
+        '''SweepResult of the stored results, NaN for the cells not finished yet.'''
+        axes = self.getSweep(name)['axes']
+        rows = self.connection.execute("SELECT cell, result FROM cells WHERE sweep = ? AND status = 'done'", (name,)).fetchall()
+        shape = tuple(len(values) for values in axes.values())
+        if not rows:
+            return SweepResult(axes, np.full(shape, np.nan))
+        results = {cell: np.asarray(json.loads(result), dtype=np.float64) for cell, result in rows}
+        values = np.full((int(np.prod(shape)),) + next(iter(results.values())).shape, np.nan)
+        for cell, result in results.items():
+            values[cell] = result
+        return SweepResult(axes, values.reshape(shape + values.shape[1:]))
+
+
+def isAlive(pid):
+    '''Whether a process of this id runs on this host.'''
+    if pid is None:
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Heartbeat:
+    '''Thread renewing the lease of a running cell every third of the lease, on its own connection.'''
+
+    def __init__(self, path, name, cell, worker, lease):
+        self.args = (path, name, cell, worker, lease)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, error_type, error, trace):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        path, name, cell, worker, lease = self.args
+        queue = SweepQueue(path, lease)
+        try:
+            while not self.stopped.wait(lease / 3):
+                queue.renew(name, cell, worker)
+        finally:
+            queue.close()
+
+
+class Transaction:
+    '''BEGIN IMMEDIATE ... COMMIT block, so a claim reads and updates a cell while other writers wait.'''
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+
+    def __exit__(self, error_type, error, trace):
+        self.connection.execute('ROLLBACK' if error_type else 'COMMIT')
+
+
+def runWorker(path, name, scratch_root=None, keep=False, cache_dir=None):
+    '''Claim and run cells of a queued sweep until none is left, return the number of cells run.'''
+    queue = SweepQueue(path)
+    sweep = queue.getSweep(name)
+    build, evaluate = resolveReference(sweep['build']), resolveReference(sweep['evaluate'])
+    worker = f'{socket.gethostname()}-{os.getpid()}'
+    count = 0
+    try:
+        while True:
+            job = queue.claim(name, worker)
+            if job is None:
+                return count
+            cell, params = job
+            try:
+                with Heartbeat(path, name, cell, worker, queue.lease):
+                    result = runCell(build, evaluate, params, sweep['thread'], sweep['engine'], scratch_root, keep, cache_dir)
+            except Exception:
+                queue.fail(name, cell, traceback.format_exc())
+            else:
+                queue.complete(name, cell, result)
+            count += 1
+    finally:
+        queue.close()
+
+
+def runQueuedSweep(path, name, grid, build, evaluate, workers=None, thread=None, engine='flysim', scratch_root=None, keep=False, cache_dir=None):
+    '''runSweep through a SweepQueue: queue the cells not finished yet, run them with workers
+    processes and return the SweepResult of all stored results.
+
+    build and evaluate must be module level functions, or partials of them with keyword
+    arguments, so that workers started elsewhere with job_queue.py can import them.'''
+    path = os.path.abspath(path)
+    if cache_dir:
+        cache_dir = os.path.abspath(cache_dir)
+    first = {axis: values[0] for axis, values in grid.items()}
+    workers, thread = resolveAllocation(lambda: build(**first), engine, workers, thread)
+    queue = SweepQueue(path)
+    queue.submit(name, grid, build, evaluate, engine, thread)
+    if workers == 1:
+        runWorker(path, name, scratch_root, keep, cache_dir)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(runWorker, path, name, scratch_root, keep, cache_dir) for i in range(workers)]
+            for future in futures:
+                future.result()
+    progress = queue.getProgress(name)
+    if progress.get('failed'):
+        print(f"[Warning] {progress['failed']} cells of {name} failed, see the error column of {path}.")
+    unfinished = progress.get('pending', 0) + progress.get('running', 0)
+    if unfinished:
+        print(f'[Warning] {unfinished} cells of {name} are not finished, they are running in other workers or were abandoned. '
+              f'Run the sweep again to finish them.')
+    result = queue.getSweepResult(name)
+    queue.close()
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Join the workers of a queued sweep, or show its progress.')
+    parser.add_argument('database', type=str, help='Path to the SQLite queue')
+    parser.add_argument('sweep', type=str, help='Name of the sweep')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='Number of worker processes, all cores by default')
+    parser.add_argument('--retry', action='store_true', help='Queue the failed cells again')
+    parser.add_argument('--status', action='store_true', help='Only print the number of cells per status')
+    args = parser.parse_args()
+
+    queue = SweepQueue(args.database)
+    if args.retry:
+        queue.retryFailed(args.sweep)
+    if not args.status:
+        sweep = queue.getSweep(args.sweep)
+        first = {axis: values[0] for axis, values in sweep['axes'].items()}
+        workers, thread = resolveAllocation(lambda: resolveReference(sweep['build'])(**first), sweep['engine'], args.workers, sweep['thread'])
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(runWorker, os.path.abspath(args.database), args.sweep) for i in range(workers)]
+            print(f'{sum(future.result() for future in futures)} cells run')
+    print(queue.getProgress(args.sweep))
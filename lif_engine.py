@@ -0,0 +1,265 @@
+import numpy as np
+
+from firing_rate import getFiringRates
+from spike_store import SpikeStore
+
+
+class LIFEngine:
+    '''Fixed-step, vectorized LIF engine running a FlysimSNN in-process instead of the flysim binary.
+
+    Units follow the flysim conventions: time in ms, potentials in mV, capacitance in nF,
+    conductances (MeanExtEff, MeanEff*weight) in nS, GaussMean/GaussSTD of the membrane
+    noise in pA. Spike times in the outputs are in seconds, neurons are numbered globally
+    in the order the populations were added, exactly like the flysim spike files.
+
+    All trials advance together along the first axis of the state arrays. Every trial owns
+    a random generator spawned from the seed, so a trial gives the same spikes whatever
+    the number of trials simulated alongside it.'''
+
+    version = '4'
+    record_dtype = np.dtype([('trial', np.int32), ('time', np.float64), ('neuron', np.int32)])
+    max_block = 1000
+    max_draws = 2**22
+
+    def __init__(self, snn, dt=0.1, seed=None):
+        self.dt = dt
+        self.seed = snn.seed if seed is None else seed
+        self.protocol = snn.protocol
+        self.network = snn.compile()
+        self.loadNetwork(self.network)
+        self.events = self.protocol.table.getEvents()
+        self.events_processed = 0
+        self.reset()
+
+    def loadNetwork(self, network):
+        '''Take the neuron, receptor and synapse arrays of the CompiledNetwork.'''
+        self.pop_index = network.pop_index
+        self.num_pop = network.num_pop
+        self.num_neuron = network.num_neuron
+        self.offsets = network.offsets
+        self.pop_of_neuron = network.pop_of_neuron
+        self.capacitance = network.capacitance
+        self.taum = network.taum
+        self.threshold = network.threshold
+        self.restpot = network.restpot
+        self.resetpot = network.resetpot
+        self.refracperiod = network.refracperiod
+        self.receptor_types = network.receptor_types
+        self.receptor_index = network.receptor_index
+        self.tau = network.tau
+        self.revpot = network.revpot
+        self.has_receptor = network.has_receptor
+        self.init_freq_ext = network.init_freq_ext
+        self.ext_eff = network.ext_eff
+        self.ext_conn = network.ext_conn
+        self.is_nmda = network.is_nmda
+        self.any_nmda = bool(self.is_nmda.any())
+        self.membrane_scale = 1000.0 * self.capacitance
+        self.g_stride = len(self.receptor_types) * self.num_neuron
+        self.decay = np.exp(-self.dt / self.tau)[:, self.pop_of_neuron]
+        self.neuron_revpot = self.revpot[:, self.pop_of_neuron]
+
+    def reset(self, trials=1):
+        self.trials = trials
+        self.rngs = [np.random.default_rng(seed) for seed in np.random.SeedSequence(self.seed).spawn(trials)]
+        self.t = 0.0
+        self.step_count = 0
+        self.next_event = 0
+        self.v = np.tile(self.restpot, (trials, 1))
+        self.g = np.zeros((trials, len(self.receptor_types), self.num_neuron))
+        self.refractory_end = np.full((trials, self.num_neuron), -np.inf)
+        self.freq_ext = self.init_freq_ext.copy()
+        self.noise_mean = np.zeros(self.num_pop)
+        self.noise_std = np.zeros(self.num_pop)
+        self.spiked = np.zeros((trials, self.num_neuron), dtype=bool)
+        self.spike_trial = self.spike_neuron = np.zeros(0, dtype=np.int64)
+        self.trial_ids = np.arange(trials)
+        self.block_left = 0
+
+    def dropTrials(self, keep):
+        '''Stop simulating the trials whose keep flag is False, the others continue unchanged.'''
+        self.trial_ids = self.trial_ids[keep]
+        self.rngs = [rng for rng, kept in zip(self.rngs, keep) if kept]
+        self.trials = len(self.rngs)
+        self.v = self.v[keep]
+        self.g = self.g[keep]
+        self.refractory_end = self.refractory_end[keep]
+        self.spiked = self.spiked[keep]
+        self.spike_trial, self.spike_neuron = np.nonzero(self.spiked)
+        if self.block_left:
+            self.ext_block = self.ext_block[:, keep]
+            if self.noise_neuron.size:
+                self.noise_block = self.noise_block[:, keep]
+
+    def resolveTargets(self, name):
+        if name in self.protocol.groups:
+            return [self.pop_index[member] for member in self.protocol.groups[name] if member in self.pop_index]
+        elif name in self.pop_index:
+            return [self.pop_index[name]]
+        return []
+
+    def applyEvent(self, event):
+        for p in self.resolveTargets(event['to']):
+            if event['type'] == 'ChangeExtFreq':
+                r = self.receptor_index.get(event['receptor'])
+                if r is not None:
+                    self.freq_ext[r, p] = event['hz']
+            elif event['type'] == 'ChangeMembraneNoise':
+                self.noise_mean[p] = event['mean']
+                self.noise_std[p] = event['std']
+
+    def drawBlock(self):
+        '''Pre-draw the external Poisson spikes and noise of every trial until the next protocol event.'''
+        num_step = self.max_block
+        if self.next_event < len(self.events):
+            until_event = int(np.ceil((self.events[self.next_event]['time'] - self.t) / self.dt - 1e-9))
+            num_step = max(1, min(num_step, until_event))
+        lam = self.freq_ext * self.ext_conn * self.has_receptor * self.dt / 1000.0
+        r, p = np.nonzero(lam * self.ext_eff)
+        neurons = [np.arange(self.offsets[q], self.offsets[q+1]) for q in p]
+        if neurons:
+            channel_r = np.repeat(r, [n.size for n in neurons])
+            channel_neuron = np.concatenate(neurons)
+        else:
+            channel_r = channel_neuron = np.zeros(0, dtype=np.int64)
+        self.channel_flat = channel_r * self.num_neuron + channel_neuron
+        self.channel_eff = self.ext_eff[channel_r, self.pop_of_neuron[channel_neuron]]
+        channel_lam = lam[channel_r, self.pop_of_neuron[channel_neuron]]
+        self.noise_neuron = np.flatnonzero(self.noise_std[self.pop_of_neuron])
+        self.neuron_noise_mean = self.noise_mean[self.pop_of_neuron]
+        self.any_noise_mean = bool(self.neuron_noise_mean.any())
+        num_step = max(1, min(num_step, self.max_draws // (self.trials * max(channel_lam.size, self.noise_neuron.size, 1))))
+        # The blocks hold the conductance and current increments, so a step only adds them.
+        self.ext_block = np.stack([rng.poisson(channel_lam, size=(num_step, channel_lam.size)) for rng in self.rngs], axis=1) * self.channel_eff
+        if self.noise_neuron.size:
+            noise = np.stack([rng.standard_normal((num_step, self.noise_neuron.size)) for rng in self.rngs], axis=1)
+            self.noise_block = self.noise_std[self.pop_of_neuron[self.noise_neuron]] * noise / np.sqrt(self.dt)
+        self.block_left = num_step
+        self.block_pos = 0
+
+    def step(self):
+        '''Advance every trial by one time step and return the (trial, neuron) mask of neurons that fired.'''
+        event_applied = False
+        while self.next_event < len(self.events) and self.events[self.next_event]['time'] <= self.t + 1e-9:
+            self.applyEvent(self.events[self.next_event])
+            self.next_event += 1
+            self.events_processed += self.trials
+            event_applied = True
+        if event_applied or self.block_left == 0:
+            self.drawBlock()
+        dt = self.dt
+
+        self.g *= self.decay
+        if self.spike_neuron.size:
+            # Column r*N + n of a synapse is its receptor row in the flattened g of one trial.
+            position, column, weight = self.network.synapses.gather(self.spike_neuron)
+            flat = column if self.trials == 1 else self.spike_trial[position] * self.g_stride + column
+            g_flat = self.g.reshape(-1)
+            if 16 * flat.size > g_flat.size:
+                g_flat += np.bincount(flat, weight, g_flat.size)
+            else:
+                np.add.at(g_flat, flat, weight)
+        if self.channel_flat.size:
+            g_flat = self.g.reshape(self.trials, -1)
+            g_flat[:, self.channel_flat] += self.ext_block[self.block_pos]
+
+        driving = self.neuron_revpot - self.v[:, None, :]
+        if self.any_nmda:
+            gated = self.g.copy()
+            gated[:, self.is_nmda] /= (1.0 + np.exp(-0.062 * self.v) / 3.57)[:, None, :]
+            current = (gated * driving).sum(axis=1)
+        else:
+            current = (self.g * driving).sum(axis=1)
+        if self.any_noise_mean:
+            current += self.neuron_noise_mean
+        if self.noise_neuron.size:
+            current[:, self.noise_neuron] += self.noise_block[self.block_pos]
+        dv = ((self.restpot - self.v) / self.taum + current / self.membrane_scale) * dt
+        self.block_pos += 1
+        self.block_left -= 1
+
+        self.step_count += 1
+        self.t = self.step_count * dt
+        self.v = np.where(self.refractory_end <= self.t, self.v + dv, self.resetpot)
+        self.spiked = self.v >= self.threshold
+        trial, neuron = np.nonzero(self.spiked)
+        if neuron.size:
+            self.v[trial, neuron] = self.resetpot[neuron]
+            self.refractory_end[trial, neuron] = self.t + self.refracperiod[neuron]
+        self.spike_trial, self.spike_neuron = trial, neuron
+        return self.spiked
+
+    def buildRecords(self, steps, trial_ids, neurons):
+        records = np.zeros(sum(neuron.size for neuron in neurons), dtype=self.record_dtype)
+        if neurons:
+            records['trial'] = np.concatenate(trial_ids)
+            records['time'] = np.concatenate(steps) * self.dt / 1000.0
+            records['neuron'] = np.concatenate(neurons)
+        return records
+
+    def runTrials(self, trials=1, callback=None, callback_interval=10.0):
+        '''Simulate all trials in one batch and return the spike records sorted by trial and time.
+
+        Every callback_interval ms, callback(t, records) receives the spike records produced
+        since its previous call and returns a boolean array over all trials telling which ones
+        are still needed; the others stop being simulated.'''
+        self.reset(trials)
+        num_step = int(round(self.protocol.endTime / self.dt))
+        callback_steps = max(1, int(round(callback_interval / self.dt)))
+        steps, trial_ids, neurons = [], [], []
+        delivered = 0
+        for i in range(num_step):
+            if self.trials == 0:
+                break
+            self.step()
+            trial, neuron = self.spike_trial, self.spike_neuron
+            if neuron.size:
+                steps.append(np.full(neuron.size, i + 1))
+                trial_ids.append(self.trial_ids[trial])
+                neurons.append(neuron)
+            if callback is not None and ((i + 1) % callback_steps == 0 or i + 1 == num_step):
+                needed = callback(self.t, self.buildRecords(steps[delivered:], trial_ids[delivered:], neurons[delivered:]))
+                delivered = len(steps)
+                keep = np.asarray(needed, dtype=bool)[self.trial_ids]
+                if not keep.all():
+                    self.dropTrials(keep)
+        records = self.buildRecords(steps, trial_ids, neurons)
+        return records[np.argsort(records['trial'], kind='stable')]
+
+    def outputMask(self, target):
+        mask = np.zeros(self.num_neuron, dtype=bool)
+        if target == 'AllPopulation':
+            mask[:] = True
+        for p in self.resolveTargets(target):
+            mask[self.offsets[p]:self.offsets[p+1]] = True
+        return mask
+
+    def getRateRecords(self, records, iterations, outfile):
+        '''FiringRate output computed from the spike records: one (trial, time, rate per population) record per step.'''
+        if outfile['population'] == 'AllPopulation':
+            populations = list(range(self.num_pop))
+        else:
+            populations = self.resolveTargets(outfile['population'])
+        store = SpikeStore.fromRecords(records, iterations, self.offsets)
+        times, rates = getFiringRates(store, populations, self.offsets, outfile['window'], outfile['step'], self.protocol.endTime)
+        dtype = np.dtype([('trial', np.int32), ('time', np.float64), ('rate', np.float64, (len(populations),))])
+        rate_records = np.zeros(iterations * len(times), dtype=dtype)
+        rate_records['trial'] = np.repeat(np.arange(iterations), len(times))
+        rate_records['time'] = np.tile(times, iterations)
+        rate_records['rate'] = rates.reshape(-1, len(populations))
+        return rate_records
+
+    def run(self, iterations=1, callback=None, callback_interval=10.0):
+        '''Run the trials and return {output file name: spike records, or rate records of FiringRate outputs, of all trials}.'''
+        records = self.runTrials(iterations, callback, callback_interval)
+        outputs = {}
+        for outfile in self.protocol.outfiles:
+            if outfile['type'] == 'FiringRate':
+                outputs[outfile['name']] = self.getRateRecords(records, iterations, outfile)
+                continue
+            if outfile['type'] != 'Spike':
+                print(f"[Warning] {outfile['type']} output is not supported by the numpy engine, skip.")
+                continue
+            mask = self.outputMask(outfile['population'])
+            outputs[outfile['name']] = records[mask[records['neuron']]]
+        return outputs
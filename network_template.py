@@ -0,0 +1,119 @@
+import itertools
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from allocation import resolveAllocation
+from sweep import SweepResult, robustness, simulateCell
+
+
+class NetworkTemplate:
+    '''A network built and compiled once, whose named parameters are patched in place between runs.
+
+    cell is a FlysimSNN or an object holding one in .sim, like an SNNSequenceControl.
+    Connection parameters (MeanEff or Weight), receptor parameters and fields of protocol
+    events are declared under a name, and setParameters writes the new values into the
+    registry, the compiled arrays and the events. The network is not rebuilt and its
+    sampled connectivity is shared by all runs. Connectivity and the population sizes
+    are structure and cannot be parameters.'''
+
+    def __init__(self, cell):
+        self.cell = cell
+        self.snn = cell.sim if hasattr(cell, 'sim') else cell
+        self.parameters = {}
+        self.snn.compile()
+
+    def declareConnection(self, name, sources, target, receptor=None, field='MeanEff'):
+        '''Declare the MeanEff or Weight of the connections from sources (a name or a list) to target.'''
+        if field not in ('MeanEff', 'Weight'):
+            raise Exception(f'Unknown connection parameter {field}.')
+        registry = self.snn.registry
+        sources = [sources] if isinstance(sources, str) else sources
+        source_ids = [registry.index[source] for source in sources if source in registry.index]
+        mask = np.isin(registry.targets.column('source'), source_ids) & (registry.targets.column('target') == registry.index.get(target, -1))
+        if receptor is not None:
+            mask &= registry.targets.column('receptor') == registry.type_codes.get(receptor, -1)
+        rows = np.flatnonzero(mask)
+        if not rows.size:
+            raise Exception(f'No connection from {sources} to {target}.')
+        entries = np.flatnonzero(np.isin(self.snn.compiled.synapse_rows, rows))
+        self.parameters[name] = ('targets', field, rows, entries)
+
+    def declareReceptor(self, name, populations, receptor_type, field='FreqExt'):
+        '''Declare a receptor parameter (Tau, ReversePotential, FreqExt, MeanExtEff, MeanExtCon) of populations.'''
+        registry = self.snn.registry
+        populations = [populations] if isinstance(populations, str) else populations
+        ids = [registry.index[population] for population in populations if population in registry.index]
+        rows = np.flatnonzero(np.isin(registry.receptors.column('population'), ids) &
+                              (registry.receptors.column('type') == registry.type_codes.get(receptor_type, -1)))
+        if not rows.size:
+            raise Exception(f'No {receptor_type} receptor in {populations}.')
+        self.parameters[name] = ('receptors', field, rows, None)
+
+    def declareEvents(self, name, events, field='hz', offsets=None):
+        '''Declare a field of protocol events, set to offsets[i] + value for event i when offsets are given,
+        e.g. the end times of stimuli from their durations.'''
+        self.parameters[name] = ('events', field, list(events), offsets)
+
+    def setParameters(self, **values):
+        registry = self.snn.registry
+        compiled = self.snn.compiled
+        for name, value in values.items():
+            if name not in self.parameters:
+                raise Exception(f'Unknown template parameter {name}.')
+            table, field, rows, extra = self.parameters[name]
+            if table == 'events':
+                for i, event in enumerate(rows):
+                    event[field] = value if extra is None else extra[i] + value
+                continue
+            for row in rows:
+                registry.set(getattr(registry, table), field, row, value)
+            if table == 'targets':
+                compiled.patchSynapses(registry, extra)
+            else:
+                compiled.patchReceptors(registry, rows)
+
+
+def runTemplateCells(build, evaluate, cells, thread, engine, scratch_root, keep):
+    '''Build one template and run the cells on it inside a scratch directory.'''
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='template_', dir=scratch_root)
+    os.chdir(workdir)
+    try:
+        template = build()
+        results = []
+        for params in cells:
+            template.setParameters(**params)
+            simulateCell(template.cell, thread, engine)
+            results.append(evaluate(template.cell))
+        return results
+    finally:
+        os.chdir(cwd)
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def runTemplateSweep(grid, build, evaluate=robustness, workers=None, thread=None, engine='numpy', scratch_root=None, keep=False):
+    '''runSweep over the parameters of a NetworkTemplate: every worker calls build() once and
+    patches it for each of its cells. build and evaluate must be module level functions.'''
+    axes = {name: list(values) for name, values in grid.items()}
+    cells = [dict(zip(axes, combination)) for combination in itertools.product(*axes.values())]
+    workers, thread = resolveAllocation(build, engine, workers, thread)
+    workers = max(1, min(workers, len(cells)))
+    # Interleaved chunks, so the expensive corners of the grid are spread over the workers.
+    chunks = [cells[w::workers] for w in range(workers)]
+    if workers == 1:
+        chunk_results = [runTemplateCells(build, evaluate, cells, thread, engine, scratch_root, keep)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(runTemplateCells, build, evaluate, chunk, thread, engine, scratch_root, keep) for chunk in chunks]
+            chunk_results = [future.result() for future in futures]
+    results = [None] * len(cells)
+    for w, chunk in enumerate(chunk_results):
+        results[w::workers] = chunk
+    shape = tuple(len(values) for values in axes.values())
+    results = np.array(results)
+    return SweepResult(axes, results.reshape(shape + results.shape[1:]))
@@ -0,0 +1,223 @@
+import itertools
+
+import numpy as np
+
+# Types of the values stored as integers, looked up by type so a block of rows is checked without isinstance calls.
+INTEGER_TYPES = frozenset([int, bool] + [type for type in set(np.sctypeDict.values()) if issubclass(type, np.integer)])
+PLAIN_TYPES = frozenset([int, float])
+
+
+class ColumnTable:
+    '''Growable table of numeric numpy columns, stored as the columns of one 2D array.
+
+    Appended rows wait in a list and are written to the array in one block on the next read.
+    Every value also records whether it was given as an integer, so get() returns the int or
+    float it was given and the conf text prints it unchanged.'''
+
+    def __init__(self, columns, capacity=64):
+        self.columns = columns
+        self.positions = {name: c for c, name in enumerate(columns)}
+        self.size = 0
+        self.pending = []
+        self.values = np.zeros((capacity, len(columns)))
+        self.integral = np.zeros((capacity, len(columns)), dtype=bool)
+
+    def __len__(self):
+        return self.size + len(self.pending)
+
+    def append(self, *values):
+        self.pending.append(values)
+        return self.size + len(self.pending) - 1
+
+    def reserve(self, size):
+        if size > len(self.values):
+            capacity = max(size, 2 * len(self.values))
+            self.values = np.concatenate((self.values[:self.size], np.zeros((capacity - self.size, len(self.columns)))))
+            self.integral = np.concatenate((self.integral[:self.size], np.zeros((capacity - self.size, len(self.columns)), dtype=bool)))
+
+    def flush(self):
+        if not self.pending:
+            return
+        size = self.size + len(self.pending)
+        self.reserve(size)
+        count = len(self.pending) * len(self.columns)
+        self.values[self.size:size] = np.fromiter(itertools.chain.from_iterable(self.pending), np.float64, count).reshape(len(self.pending), -1)
+        types = map(type, itertools.chain.from_iterable(self.pending))
+        self.integral[self.size:size] = np.fromiter(map(INTEGER_TYPES.__contains__, types), bool, count).reshape(len(self.pending), -1)
+        self.size = size
+        self.pending = []
+
+    def extend(self, columns, integral):
+        '''Append a block of rows given as {name: array or value}, with {name: bool array or bool} telling the integer values.'''
+        self.flush()
+        count = len(columns[self.columns[0]])
+        size = self.size + count
+        self.reserve(size)
+        for c, name in enumerate(self.columns):
+            self.values[self.size:size, c] = columns[name]
+            self.integral[self.size:size, c] = integral[name]
+        self.size = size
+
+    def take(self, rows):
+        '''Keep only the given rows, in the given order.'''
+        self.flush()
+        self.values = self.values[:self.size][rows]
+        self.integral = self.integral[:self.size][rows]
+        self.size = len(rows)
+
+    def get(self, name, row):
+        self.flush()
+        c = self.positions[name]
+        value = self.values[row, c]
+        return int(value) if self.integral[row, c] else float(value)
+
+    def set(self, name, row, value):
+        self.flush()
+        c = self.positions[name]
+        self.values[row, c] = value
+        self.integral[row, c] = isinstance(value, (int, np.integer))
+
+    def column(self, name):
+        self.flush()
+        return self.values[:self.size, self.positions[name]]
+
+    def getValues(self, name, rows=None):
+        '''The column, or the given rows of it, as a list of the int and float values given, e.g. to print many rows.'''
+        if self.size == 0 and self.pending:
+            # Nothing written to the array yet, e.g. a network built to write its conf: read the rows as given.
+            c = self.positions[name]
+            values = [row[c] for row in self.pending] if rows is None else [self.pending[row][c] for row in rows]
+            if PLAIN_TYPES.issuperset(map(type, values)):
+                return values
+            return [int(value) if type(value) in INTEGER_TYPES else float(value) for value in values]
+        self.flush()
+        c = self.positions[name]
+        values, integral = self.values[:self.size, c], self.integral[:self.size, c]
+        if rows is not None:
+            values, integral = values[rows], integral[rows]
+        if not integral.any():
+            return values.tolist()
+        if integral.all():
+            return values.astype(np.int64).tolist()
+        mixed = values.astype(object)
+        mixed[integral] = values[integral].astype(np.int64).astype(object)
+        return mixed.tolist()
+
+
+class PopulationRegistry:
+    '''Array storage of the populations, receptors and target connections of a FlysimSNN.
+
+    Populations are numbered in insertion order, receptors and targets are rows of their own
+    tables pointing at those ids and listed per population, receptor type names are stored as
+    codes. version changes on every modification so derived forms such as the CompiledNetwork
+    know when to rebuild. headers, receptor_texts and target_texts keep the conf text given with
+    every population, receptor and target, listed per population, until the population is
+    written or changes; then they are None. texts keeps the whole conf text of populations
+    written before, dropped when the population or one of its receptors or targets changes.'''
+
+    population_columns = ('N', 'Capacitance', 'LeakyConductance', 'Taum', 'Threshold', 'RestingPotential',
+                          'ResetPotential', 'RefractoryPeriod', 'SpikeDelay', 'SelfConnection', 'spike_count')
+    receptor_columns = ('population', 'type', 'Tau', 'ReversePotential', 'FreqExt', 'MeanExtEff', 'MeanExtCon')
+    target_columns = ('source', 'target', 'receptor', 'MeanEff', 'Weight', 'Connectivity')
+
+    def __init__(self):
+        self.names = []
+        self.index = {}
+        self.layers = {}
+        self.populations = ColumnTable(self.population_columns)
+        self.receptors = ColumnTable(self.receptor_columns)
+        self.targets = ColumnTable(self.target_columns)
+        self.receptor_rows = []
+        self.target_rows = []
+        self.headers = []
+        self.receptor_texts = []
+        self.target_texts = []
+        self.texts = {}
+        self.type_names = []
+        self.type_codes = {}
+        self.version = 0
+
+    def __len__(self):
+        return len(self.names)
+
+    def getTypeCode(self, type_name):
+        code = self.type_codes.get(type_name)
+        if code is None:
+            code = self.type_codes[type_name] = len(self.type_names)
+            self.type_names.append(type_name)
+        return code
+
+    def addPopulation(self, name, *values, text=None):
+        id = self.populations.append(*values, 0)
+        self.names.append(name)
+        self.index[name] = id
+        self.receptor_rows.append([])
+        self.target_rows.append([])
+        self.headers.append(text)
+        self.receptor_texts.append([])
+        self.target_texts.append([])
+        self.version += 1
+        return id
+
+    def addReceptor(self, population, type_name, *values, text=None):
+        self.version += 1
+        code = self.type_codes.get(type_name)
+        row = self.receptors.append(population, self.getTypeCode(type_name) if code is None else code, *values)
+        self.receptor_rows[population].append(row)
+        texts = self.receptor_texts[population]
+        if texts is not None and text is not None:
+            texts.append(text)
+        else:
+            self.receptor_texts[population] = None
+        self.texts.pop(population, None)
+        return row
+
+    def addTarget(self, source, target, receptor, *values, text=None):
+        self.version += 1
+        code = self.type_codes.get(receptor)
+        row = self.targets.append(source, target, self.getTypeCode(receptor) if code is None else code, *values)
+        self.target_rows[source].append(row)
+        texts = self.target_texts[source]
+        if texts is not None and text is not None:
+            texts.append(text)
+        else:
+            self.target_texts[source] = None
+        self.texts.pop(source, None)
+        return row
+
+    def set(self, table, name, row, value):
+        table.set(name, row, value)
+        self.version += 1
+        if table is self.receptors:
+            population = table.get('population', row)
+            self.receptor_texts[population] = None
+            self.texts.pop(population, None)
+        elif table is self.targets:
+            source = table.get('source', row)
+            self.target_texts[source] = None
+            self.texts.pop(source, None)
+        elif name != 'spike_count':
+            self.headers[row] = None
+            self.texts.pop(row, None)
+
+    def groupRows(self, table, key):
+        '''Rows of a table grouped by population, in insertion order: (rows, first row index of every population).'''
+        rows = np.argsort(table.column(key), kind='stable')
+        bounds = np.searchsorted(table.column(key)[rows], np.arange(len(self.names) + 1))
+        return rows, bounds
+
+    def updateDigest(self, digest):
+        '''Feed every stored parameter of the populations, receptors and targets into a hashlib digest,
+        e.g. to key cached simulations. spike_count is a result, not a parameter, and is left out.'''
+        digest.update('\0'.join(self.names).encode() + b'\1' + '\0'.join(self.type_names).encode() + b'\1')
+        parameters = [name for name in self.population_columns if name != 'spike_count']
+        for table, columns in ((self.populations, parameters), (self.receptors, self.receptor_columns), (self.targets, self.target_columns)):
+            table.flush()
+            digest.update(np.int64(table.size).tobytes())
+            digest.update(np.ascontiguousarray(table.values[:table.size, [table.positions[name] for name in columns]]).tobytes())
+
+    def getEdges(self):
+        '''Unique (source, target) population id pairs of the target connections.'''
+        pairs = np.stack((self.targets.column('source'), self.targets.column('target')), axis=1).astype(np.int64)
+        _, first = np.unique(pairs, axis=0, return_index=True)
+        return pairs[np.sort(first)]
@@ -0,0 +1,207 @@
+import argparse
+import glob
+import json
+import os
+import resource
+import time
+import tracemalloc
+from contextlib import nullcontext
+
+# Profiler that the phase and count calls of the simulation code report to, None when profiling is off.
+active = None
+NULL_PHASE = nullcontext()
+
+
+class Profiler:
+    '''Wall time of the phases of simulation runs, with counters and peak memory.
+
+    Phases nest and every one is kept as a span with its arguments, its duration and the
+    peak resident memory (KB) of the process and of its finished subprocesses, like flysim,
+    at its end. Resident peaks only grow over the life of a process. With trace_memory the
+    peak of the Python allocations inside every phase is recorded too, at the price of
+    slowing down allocation heavy code.'''
+
+    def __init__(self, name='run', trace_memory=False):
+        self.name = name
+        self.trace_memory = trace_memory
+        self.spans = []
+        self.counters = {}
+        self.stack = []
+        self.pid = os.getpid()
+        self.origin = time.time() - time.perf_counter()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def phase(self, name, **args):
+        return Phase(self, name, args)
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def getSummary(self):
+        '''Return {phase: {'calls', 'time' (s)}}. Times of nested phases are also part of the enclosing ones.'''
+        summary = {}
+        for span in self.spans:
+            entry = summary.setdefault(span['name'], {'calls': 0, 'time': 0.0})
+            entry['calls'] += 1
+            entry['time'] += span['duration']
+        return summary
+
+    def getRecord(self):
+        '''JSON record of the run: spans in start order with start times (s) since the epoch.'''
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        spans = sorted(self.spans, key=lambda span: span['start'])
+        return {'name': self.name, 'pid': self.pid, 'phases': self.getSummary(), 'counters': dict(self.counters),
+                'max_rss': usage, 'children_max_rss': children,
+                'spans': [dict(span, start=self.origin + span['start']) for span in spans]}
+
+    def saveJson(self, path):
+        with open(path, 'w') as out:
+            json.dump(self.getRecord(), out, indent=1)
+
+    def saveTrace(self, path):
+        saveTrace([self.getRecord()], path)
+
+
+class Phase:
+    '''Context manager of one span of a Profiler.'''
+    __slots__ = ('profiler', 'name', 'args', 'start', 'child_peak')
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+        self.child_peak = 0
+
+    def __enter__(self):
+        profiler = self.profiler
+        if profiler.trace_memory:
+            tracemalloc.reset_peak()
+        profiler.stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, error_type, error, trace):
+        end = time.perf_counter()
+        profiler = self.profiler
+        profiler.stack.pop()
+        span = {'name': self.name, 'start': self.start, 'duration': end - self.start, 'depth': len(profiler.stack), 'args': self.args,
+                'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                'children_max_rss': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss}
+        if profiler.trace_memory:
+            # tracemalloc has a single peak, so the enclosing phase takes over the peaks of its children.
+            peak = max(tracemalloc.get_traced_memory()[1], self.child_peak)
+            span['python_peak'] = peak
+            if profiler.stack:
+                parent = profiler.stack[-1]
+                parent.child_peak = max(parent.child_peak, peak)
+            tracemalloc.reset_peak()
+        if error_type is not None:
+            span['error'] = error_type.__name__
+        profiler.spans.append(span)
+
+
+def phase(name, **args):
+    '''Span of the active profiler, a shared no-op context when profiling is off.'''
+    if active is None:
+        return NULL_PHASE
+    return active.phase(name, **args)
+
+
+def count(name, value=1):
+    if active is not None:
+        active.count(name, value)
+
+
+def enable(profiler=None):
+    '''Make profiler, or a new Profiler, the one the simulation code reports to in this process.'''
+    global active
+    active = profiler if profiler is not None else Profiler()
+    return active
+
+
+def disable():
+    '''Stop profiling and return the profiler that was active.'''
+    global active
+    profiler, active = active, None
+    return profiler
+
+
+def getTraceEvents(record):
+    '''Chrome trace events of a run record, one complete event per span and the counters at its end.'''
+    pid = record['pid']
+    events = []
+    end = 0.0
+    for span in record['spans']:
+        args = dict(span['args'], max_rss=span['max_rss'], children_max_rss=span['children_max_rss'])
+        if 'python_peak' in span:
+            args['python_peak'] = span['python_peak']
+        events.append({'name': span['name'], 'ph': 'X', 'pid': pid, 'tid': 0, 'ts': span['start'] * 1e6,
+                       'dur': span['duration'] * 1e6, 'args': args})
+        end = max(end, span['start'] + span['duration'])
+    if record['counters'] and record['spans']:
+        events.append({'name': 'counters', 'ph': 'C', 'pid': pid, 'tid': 0, 'ts': end * 1e6, 'args': record['counters']})
+    return events
+
+
+def saveTrace(records, path):
+    '''Write the spans of the records as one Chrome trace file, to open in chrome://tracing or Perfetto.'''
+    events = []
+    for record in records:
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': record['pid'], 'args': {'name': f"worker {record['pid']}"}})
+        events.extend(getTraceEvents(record))
+    with open(path, 'w') as out:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, out)
+
+
+def loadRecords(directory):
+    records = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.json'))):
+        with open(path) as record:
+            record = json.load(record)
+        if 'spans' in record:
+            records.append(record)
+    return records
+
+
+def printSummary(records):
+    '''Print the total time of every phase over the records, its share of the top level time, the counters and peak memory.'''
+    phases = {}
+    counters = {}
+    total = 0.0
+    for record in records:
+        for name, entry in record['phases'].items():
+            phase_total = phases.setdefault(name, {'calls': 0, 'time': 0.0})
+            phase_total['calls'] += entry['calls']
+            phase_total['time'] += entry['time']
+        for name, value in record['counters'].items():
+            counters[name] = counters.get(name, 0) + value
+        total += sum(span['duration'] for span in record['spans'] if span['depth'] == 0)
+    print(f'{len(records)} runs, {total:.3f} s in top level phases')
+    for name, entry in sorted(phases.items(), key=lambda item: -item[1]['time']):
+        share = 100 * entry['time'] / total if total else 0.0
+        print(f"{name:>20s} {entry['calls']:8d} calls {entry['time']:10.3f} s {share:6.1f} %")
+    for name, value in counters.items():
+        print(f'{name:>20s} {value}')
+    if records:
+        print(f"peak memory {max(record['max_rss'] for record in records) / 1024:.1f} MB, "
+              f"subprocesses {max(record['children_max_rss'] for record in records) / 1024:.1f} MB")
+
+
+def summarizeDirectory(directory, trace_path=None):
+    '''Print the summary of the run records in directory and merge them into a Chrome trace at trace_path.'''
+    records = loadRecords(directory)
+    printSummary(records)
+    if trace_path:
+        saveTrace(records, trace_path)
+    return records
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Summarize the run records of a profiled sweep and merge them into one Chrome trace.')
+    parser.add_argument('directory', type=str, help='Directory of the JSON run records')
+    parser.add_argument('-o', '--output', type=str, help='Path to the Chrome trace file')
+    args = parser.parse_args()
+
+    summarizeDirectory(args.directory, args.output)
@@ -4,12 +4,17 @@ import subprocess
 import matplotlib.pyplot as plt
 import numpy as np
 
+from flysim_parser import loadNetwork
+from raster_image import drawRaster
+from spike_store import SpikeStore
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('-c', '--conf', type=str, help='Path to conf file')
     parser.add_argument('-p', '--pro', type=str, help='Path to pro file')
     parser.add_argument('-n', '--num-trial', type=int, help='Number of trials')
     parser.add_argument('-s', '--sim-version', type=int, help='Simulator version')
+    parser.add_argument('-e', '--engine', choices=['flysim', 'numpy'], default='flysim', help='Simulation engine')
     args = parser.parse_args()
 
     if args.sim_version == 7:
@@ -22,14 +27,20 @@ if __name__ == '__main__':
 
     timer = 0.0
     time = np.linspace(0, 3, 60)
-    ord_spikes = [[] for i in range(50)]
-    task_spikes = [[] for i in range(50)]
+    raster_times, raster_neurons = [], []
     ord_counts = [[0] for i in range(5)]
     last_time = 0.0
     counts = [0 for i in range(5)]
 
+    if args.engine != 'flysim':
+        snn = loadNetwork(args.conf, args.pro, iterations=1)
+
     for trial in range(args.num_trial):
-        subprocess.call([flysim_target, '-conf', args.conf, '-pro', args.pro])
+        if args.engine == 'flysim':
+            subprocess.call([flysim_target, '-conf', args.conf, '-pro', args.pro])
+        else:
+            snn.seed = trial + 1
+            snn.start(engine=args.engine)
         #with open('ordinal.dat', 'r') as rate_file:
         #    for line in rate_file:
         #        line_parse = line.split(' ')
@@ -39,27 +50,25 @@ if __name__ == '__main__':
         #        ord2.append(float(line_parse[3]))
         #        ord3.append(float(line_parse[4]))
         #        ord4.append(float(line_parse[5]))
-        with open('task.dat', 'r') as spike_file:
-            for event in spike_file:
-                t, neuron = event.split(' ')
-                task_spikes[int(neuron)-120].append(float(t))
-
-        with open('ordinal.dat', 'r') as spike_file:
-            for event in spike_file:
-                t, neuron = event.split(' ')
-                ord_spikes[int(neuron)].append(float(t))
+        times, neurons = SpikeStore.fromFlysim('task.dat', 1).getTrial(0)
+        raster_times.append(times)
+        raster_neurons.append(neurons - 120 + 50)
 
-                while (float(t) - timer) >= 0:
-                    timer += 0.0001
-                    if (timer - last_time) >= 0.05:
-                        last_time = timer
-                        sum_count = sum(counts) if sum(counts) != 0 else 1
-                        ratio = [x/sum_count for x in counts]
-                        for num, count in enumerate(ratio):
-                            ord_counts[num].append(count)
-                        counts = [0 for i in range(5)]
-                
-                counts[int(neuron)//10] += 1
+        times, neurons = SpikeStore.fromFlysim('ordinal.dat', 1).getTrial(0)
+        raster_times.append(times)
+        raster_neurons.append(neurons)
+        for t, neuron in zip(times.tolist(), neurons.tolist()):
+            while (float(t) - timer) >= 0:
+                timer += 0.0001
+                if (timer - last_time) >= 0.05:
+                    last_time = timer
+                    sum_count = sum(counts) if sum(counts) != 0 else 1
+                    ratio = [x/sum_count for x in counts]
+                    for num, count in enumerate(ratio):
+                        ord_counts[num].append(count)
+                    counts = [0 for i in range(5)]
+            
+            counts[int(neuron)//10] += 1
 
         for ele in ord_counts:
             while len(ele) < 60:
@@ -67,8 +76,7 @@ if __name__ == '__main__':
                     
     fig, ax = plt.subplots()
     colors1 = [f'C{i//10}' for i in range(100)]
-    ord_spikes.extend(task_spikes)
+    drawRaster(ax, np.concatenate(raster_times), np.concatenate(raster_neurons), 100, 3.0, colors1)
     ax.set_xlim(-0.1, 3.1)
-    ax.eventplot(ord_spikes, linelengths = 0.8, linewidths = 1.0, colors = colors1)
     plt.show()
 
@@ -0,0 +1,72 @@
+import argparse
+
+import matplotlib.colors as mcolors
+import numpy as np
+from matplotlib.figure import Figure
+
+from spike_store import SpikeStore
+
+
+def binSpikes(times, neurons, num_neuron, total_time, width=2000, height=None):
+    '''Spike counts on a (height, width) grid of neuron rows and time (s) columns, row 0 holds the lowest ids.
+
+    With height below num_neuron, neighbouring neurons share a row. Spikes outside
+    [0, total_time) or [0, num_neuron) are dropped.'''
+    height = num_neuron if height is None else min(height, num_neuron)
+    columns = (np.asarray(times, dtype=np.float64) * (width / total_time)).astype(np.int64)
+    rows = np.asarray(neurons, dtype=np.int64) * height // num_neuron
+    keep = (columns >= 0) & (columns < width) & (rows >= 0) & (rows < height)
+    return np.bincount(rows[keep] * width + columns[keep], minlength=height * width).reshape(height, width)
+
+
+def colorImage(counts, num_neuron, colors=None, saturation=1):
+    '''RGB image of binned spikes on white, every row in the color of its first neuron,
+    fully colored from saturation spikes per pixel on.'''
+    height = counts.shape[0]
+    if colors is None:
+        row_colors = np.zeros((height, 3))
+    else:
+        first = (np.arange(height) * num_neuron + height - 1) // height
+        row_colors = mcolors.to_rgba_array(colors)[first, :3]
+    intensity = np.minimum(counts / saturation, 1.0)[..., np.newaxis]
+    return 1.0 - intensity * (1.0 - row_colors[:, np.newaxis, :])
+
+
+def drawRaster(ax, times, neurons, num_neuron, total_time, colors=None, width=None, max_rows=None, saturation=1):
+    '''Draw the spikes of one trial as an image on ax, in time (s) against neuron id like eventplot.
+
+    The image has one bin per pixel of ax unless width and max_rows are given, so no spike
+    is lost to downsampling. The cost is one bincount over the spikes and an image of the
+    size of ax, so long and large runs draw in about the same time as short ones.'''
+    extent = ax.get_window_extent()
+    width = width if width else max(1, int(round(extent.width)))
+    max_rows = max_rows if max_rows else max(1, int(round(extent.height)))
+    counts = binSpikes(times, neurons, num_neuron, total_time, width, max_rows)
+    image = colorImage(counts, num_neuron, colors, saturation)
+    return ax.imshow(image, extent=(0.0, total_time, 0, num_neuron), origin='lower', aspect='auto', interpolation='nearest')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export the raster of a spike file as a PNG image, no display needed.')
+    parser.add_argument('dat', type=str, help='Spike file of the first trial, or an npz spike store')
+    parser.add_argument('-o', '--output', type=str, help='Path to the PNG file')
+    parser.add_argument('-n', '--num-trial', type=int, default=1, help='Number of trials of the flysim files')
+    parser.add_argument('-t', '--trial', type=int, default=0, help='Trial to draw')
+    parser.add_argument('--time', type=float, help='Length of the trial (s), the last spike by default')
+    parser.add_argument('--width', type=int, help='Time bins of the image, one per pixel by default')
+    parser.add_argument('--dpi', type=int, default=150, help='Resolution of the PNG file')
+    args = parser.parse_args()
+
+    if args.dat.endswith('.npz'):
+        store = SpikeStore.load(args.dat)
+    else:
+        store = SpikeStore.fromFlysim(args.dat, args.num_trial)
+    times, neurons = store.getTrial(args.trial)
+    total_time = args.time if args.time else float(np.ceil(times.max() * 10 + 1e-6) / 10) if len(times) else 1.0
+    num_neuron = int(neurons.max()) + 1 if len(neurons) else 1
+    fig = Figure(figsize=(12, 6))
+    ax = fig.add_subplot()
+    drawRaster(ax, times, neurons, num_neuron, total_time, width=args.width)
+    ax.set_xlabel('Time (s)')
+    ax.set_ylabel('Neuron')
+    fig.savefig(args.output or f'{args.dat}.png', dpi=args.dpi)
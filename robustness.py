@@ -2,7 +2,10 @@ import argparse
 
 import matplotlib.pyplot as plt
 
+from adaptive_search import RepetitionController
+from sim_cache import SimulationCache
 from ssc import SNNSequenceControl
+from streaming_robustness import streamRobustness
 
 
 if __name__ == '__main__':
@@ -11,16 +14,30 @@ if __name__ == '__main__':
     parser.add_argument('-p', '--pro', type=str, help='Path to pro file')
     parser.add_argument('-n', '--num-trial', type=int, help='Number of trials')
     parser.add_argument('-s', '--sim-version', type=int, help='Simulator version')
+    parser.add_argument('-e', '--engine', choices=['flysim', 'numpy'], default='flysim', help='Simulation engine')
+    parser.add_argument('--cache', type=str, help='Directory of the simulation result cache')
+    parser.add_argument('--stream', action='store_true', help='Evaluate while simulating and stop failed trials early')
+    parser.add_argument('--tolerance', type=float, help='Run batches of trials until every success rate is known within this half width')
+    parser.add_argument('--batch', type=int, default=10, help='Trials per batch with --tolerance')
     args = parser.parse_args()
 
-    num_trial = 100
+    num_trial = args.num_trial if args.num_trial else 100
 
-    ssm = SNNSequenceControl(20, transitions=19, experiment_time=10000, repetition=100)
+    ssm = SNNSequenceControl(20, transitions=19, experiment_time=10000, repetition=num_trial)
     ssm.setTransitionPeriod(500, 50, 500)
     ssm.spawnAttractor(100, 50, 'spike', 'AMPA', 400)
     ssm.generateTransitionStimuli('spike', 'AMPA', 250)
-    ssm.startSimulation()
-    x = ssm.calculateRobustness()
+    cache = SimulationCache(args.cache) if args.cache else None
+    if args.tolerance:
+        controller = RepetitionController(ssm, args.batch, num_trial, args.tolerance)
+        x = controller.run(engine=args.engine, cache=cache)
+        num_trial = controller.trials
+        print(f'{num_trial} trials in {controller.batches} batches')
+    elif args.stream:
+        x, stream = streamRobustness(ssm, args.engine)
+    else:
+        ssm.startSimulation(engine=args.engine, cache=cache)
+        x = ssm.calculateRobustness()
 
     y = [xi*100/num_trial for xi in x]
     print(y)
@@ -0,0 +1,130 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from lif_engine import LIFEngine
+
+
+class HashWriter:
+    '''File-like sink feeding the written text into a hash, so the pro text is hashed without being built.'''
+
+    def __init__(self, digest):
+        self.digest = digest
+
+    def write(self, text):
+        self.digest.update(text.encode())
+
+
+class SimulationCache:
+    '''On-disk cache of simulation outputs, keyed by the content of the network and protocol.
+
+    Every entry is a directory named after the hash of the population, receptor and target
+    parameters of the registry, the pro text, seed, repetition count and engine version. The
+    conf text is not enough, it leaves out parameters the numpy engine uses, such
+    as RefractoryPeriod and Connectivity. numpy runs store their spike records in one
+    npz file; flysim runs store copies of the output files the simulator wrote. Entries
+    are touched on every hit and the least recently used ones are evicted once the
+    cache grows beyond max_bytes.
+
+    Runs without a seed are stochastic, a cached one would replay the same sample to every
+    caller that repeats it to collect more samples. They are only cached with cache_unseeded.'''
+
+    def __init__(self, directory='sim_cache', max_bytes=2**30, cache_unseeded=False):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.cache_unseeded = cache_unseeded
+        self.warned = False
+        os.makedirs(self.directory, exist_ok=True)
+
+    def accepts(self, snn):
+        '''Whether runs of snn are cached, warns once per cache about skipped unseeded runs.'''
+        if snn.seed is not None or self.cache_unseeded:
+            return True
+        if not self.warned:
+            print('[Warning] The network has no seed, its runs are not cached. Set a seed or cache_unseeded to cache them.')
+            self.warned = True
+        return False
+
+    def getEngineVersion(self, snn, engine):
+        if engine == 'numpy':
+            return f'numpy-{LIFEngine.version}'
+        try:
+            stat = os.stat(snn.flysim_target)
+            return f'flysim-{snn.flysim_target}-{stat.st_size}-{stat.st_mtime_ns}'
+        except OSError:
+            return f'flysim-{snn.flysim_target}'
+
+    def getKey(self, snn, engine):
+        digest = hashlib.sha256()
+        snn.registry.updateDigest(digest)
+        snn.protocol.writePro(HashWriter(digest))
+        digest.update(f'{snn.seed}|{snn.iter}|{self.getEngineVersion(snn, engine)}'.encode())
+        return digest.hexdigest()
+
+    def getEntry(self, key):
+        return os.path.join(self.directory, key)
+
+    def load(self, key, snn, engine):
+        '''Restore the outputs of a cached run into snn, return False on a miss.'''
+        entry = self.getEntry(key)
+        if not os.path.isdir(entry):
+            return False
+        try:
+            if engine != 'flysim':
+                with np.load(os.path.join(entry, 'outputs.npz')) as data:
+                    snn.outputs = {name: data[name] for name in data.files}
+            else:
+                for name in snn.getOutputFiles():
+                    cached = os.path.join(entry, os.path.basename(name))
+                    if os.path.exists(cached):
+                        shutil.copyfile(cached, name)
+                snn.outputs = {}
+        except (OSError, ValueError):
+            return False
+        os.utime(entry)
+        return True
+
+    def store(self, key, snn, engine):
+        entry = self.getEntry(key)
+        if os.path.isdir(entry):
+            return
+        staging = tempfile.mkdtemp(prefix='.staging_', dir=self.directory)
+        if engine != 'flysim':
+            np.savez(os.path.join(staging, 'outputs.npz'), **snn.outputs)
+        else:
+            for name in snn.getOutputFiles():
+                if os.path.exists(name):
+                    shutil.copyfile(name, os.path.join(staging, os.path.basename(name)))
+        try:
+            os.rename(staging, entry)
+        except OSError:
+            # Another worker stored the same run first.
+            shutil.rmtree(staging, ignore_errors=True)
+        self.evict()
+
+    def getEntrySize(self, entry):
+        return sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            entry = os.path.join(self.directory, name)
+            if name.startswith('.') or not os.path.isdir(entry):
+                continue
+            try:
+                entries.append((os.path.getmtime(entry), self.getEntrySize(entry), entry))
+            except OSError:
+                continue
+        total = sum(size for mtime, size, entry in entries)
+        for mtime, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
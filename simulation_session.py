@@ -0,0 +1,102 @@
+import time
+
+import numpy as np
+
+from lif_engine import LIFEngine
+
+
+class SimulationSession:
+    '''Stateful, step-wise simulation of a FlysimSNN for closed-loop control.
+
+    The network runs one trial on the numpy engine, advanced by step() between the ticks of
+    a control loop. Inputs set with setInput/setCurrent act from the current time on, the
+    events of the StimulationProtocol still apply unless use_protocol is False. Times are
+    in ms like the protocol, spike times returned by readSpikes in seconds like the outputs.'''
+
+    def __init__(self, snn, dt=0.1, seed=None, use_protocol=True):
+        self.engine = LIFEngine(snn, dt, seed)
+        if not use_protocol:
+            self.engine.events = []
+        self.names = self.engine.network.names
+        self.sizes = np.diff(self.engine.offsets)
+        # Spikes of the steps since readSpikes, the first collected of them are already in rate_counts.
+        self.spike_steps, self.spike_neurons = [], []
+        self.collected = 0
+        self.rate_counts = np.zeros(self.engine.num_pop, dtype=np.int64)
+        self.rate_start = 0.0
+        self.latencies = []
+        self.step_durations = []
+
+    @property
+    def time(self):
+        return self.engine.t
+
+    def checkTarget(self, population):
+        if not self.engine.resolveTargets(population):
+            raise Exception(f'Unknown population or group {population}.')
+
+    def setInput(self, population, receptor, hz):
+        '''Set the external Poisson rate of a receptor of a population or group, like ChangeExtFreq.'''
+        self.checkTarget(population)
+        self.engine.applyEvent({'time': self.time, 'type': 'ChangeExtFreq', 'to': population, 'receptor': receptor, 'hz': hz})
+        self.engine.block_left = 0
+
+    def setCurrent(self, population, mean, std=0.0):
+        '''Set the membrane noise current (pA) of a population or group, like ChangeMembraneNoise.'''
+        self.checkTarget(population)
+        self.engine.applyEvent({'time': self.time, 'type': 'ChangeMembraneNoise', 'to': population, 'mean': mean, 'std': std})
+        self.engine.block_left = 0
+
+    def step(self, duration):
+        '''Advance the network by duration ms (at least one time step) and return the new time.'''
+        num_step = max(1, int(round(duration / self.engine.dt)))
+        engine = self.engine
+        start = time.perf_counter()
+        for i in range(num_step):
+            engine.step()
+            if engine.spike_neuron.size:
+                self.spike_steps.append(engine.step_count)
+                self.spike_neurons.append(engine.spike_neuron)
+        self.latencies.append((time.perf_counter() - start) * 1000.0)
+        self.step_durations.append(num_step * engine.dt)
+        return self.time
+
+    def collectSpikes(self):
+        '''Add the spikes of the steps not counted yet to the rate counts.'''
+        if len(self.spike_neurons) == self.collected:
+            return
+        neurons = self.spike_neurons[self.collected:]
+        self.rate_counts += np.bincount(self.engine.pop_of_neuron[np.concatenate(neurons)], minlength=self.engine.num_pop)
+        self.collected = len(self.spike_neurons)
+
+    def readSpikes(self):
+        '''Return (times in s, neuron ids) of the spikes since the previous call.'''
+        self.collectSpikes()
+        if self.spike_neurons:
+            sizes = [neurons.size for neurons in self.spike_neurons]
+            times = np.repeat(self.spike_steps, sizes) * self.engine.dt / 1000.0
+            neurons = np.concatenate(self.spike_neurons)
+        else:
+            times, neurons = np.zeros(0), np.zeros(0, dtype=np.int64)
+        self.spike_steps, self.spike_neurons = [], []
+        self.collected = 0
+        return times, neurons
+
+    def readRates(self, populations=None):
+        '''Return {population: mean firing rate in Hz} since the previous call, for all populations by default.'''
+        self.collectSpikes()
+        elapsed = max(self.time - self.rate_start, self.engine.dt) / 1000.0
+        rates = self.rate_counts / self.sizes / elapsed
+        self.rate_counts[:] = 0
+        self.rate_start = self.time
+        names = self.names if populations is None else populations
+        return {name: rates[self.engine.pop_index[name]] for name in names}
+
+    def getLatencyStats(self):
+        '''Wall-clock latency of the step calls in ms, and the simulated time per wall-clock time.'''
+        if not self.latencies:
+            return {}
+        latencies = np.array(self.latencies)
+        return {'steps': len(latencies), 'mean': latencies.mean(), 'p50': np.percentile(latencies, 50),
+                'p95': np.percentile(latencies, 95), 'p99': np.percentile(latencies, 99), 'max': latencies.max(),
+                'realtime_factor': sum(self.step_durations) / latencies.sum()}
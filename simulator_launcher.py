@@ -0,0 +1,164 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class SimulatorRun:
+    '''Outcome of one simulator invocation: returncode is None after a timeout.'''
+
+    def __init__(self, command, cwd=None):
+        self.command = command
+        self.cwd = cwd
+        self.returncode = None
+        self.stderr = ''
+        self.attempts = 0
+        self.timed_out = False
+        self.duration = 0.0
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+    def getError(self):
+        reason = 'timed out' if self.timed_out else f'exited with code {self.returncode}'
+        return f"{' '.join(self.command)} {reason} after {self.attempts} attempts:\n{self.stderr}"
+
+
+class SimulatorLauncher:
+    '''Runs simulator subprocesses with asyncio, at most max_concurrent at once.
+
+    Every attempt is killed after timeout seconds. Crashed and timed out attempts are
+    started again up to retries times. stdout is discarded and stderr captured. Cancelling
+    a run kills its process.'''
+
+    def __init__(self, max_concurrent=None, timeout=None, retries=0):
+        self.max_concurrent = max_concurrent if max_concurrent else os.cpu_count()
+        self.timeout = timeout
+        self.retries = retries
+        self.semaphore = None
+
+    async def run(self, command, cwd=None):
+        '''Run command to completion, return its SimulatorRun.'''
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrent)
+        run = SimulatorRun(command, cwd)
+        async with self.semaphore:
+            start = time.perf_counter()
+            while run.attempts <= self.retries:
+                run.attempts += 1
+                await self.attempt(run)
+                if run.ok:
+                    break
+            run.duration = time.perf_counter() - start
+        return run
+
+    async def attempt(self, run):
+        process = await asyncio.create_subprocess_exec(*run.command, cwd=run.cwd, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+        try:
+            _, stderr = await asyncio.wait_for(process.communicate(), self.timeout)
+        except asyncio.TimeoutError:
+            await self.kill(process)
+            run.returncode, run.timed_out, run.stderr = None, True, ''
+            return
+        except asyncio.CancelledError:
+            await self.kill(process)
+            raise
+        run.returncode, run.timed_out = process.returncode, False
+        run.stderr = stderr.decode(errors='replace')
+
+    async def kill(self, process):
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+    async def runAll(self, commands, cwds=None):
+        '''Run all commands concurrently, return their SimulatorRuns in order. Cancelling it kills the running processes.'''
+        cwds = cwds if cwds is not None else [None] * len(commands)
+        tasks = [asyncio.ensure_future(self.run(command, cwd)) for command, cwd in zip(commands, cwds)]
+        if not tasks:
+            return []
+        try:
+            await asyncio.wait(tasks)
+        except asyncio.CancelledError:
+            # Unlike gather, wait until every run has killed and reaped its process.
+            for task in tasks:
+                task.cancel()
+            await asyncio.wait(tasks)
+            raise
+        return [task.result() for task in tasks]
+
+
+def runBlocking(coroutine):
+    '''Run coroutine to completion and return its result, in a helper thread with its own
+    event loop when this thread already runs one, e.g. in Jupyter, where asyncio.run fails.'''
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+def runCommand(command, timeout=None, retries=0, cwd=None):
+    '''Blocking run of one simulator command through a SimulatorLauncher, raises if it does not succeed.'''
+    run = runBlocking(SimulatorLauncher(1, timeout, retries).run(command, cwd))
+    if not run.ok:
+        raise Exception(run.getError())
+    return run
+
+
+def runCommands(commands, cwds=None, max_concurrent=None, timeout=None, retries=0):
+    '''Blocking run of many simulator commands, return their SimulatorRuns, failed ones included.'''
+    return runBlocking(SimulatorLauncher(max_concurrent, timeout, retries).runAll(commands, cwds))
+
+
+def runNetworks(networks, directories, thread=1, max_concurrent=None, timeout=None, retries=0):
+    '''Run the flysim trials of several FlysimSNNs at once, each in its own directory.
+
+    The conf and pro files are written into the directories first. Returns the SimulatorRuns;
+    the outputs of every network are then read from its directory.'''
+    cwd = os.getcwd()
+    for snn, directory in zip(networks, directories):
+        os.chdir(directory)
+        try:
+            snn.generateConf()
+            snn.generatePro()
+        finally:
+            os.chdir(cwd)
+        snn.outputs = {}
+        snn.spike_stores = {}
+    commands = [snn.getFlysimCommand(thread) for snn in networks]
+    return runCommands(commands, [os.path.abspath(directory) for directory in directories], max_concurrent, timeout, retries)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the stand-in simulator on copies of a network at once, with timeouts and retries.')
+    parser.add_argument('-n', '--runs', type=int, default=8, help='Number of simulator runs')
+    parser.add_argument('-j', '--concurrent', type=int, default=None, help='Runs at once, all cores by default')
+    parser.add_argument('--timeout', type=float, default=None, help='Seconds before an attempt is killed')
+    parser.add_argument('--retries', type=int, default=0, help='Attempts after a crash or a timeout')
+    args = parser.parse_args()
+
+    import tempfile
+    from flysim_format import FlysimSNN
+    stand_in = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'simulators', 'stand_in_flysim.py')
+    with tempfile.TemporaryDirectory(prefix='launcher_') as root:
+        networks, directories = [], []
+        for i in range(args.runs):
+            snn = FlysimSNN(1000, 2, 'launcher', seed=i + 1)
+            snn.flysim_target = stand_in
+            snn.addNeuron('Task', n=10)
+            snn.addReceptor('Task', 'AMPA', tau=20, meanexteff=10.5)
+            snn.addStimulus('spike', (200, 400), 'Task', 'AMPA', 500)
+            snn.defineOutput('Spike', 'launcher.dat', 'Task')
+            directories.append(os.path.join(root, str(i)))
+            os.makedirs(directories[-1])
+            networks.append(snn)
+        start = time.perf_counter()
+        runs = runNetworks(networks, directories, max_concurrent=args.concurrent, timeout=args.timeout, retries=args.retries)
+        print(f'{len(runs)} runs in {time.perf_counter() - start:.2f} s')
+        for run, directory in zip(runs, directories):
+            print(f'{directory}: {"ok" if run.ok else run.getError().strip()}, {run.attempts} attempts, {run.duration:.2f} s')
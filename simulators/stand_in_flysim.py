@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+'''Stand-in for the flysim binary, with its command line, for tests without flysim.
+
+It loads the conf and pro files, runs the trials with the numpy engine and writes the
+outputs in the flysim text format into the working directory. Faults to test the
+launcher are injected through the environment:
+    STAND_IN_SLEEP   seconds to sleep before the run
+    STAND_IN_HANG    sleep forever when set
+    STAND_IN_CRASH   probability to exit with code 1 and a message on stderr'''
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-conf', type=str, required=True)
+    parser.add_argument('-pro', type=str, required=True)
+    parser.add_argument('-rp', type=int, default=1)
+    parser.add_argument('-t', type=int, default=1)
+    parser.add_argument('-udfsed', type=int, default=None)
+    args = parser.parse_args()
+
+    if os.environ.get('STAND_IN_HANG'):
+        while True:
+            time.sleep(3600)
+    time.sleep(float(os.environ.get('STAND_IN_SLEEP', 0)))
+    if random.random() < float(os.environ.get('STAND_IN_CRASH', 0)):
+        sys.stderr.write('Segmentation fault (stand-in)\n')
+        sys.exit(1)
+
+    from flysim_parser import loadNetwork
+    snn = loadNetwork(args.conf, args.pro, iterations=args.rp, seed=args.udfsed)
+    snn.start(engine='numpy')
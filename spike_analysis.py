@@ -0,0 +1,121 @@
+import numpy as np
+
+
+def getClosedWindowCounts(store, base_id, num_node, node_stride, time_window):
+    '''Count the spikes of every node in the windows of SNNSequenceControl.calculateRobustnessLegacy.
+
+    The loop closes a window at the first spike at or after its end and drops that spike. The
+    end only moves one window per closing spike, so a gap over several windows takes one
+    dropped spike per window to catch up, and the window still open after the last spike is
+    never stored. Returns an int array (trials, windows, nodes) with the windows of the trial
+    closing the most, the others are padded with empty windows like the loop pads them.'''
+    num_trial = store.numTrials
+    times = store.times.astype(np.float64)
+    if times.size == 0:
+        return np.zeros((num_trial, 0, num_node), dtype=np.int64)
+    scaled = times / time_window
+    passed = scaled.astype(np.int64)
+    # Near a window end the loop's end, time_window added once per window, decides.
+    scaled -= passed
+    near = np.flatnonzero((scaled < 1e-6) | (scaled > 1 - 1e-6))
+    ends = np.cumsum(np.full(int(times.max() / time_window) + 3, float(time_window)))
+    passed[near] = np.searchsorted(ends, times[near], side='right')
+    sizes = np.diff(store.offsets)
+    has_spikes = sizes > 0
+    trials = np.repeat(np.arange(num_trial, dtype=np.int64), sizes)
+    first = store.offsets[:-1][has_spikes]
+    steps = np.diff(passed)
+    steps[first[1:] - 1] = 0
+    if passed[first].max() <= 1 and steps.max(initial=0) <= 1:
+        # No window passes without a spike, every window closes at the first spike after it.
+        closed_after = passed
+    else:
+        # Windows closed after spike i: min(passed[i], closed before i + 1), unrolled into a running
+        # minimum of passed - position; the trial offsets restart the minimum at every trial.
+        position = np.arange(times.size) - np.repeat(store.offsets[:-1], sizes)
+        shift = trials * (int(passed.max()) + times.size + 1)
+        lowest = np.minimum.accumulate(passed - position - shift)
+        lowest += shift
+        closed_after = position + np.minimum(1, lowest)
+    closed_before = np.zeros_like(closed_after)
+    closed_before[1:] = closed_after[:-1]
+    closed_before[first] = 0
+    num_closed = np.zeros(num_trial, dtype=np.int64)
+    num_closed[has_spikes] = closed_after[store.offsets[1:][has_spikes] - 1]
+    nodes = (store.neurons.astype(np.int64) - base_id) // node_stride
+    counted = closed_before >= passed
+    if nodes.min() < 0 or nodes.max() >= num_node:
+        counted &= (nodes >= 0) & (nodes < num_node)
+    # One more window per trial for the spikes after its last closed window, dropped afterwards.
+    num_window = int(num_closed.max())
+    flat = trials * (num_window + 1)
+    flat += closed_before
+    flat *= num_node
+    flat += nodes
+    counts = np.bincount(flat[counted], minlength=num_trial * (num_window + 1) * num_node).reshape(num_trial, num_window + 1, num_node)
+    counts[np.arange(num_trial), num_closed] = 0
+    return counts[:, :num_window]
+
+
+def getSpikeRatios(counts):
+    '''Share of every node in the spikes of its window, windows without spikes give zeros.'''
+    total = counts.sum(axis=-1, keepdims=True)
+    return counts / np.maximum(total, 1)
+
+
+def getBumpArrays(spike_ratios, threshold=0.5):
+    '''Find the runs of windows whose ratio is greater than the threshold.
+
+    Returns (trial, node, start, end) arrays with inclusive window indices, sorted by trial,
+    node and start, the vectorized counterpart of SNNSequenceControl.getBumps.'''
+    if threshold < 0.5 or threshold > 1.0:
+        print('Illegal threshold')
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty, empty
+    mask = (spike_ratios > threshold).transpose(0, 2, 1).astype(np.int8)
+    padded = np.pad(mask, ((0, 0), (0, 0), (1, 1)))
+    edges = np.diff(padded, axis=2)
+    trial, node, start = np.nonzero(edges == 1)
+    end = np.nonzero(edges == -1)[2] - 1
+    return trial, node, start, end
+
+
+def getTransitionArrays(bumps, num_node):
+    '''Pair the bumps of neighbouring nodes into transitions, vectorized SNNSequenceControl.getTransition.
+
+    Returns (trial, transition point, forward) arrays in the order the loop implementation
+    produces them: by trial, node pair, bump of the first node and bump of the second node.'''
+    trial, node, start, end = bumps
+    key = trial * num_node + node
+    num_key = (trial.max() + 1) * num_node if trial.size else 0
+    key_counts = np.bincount(key, minlength=num_key + 1)
+    key_first = np.concatenate(([0], np.cumsum(key_counts)))
+    partner = key + 1
+    num_partner = np.where(node < num_node - 1, key_counts[np.minimum(partner, num_key)], 0)
+    first = np.repeat(np.arange(len(key)), num_partner)
+    rank = np.arange(first.size) - np.repeat(np.cumsum(num_partner) - num_partner, num_partner)
+    second = key_first[partner[first]] + rank
+
+    start0, end0, start1, end1 = start[first], end[first], start[second], end[second]
+    forward = start0 <= start1
+    diff = np.where(forward, start1 - end0, start0 - end1)
+    point = np.where(forward, start1, start0)
+    keep = diff < 3
+    return trial[first][keep], point[keep], forward[keep]
+
+
+def countSuccessTransitions(transitions, ground_truth, num_trial):
+    '''Per-trial count of transitions matching the ground truth at the same position, as in
+    SNNSequenceControl.getNumberConsecutiveSuccessTransitions.'''
+    trial, point, forward = transitions
+    if not ground_truth or trial.size == 0:
+        return np.zeros(num_trial, dtype=np.int64)
+    expect = np.array([gt[0] for gt in ground_truth], dtype=np.float64)
+    expect_forward = np.array([gt[1] == '+' for gt in ground_truth])
+    trial_first = np.searchsorted(trial, np.arange(num_trial))
+    position = np.arange(trial.size) - trial_first[trial]
+    valid = position < len(ground_truth)
+    position = np.minimum(position, len(ground_truth) - 1)
+    delay = point - expect[position]
+    match = valid & (delay < 3) & (delay >= 0) & (forward == expect_forward[position])
+    return np.bincount(trial[match], minlength=num_trial)
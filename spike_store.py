@@ -0,0 +1,142 @@
+import argparse
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+
+def parseSpikeChunk(chunk):
+    '''Parse whole '<time> <neuron>' lines of a bytes chunk into an (n, 2) float64 array.'''
+    if not chunk.strip():
+        return np.zeros((0, 2))
+    return np.loadtxt(io.BytesIO(chunk), dtype=np.float64, ndmin=2)
+
+
+def readFlysimFile(path, chunk_size=2**24):
+    '''Return (times, neurons) of one flysim spike file sorted by time, parsed chunk_size bytes at a time.'''
+    parts = []
+    rest = b''
+    with open(path, 'rb') as spike_file:
+        while True:
+            chunk = spike_file.read(chunk_size)
+            if not chunk:
+                break
+            chunk = rest + chunk
+            cut = chunk.rfind(b'\n') + 1
+            rest = chunk[cut:]
+            parts.append(parseSpikeChunk(chunk[:cut]))
+    parts.append(parseSpikeChunk(rest))
+    data = np.concatenate(parts)
+    order = np.argsort(data[:, 0], kind='stable')
+    return data[order, 0].astype(np.float32), data[order, 1].astype(np.int32)
+
+
+class SpikeStore:
+    '''Columnar spike storage of a whole run: float32 times (s), int32 neuron ids and a per-trial offset index.
+
+    The spikes of trial k are times[offsets[k]:offsets[k+1]], sorted by time. pop_offsets,
+    when known, holds the first neuron id of every population plus the total count, so
+    populations can be selected by index instead of neuron ids.'''
+
+    def __init__(self, times, neurons, offsets, pop_offsets=None):
+        self.times = times
+        self.neurons = neurons
+        self.offsets = offsets
+        self.pop_offsets = pop_offsets
+
+    @classmethod
+    def fromRecords(cls, records, trials, pop_offsets=None):
+        '''Build a store from the record array of the numpy engine (trial, time and neuron fields).'''
+        records = records[np.lexsort((records['time'], records['trial']))]
+        offsets = np.searchsorted(records['trial'], np.arange(trials + 1)).astype(np.int64)
+        return cls(records['time'].astype(np.float32), records['neuron'].astype(np.int32), offsets, pop_offsets)
+
+    @classmethod
+    def fromFlysim(cls, file_name, trials, pop_offsets=None, workers=None, executor='thread'):
+        '''Import the '<time> <neuron>' text files of a flysim run: file_name, file_name_2, ...
+
+        The files are read and parsed concurrently by a pool of workers threads, or processes
+        with executor='process' when parsing rather than reading is the bottleneck.
+        workers=1 reads them one after another.'''
+        files = [file_name if trial == 0 else f'{file_name}_{trial+1}' for trial in range(trials)]
+        if workers == 1 or len(files) <= 1:
+            trial_data = [readFlysimFile(trial_file) for trial_file in files]
+        else:
+            pool_type = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+            with pool_type(max_workers=workers) as pool:
+                trial_data = list(pool.map(readFlysimFile, files))
+        return cls.fromTrials([times for times, neurons in trial_data], [neurons for times, neurons in trial_data], pop_offsets)
+
+    @classmethod
+    def fromTrials(cls, times, neurons, pop_offsets=None):
+        offsets = np.concatenate(([0], np.cumsum([len(t) for t in times]))).astype(np.int64)
+        if times:
+            return cls(np.concatenate(times), np.concatenate(neurons), offsets, pop_offsets)
+        return cls(np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int32), offsets, pop_offsets)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            pop_offsets = data['pop_offsets'] if 'pop_offsets' in data.files else None
+            return cls(data['times'], data['neurons'], data['offsets'], pop_offsets)
+
+    def save(self, path, compressed=False):
+        arrays = {'times': self.times, 'neurons': self.neurons, 'offsets': self.offsets}
+        if self.pop_offsets is not None:
+            arrays['pop_offsets'] = self.pop_offsets
+        if compressed:
+            np.savez_compressed(path, **arrays)
+        else:
+            np.savez(path, **arrays)
+
+    @property
+    def numTrials(self):
+        return len(self.offsets) - 1
+
+    def getTrialIds(self):
+        return np.repeat(np.arange(self.numTrials, dtype=np.int32), np.diff(self.offsets))
+
+    def getTrial(self, trial):
+        '''Return (times, neurons) of one trial as views into the store.'''
+        start, end = self.offsets[trial], self.offsets[trial+1]
+        return self.times[start:end], self.neurons[start:end]
+
+    def getWindow(self, t0, t1, trial):
+        '''Return (times, neurons) of the spikes of one trial with t0 <= time < t1 (s).'''
+        times, neurons = self.getTrial(trial)
+        start, end = np.searchsorted(times, [t0, t1])
+        return times[start:end], neurons[start:end]
+
+    def getNeurons(self, first, last, trial=None):
+        '''Return (trial ids, times, neurons) of the spikes of neurons first <= id < last.'''
+        if trial is None:
+            trials, times, neurons = self.getTrialIds(), self.times, self.neurons
+        else:
+            times, neurons = self.getTrial(trial)
+            trials = np.full(len(times), trial, dtype=np.int32)
+        mask = (neurons >= first) & (neurons < last)
+        return trials[mask], times[mask], neurons[mask]
+
+    def getPopulations(self, first, last, trial=None):
+        '''Return (trial ids, times, neurons) of the populations first <= index < last.'''
+        if self.pop_offsets is None:
+            raise Exception('The population offsets of this store are unknown.')
+        return self.getNeurons(self.pop_offsets[first], self.pop_offsets[last], trial)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert flysim text spike files into one npz spike store.')
+    parser.add_argument('dat', type=str, help='Path to the spike file of the first trial')
+    parser.add_argument('-n', '--num-trial', type=int, default=1, help='Number of trials')
+    parser.add_argument('-o', '--output', type=str, help='Path to the npz file')
+    parser.add_argument('-z', '--compress', action='store_true', help='Compress the npz file')
+    parser.add_argument('-w', '--workers', type=int, help='Number of files read at once')
+    parser.add_argument('--remove', action='store_true', help='Delete the text files after the conversion')
+    args = parser.parse_args()
+
+    store = SpikeStore.fromFlysim(args.dat, args.num_trial, workers=args.workers)
+    store.save(args.output or f'{args.dat}.npz', args.compress)
+    if args.remove:
+        for trial in range(args.num_trial):
+            os.remove(args.dat if trial == 0 else f'{args.dat}_{trial+1}')
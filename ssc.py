@@ -2,9 +2,13 @@ import random
 import sys
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import networkx as nx
 
+import profiling
 from flysim_format import FlysimSNN
+from raster_image import drawRaster
+from spike_analysis import getClosedWindowCounts, getSpikeRatios, getBumpArrays, getTransitionArrays, countSuccessTransitions
 
 class SNNSequenceControl:
 
@@ -17,12 +21,14 @@ class SNNSequenceControl:
         self.repete = repetition
         self.sim = FlysimSNN(experiment_time, repetition, self.log_filename_base)
         self.stimulus = {'total_time': experiment_time, 'individual': []}
+        self.transition_events = []
         self.time_window = 0.05
         self.population_size = 10
         self.task_weights = task_weights
-        self.spawnNodes()
-        self.assembleNodes()
-        self.setOutputs()
+        with profiling.phase('spawnNodes', length=trunk_length):
+            self.spawnNodes()
+            self.assembleNodes()
+            self.setOutputs()
 
     def registerTask(self, anchor=0, task_weight=0):
         if nx.number_of_nodes(self.sequence):
@@ -159,10 +165,14 @@ class SNNSequenceControl:
                 end = start + self.stimulus['duration'][i]
             else:
                 end = start + self.stimulus['duration']
+            first = len(self.sim.protocol.events)
             if self.task_weights:
                 self.sim.addStimulus(stimulus_type, (start, end), 'CurrentStatus', *args)
             else:
                 self.sim.addStimulus(stimulus_type, (start, end), 'Next', *args)
+            # The (onset, offset) protocol events of the transition, e.g. for NetworkTemplate.declareEvents.
+            if len(self.sim.protocol.events) == first + 2:
+                self.transition_events.append(tuple(self.sim.protocol.events[first:]))
                 
     def generateExceptionSwitches(self, stimulus_type, *args):
         for s, d, pos in self.stimulus['individual']:
@@ -183,9 +193,10 @@ class SNNSequenceControl:
         self.sim.defineOutput('Spike', f'{self.log_filename_base}_all.dat', 'AllPopulation')
         self.sim.defineOutput('Spike', f'{self.log_filename_base}_task.dat', 'Task')
 
-    def startSimulation(self, thread=1):
-        self.generateConfProFile()
-        self.sim.start(thread)
+    def startSimulation(self, thread=1, engine='flysim', cache=None):
+        if engine == 'flysim':
+            self.generateConfProFile()
+        self.sim.start(thread, engine, save_outputs=False, cache=cache)
 
     def generateConfProFile(self):
         self.sim.generateConf()
@@ -259,49 +270,59 @@ class SNNSequenceControl:
         return counter
 
     def calculateRobustness(self):
+        """Count for every i the trials with at least i successful transitions, all trials at once."""
+        with profiling.phase('robustness'):
+            return self.countRobustness()
+
+    def countRobustness(self):
+        base_id = self.sim.getNeuron('Ordinal0')['id'] * self.population_size
+        store = self.sim.getSpikeStore(f'{self.log_filename_base}_task.dat')
+        counts = getClosedWindowCounts(store, base_id, self.length, 3*self.population_size, self.time_window)
+        bumps = getBumpArrays(getSpikeRatios(counts), 0.5)
+        trans = getTransitionArrays(bumps, self.length)
+        success = countSuccessTransitions(trans, self.getGroundTruthTransition(), store.numTrials)
+        return [0] + [int(np.count_nonzero(success >= i)) for i in range(1, self.length)]
+
+    def calculateRobustnessLegacy(self):
+        """Loop implementation of calculateRobustness, one trial and one spike at a time, with the windowing of the original code."""
         x = [0 for i in range(self.length)]
         base_id = self.sim.getNeuron('Ordinal0')['id'] * self.population_size
+        store = self.sim.getSpikeStore(f'{self.log_filename_base}_task.dat')
         for trial in range(self.repete):
             bumps = []
             trans = []
             task_spike_ratios = [[] for i in range(self.length)]
             spike_counts = [0 for i in range(self.length)]
             time_boundary = self.time_window
-            if trial == 0:
-                filename = f'{self.log_filename_base}_task.dat'
-            else:
-                filename = f'{self.log_filename_base}_task.dat_{trial+1}'
-            with open(filename, 'r') as spike_file:
-                for event in spike_file:
-                    timestamp, neuron = event.split(' ')
-                    timestamp, neuron = float(timestamp), int(neuron)
-                    if time_boundary > timestamp:
-                        spike_counts[(neuron-base_id)//(3*self.population_size)] += 1
-                    else:
-                        time_boundary += self.time_window
-                        total_spike_count = sum(spike_counts) if sum(spike_counts) != 0 else 1
-                        spike_ratios = [count/total_spike_count for count in spike_counts]
-                        for num, ratio in enumerate(spike_ratios):
-                            task_spike_ratios[num].append(ratio)
-                            spike_counts = [0 for i in range(self.length)]
-        
-                while time_boundary < self.stimulus['total_time']:
+            timestamps, neurons = store.getTrial(trial)
+            for timestamp, neuron in zip(timestamps.tolist(), neurons.tolist()):
+                if time_boundary > timestamp:
+                    spike_counts[(neuron-base_id)//(3*self.population_size)] += 1
+                else:
                     time_boundary += self.time_window
-                    for num in range(self.length):
-                        task_spike_ratios[num].append(0)
-                
-                for data in task_spike_ratios:
-                    bumps.append(self.getBumps(data, 0.5))
-                prev_bump = None
-                for bump in bumps:
-                    if prev_bump == None:
-                        prev_bump = bump
-                    else:
-                        trans.extend(self.getTransition(prev_bump, bump))
-                        prev_bump = bump
-                success = self.getNumberConsecutiveSuccessTransitions(trans, self.getGroundTruthTransition())
-                for i in range(1, success+1):
-                    x[i] += 1
+                    total_spike_count = sum(spike_counts) if sum(spike_counts) != 0 else 1
+                    spike_ratios = [count/total_spike_count for count in spike_counts]
+                    for num, ratio in enumerate(spike_ratios):
+                        task_spike_ratios[num].append(ratio)
+                        spike_counts = [0 for i in range(self.length)]
+    
+            while time_boundary < self.stimulus['total_time']:
+                time_boundary += self.time_window
+                for num in range(self.length):
+                    task_spike_ratios[num].append(0)
+            
+            for data in task_spike_ratios:
+                bumps.append(self.getBumps(data, 0.5))
+            prev_bump = None
+            for bump in bumps:
+                if prev_bump == None:
+                    prev_bump = bump
+                else:
+                    trans.extend(self.getTransition(prev_bump, bump))
+                    prev_bump = bump
+            success = self.getNumberConsecutiveSuccessTransitions(trans, self.getGroundTruthTransition())
+            for i in range(1, success+1):
+                x[i] += 1
         return x
 
     def plotStimulusRobustness(self):
@@ -334,7 +355,11 @@ class SNNSequenceControl:
         return (num_branch, num_branch_neuron, colors, branch_ytick, branch_hl, branch_neuron_labels)
             
         
-    def plotRaster(self, save=False, show=True, name_modifier=''):
+    def plotRaster(self, save=False, show=True, name_modifier='', renderer='image', trial=0):
+        '''Raster of the spikes of one trial with the node separators and stimulus onsets.
+
+        The image renderer bins the spikes into the pixels of the plot, fast for any number
+        of spikes; renderer='eventplot' draws every spike. Without show, no display is needed.'''
         num_neuron = 30 + 30*self.length
         hl = [20, 30]
         neuron_labels = ['Inh', 'Next']
@@ -367,23 +392,28 @@ class SNNSequenceControl:
             num_neuron += num_branch_neuron
             colors1.extend(colors)
             
-        task_spikes = [[] for i in range(num_neuron)]
-        with open(f'{self.log_filename_base}_all.dat', 'r') as spike_file:
-            for event in spike_file:
-                t, neuron = event.split(' ')
-                task_spikes[int(neuron)].append(float(t))
-                    
-        fig, ax = plt.subplots()
+        times, neurons = self.sim.getSpikeStore(f'{self.log_filename_base}_all.dat').getTrial(trial)
+        if show:
+            fig, ax = plt.subplots()
+        else:
+            fig = Figure()
+            ax = fig.add_subplot()
+        if renderer == 'image':
+            drawRaster(ax, times, neurons, num_neuron, self.stimulus['total_time']/1000, colors1)
+        else:
+            task_spikes = [[] for i in range(num_neuron)]
+            for t, neuron in zip(times.tolist(), neurons.tolist()):
+                task_spikes[neuron].append(t)
+            ax.eventplot(task_spikes, linelengths = 0.8, linewidths = 1.0, colors = colors1)
         ax.set_xlim(0.0, self.stimulus['total_time']/1000)
-        ax.set_ylim(0, num_neuron)     
-        plt.hlines(hl, -0.1, self.stimulus['total_time']+0.1)
-        plt.vlines(vl, 0, num_neuron, colors='r', linestyles='dashed')
+        ax.set_ylim(0, num_neuron)
+        ax.hlines(hl, -0.1, self.stimulus['total_time']+0.1)
+        ax.vlines(vl, 0, num_neuron, colors='r', linestyles='dashed')
+        ax.set_yticks(ytick)
         ax.set_yticklabels(neuron_labels)
         ax.set_xlabel('Time (s)')
-        ax.set_yticks(ytick)
-        ax.eventplot(task_spikes, linelengths = 0.8, linewidths = 1.0, colors = colors1)
         if save:
-            plt.savefig(f'{self.log_filename_base}_{name_modifier}.png')
+            fig.savefig(f'{self.log_filename_base}_{name_modifier}.png')
         if show:
             plt.show()
 
@@ -1,36 +1,97 @@
 import argparse
+import os
 import matplotlib.pyplot as plt
 import numpy as np
 
+import profiling
+from adaptive_search import printEstimates, runAdaptiveSweep
+from firing_rate import getFiringRates
 from flysim_format import FlysimSNN
+from network_template import NetworkTemplate
 from ssc import SNNSequenceControl
+from sweep import runSweep
+
+
+def buildNextCell(duration, strength):
+    ssm = SNNSequenceControl(5, transitions=4, experiment_time=5000, repetition=10)
+    ssm.setTransitionPeriod(1000, duration, 1000)
+    ssm.spawnAttractor(100, 50, 'spike', 'AMPA', 400)
+    ssm.generateTransitionStimuli('spike', 'AMPA', strength)
+    return ssm
+
+def buildTaskCell(weight, duration, strength):
+    ssm = SNNSequenceControl(2, transitions=1, task_weights=[weight, weight], experiment_time=1000, repetition=10)
+    ssm.setTransitionPeriod(500, duration, 1000)
+    ssm.spawnAttractor(100, 50, 'spike', 'AMPA', 400)
+    ssm.generateTransitionStimuli('spike', 'AMPA', strength)
+    return ssm
+
+def buildCosCell(weight, strength, duration):
+    ssc = SNNSequenceControl(2, transitions=1, task_weights=[weight, weight], experiment_time=1000, repetition=1)
+    ssc.setTransitionPeriod(500, duration, 500)
+    ssc.generateTransitionStimuli('spike', 'AMPA', strength)
+    ssc.spawnAttractor(100, 50, 'spike', 'AMPA', 400)
+    return ssc
+
+
+def buildDecisionNetwork(weight=0.0):
+    snn = FlysimSNN(1000, 1, 'decision')
+    snn.addNeuron('TaskTarget', n=10, c=0.5, taum=10, restpot=-55)
+    snn.addReceptor('TaskTarget', 'AMPA', tau=20, meanexteff=10.5)
+    snn.addReceptor('TaskTarget', 'GABA', tau=5, revpot=-90, meanexteff=0)
+    snn.addNeuron('CurrentStatus', n=10, c=0.5, taum=10, restpot=-55)
+    snn.addReceptor('CurrentStatus', 'AMPA', tau=20, meanexteff=10.5)
+    snn.addReceptor('CurrentStatus', 'GABA', tau=5, revpot=-90, meanexteff=0)
+    snn.addCoonection(f'TaskTarget', 'TaskTarget', 'AMPA', 0.05)
+    snn.addCoonection(f'CurrentStatus', 'CurrentStatus', 'AMPA', 0.05)
+    snn.addCoonection(f'TaskTarget', 'CurrentStatus', 'GABA', 5.0)
+    snn.addCoonection(f'CurrentStatus', 'TaskTarget', 'GABA', 5.0)
+    snn.addCoonection(f'CurrentStatus', 'Next', 'AMPA', 1.0)
+    snn.addNeuron(f'Ordinal', n=10)
+    snn.addNeuron('Task', n=10)
+    snn.addReceptor('Ordinal', 'AMPA', meanexteff=10.5)
+    snn.addReceptor('Ordinal', 'GABA', tau=5, revpot=-90, meanextconn=0.0)
+    snn.addReceptor('Task', 'AMPA', tau=20, meanexteff=10.5)
+    snn.addReceptor('Task', 'GABA', tau=5, revpot=-90)
+    snn.addCoonection('Ordinal', 'Task', 'AMPA', 4)
+    snn.addCoonection('Ordinal', 'Ordinal', 'AMPA', 1.0)
+    snn.addCoonection(f'Task', 'TaskTarget', 'AMPA', weight)
+
+    snn.addStimulus('spike', (400, 50), 'Ordinal', 'AMPA', 400)
+    snn.addStimulus('spike', (500, None), 'CurrentStatus', 'AMPA', 500)
+    snn.defineOutput('Spike', 'decision.dat', 'TaskTarget')
+    return snn
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('target', choices=['next', 'task', 'decision', 'cos'])
+    parser.add_argument('-w', '--workers', type=int, default=None, help='Number of parallel jobs, all cores by default')
+    parser.add_argument('-e', '--engine', choices=['flysim', 'numpy'], default='flysim', help='Simulation engine')
+    parser.add_argument('-a', '--adaptive', action='store_true', help='Screen the next and task cells with few trials and repeat only the promising ones')
+    parser.add_argument('--robustness-target', dest='robustness_target', type=float, default=0.5, help='Robustness below which adaptive cells are dropped')
+    parser.add_argument('--max-repetition', type=int, default=32, help='Trials of the adaptive cells that are never dropped')
+    parser.add_argument('--profile', type=str, help='Directory for the profiling records of the sweep cells and their merged trace.json')
     args = parser.parse_args()
+
+    def reportProfile():
+        if args.profile:
+            profiling.summarizeDirectory(args.profile, os.path.join(args.profile, 'trace.json'))
     
-    if args.next:
-        results = []
+    if args.target == 'next':
         stimulus_duration_list = [d for d in range(0, 1050, 50)]
         stimulus_strength_list = [s for s in range(0, 1050, 50)]
-        for d in stimulus_duration_list:
-            row = []
-            for s in stimulus_strength_list:
-                ssm = SNNSequenceControl(5, transitions=4, experiment_time=5000, repetition=10)
-                ssm.setTransitionPeriod(1000, d, 1000)
-                ssm.spawnAttractor(100, 50, 'spike', 'AMPA', 400)
-                ssm.generateTransitionStimuli('spike', 'AMPA', s)
-                ssm.startSimulation()
-                x = ssm.calculateRobustness()
-                row.append(x[4])
-                print(x)
-                #ssm.plotRaster(show=False, save=True, name_modifier=str(d)+'_'+str(s))
-            results.insert(0, row)
-    
-        res = np.array(results)
-        res = res/50
+        grid = {'duration': stimulus_duration_list, 'strength': stimulus_strength_list}
+        if args.adaptive:
+            sweep = runAdaptiveSweep(grid, buildNextCell, 4, args.robustness_target, max_repetition=args.max_repetition, workers=args.workers, engine=args.engine)
+            printEstimates(sweep)
+            res = sweep.heatmap(0)
+        else:
+            sweep = runSweep(grid, buildNextCell, workers=args.workers, engine=args.engine, profile_dir=args.profile)
+            reportProfile()
+            print(sweep.values)
+            res = sweep.heatmap(4)
+            res = res/50
         fig, ax = plt.subplots()
         im = ax.imshow(res)
         cbar = ax.figure.colorbar(im, ax=ax)
@@ -43,27 +104,23 @@ if __name__ == '__main__':
         ax.set_ylabel('Stimulus Duration')
         plt.show()
         
-    if args.task:
+    if args.target == 'task':
         stimulus_duration_list = [d for d in range(0, 550, 50)]
         stimulus_strength_list = [s for s in range(0, 550, 50)]
         task_weight_list = [0.01, 0.1, 1.0, 3.0, 5.0, 10.0]
+        grid = {'weight': task_weight_list, 'duration': stimulus_duration_list, 'strength': stimulus_strength_list}
+        if args.adaptive:
+            sweep = runAdaptiveSweep(grid, buildTaskCell, 1, args.robustness_target, max_repetition=args.max_repetition, workers=args.workers, engine=args.engine)
+            printEstimates(sweep)
+        else:
+            sweep = runSweep(grid, buildTaskCell, workers=args.workers, engine=args.engine, profile_dir=args.profile)
+            reportProfile()
         for w in task_weight_list:
-            results = []
-            for d in stimulus_duration_list:
-                row = []
-                for s in stimulus_strength_list:
-                    ssm = SNNSequenceControl(2, transitions=1, task_weights=[w, w], experiment_time=1000, repetition=10)
-                    ssm.setTransitionPeriod(500, d, 1000)
-                    ssm.spawnAttractor(100, 50, 'spike', 'AMPA', 400)
-                    ssm.generateTransitionStimuli('spike', 'AMPA', s)
-                    ssm.startSimulation()
-                    x = ssm.calculateRobustness()
-                    row.append(x[1])
-                    print(x)
-                results.insert(0, row)
-                
-            res = np.array(results)
-            res = res/10
+            if args.adaptive:
+                res = sweep.select(weight=w).heatmap(0)
+            else:
+                res = sweep.select(weight=w).heatmap(1)
+                res = res/10
             fig, ax = plt.subplots()
             im = ax.imshow(res)
             plt.title(f'Task weight {w}')
@@ -77,43 +134,21 @@ if __name__ == '__main__':
             ax.set_ylabel('Stimulus Duration')
             plt.show()
             
-    if args.decision:
+    if args.target == 'decision':
         mean_rates = []
         weights = np.linspace(0.0, 2.0, 400)
+        snn = buildDecisionNetwork()
+        template = NetworkTemplate(snn)
+        template.declareConnection('weight', 'Task', 'TaskTarget')
         for w in weights:
-            snn = FlysimSNN(1000, 1, 'decision')
-            snn.addNeuron('TaskTarget', n=10, c=0.5, taum=10, restpot=-55)
-            snn.addReceptor('TaskTarget', 'AMPA', tau=20, meanexteff=10.5)
-            snn.addReceptor('TaskTarget', 'GABA', tau=5, revpot=-90, meanexteff=0)
-            snn.addNeuron('CurrentStatus', n=10, c=0.5, taum=10, restpot=-55)
-            snn.addReceptor('CurrentStatus', 'AMPA', tau=20, meanexteff=10.5)
-            snn.addReceptor('CurrentStatus', 'GABA', tau=5, revpot=-90, meanexteff=0)
-            snn.addCoonection(f'TaskTarget', 'TaskTarget', 'AMPA', 0.05)
-            snn.addCoonection(f'CurrentStatus', 'CurrentStatus', 'AMPA', 0.05)
-            snn.addCoonection(f'TaskTarget', 'CurrentStatus', 'GABA', 5.0)
-            snn.addCoonection(f'CurrentStatus', 'TaskTarget', 'GABA', 5.0)
-            snn.addCoonection(f'CurrentStatus', 'Next', 'AMPA', 1.0)
-            snn.addNeuron(f'Ordinal', n=10)
-            snn.addNeuron('Task', n=10)
-            snn.addReceptor('Ordinal', 'AMPA', meanexteff=10.5)
-            snn.addReceptor('Ordinal', 'GABA', tau=5, revpot=-90, meanextconn=0.0)
-            snn.addReceptor('Task', 'AMPA', tau=20, meanexteff=10.5)
-            snn.addReceptor('Task', 'GABA', tau=5, revpot=-90)
-            snn.addCoonection('Ordinal', 'Task', 'AMPA', 4)
-            snn.addCoonection('Ordinal', 'Ordinal', 'AMPA', 1.0)
-            snn.addCoonection(f'Task', 'TaskTarget', 'AMPA', w)
-
-            snn.addStimulus('spike', (400, 50), 'Ordinal', 'AMPA', 400)
-            snn.addStimulus('spike', (500, None), 'CurrentStatus', 'AMPA', 500)
-            snn.defineOutput('FiringRate', 'decision.dat', 'TaskTarget', window_size=50, step_size=50)
-            snn.start()
-            rates = []
-            with open('decision.dat', 'r') as dat:
-                for rate in dat:
-                    t, r = rate.split(' ')
-                    if float(t) > 0.6:
-                        rates.append(float(r))
-            mean = np.mean(rates)
+            template.setParameters(weight=w)
+            if args.engine == 'flysim':
+                snn.generateConf()
+                snn.generatePro()
+            snn.start(engine=args.engine, save_outputs=False)
+            # 50 ms windows every 50 ms, as the FiringRate output of flysim gave them.
+            times, rates = getFiringRates(snn.getSpikeStore('decision.dat'), [snn.getNeuron('TaskTarget')['id']], snn.getPopulationOffsets(), 50, 50, 1000)
+            mean = np.mean(rates[0, times > 0.6, 0])
             mean_rates.append(mean)
         fig, ax = plt.subplots()
         plt.title('TaskTarget Neuron Firing Rates against Connection Weights from Task Neuron')
@@ -122,21 +157,12 @@ if __name__ == '__main__':
         ax.set_ylabel('Mean firing rate (Hz)')
         plt.show()
     
-    if args.cos:  
-        for weight in np.logspace(0.1, 10, 10):
-            results = []
-            for strength in range(100, 1000, 100):
-                row = []
-                for duration in range(50, 500, 50):
-                    ssc = SNNSequenceControl(2, transitions=1, task_weights=[weight, weight], experiment_time=1000, repetition=1)
-                    ssc.setTransitionPeriod(500, duration, 500)
-                    ssc.generateTransitionStimuli('spike', 'AMPA', strength)
-                    ssc.spawnAttractor(100, 50, 'spike', 'AMPA', 400)
-                    ssc.startSimulation()
-                    x0, x1 = ssc.calculateRobustness()
-                    row.append(x1)
-                    #ssc.plotRaster()
-                results.insert(0, row)
+    if args.target == 'cos':
+        weight_list = np.logspace(0.1, 10, 10)
+        sweep = runSweep({'weight': weight_list, 'strength': range(100, 1000, 100), 'duration': range(50, 500, 50)}, buildCosCell, workers=args.workers, engine=args.engine, profile_dir=args.profile)
+        reportProfile()
+        for weight in weight_list:
+            results = sweep.select(weight=weight).heatmap(1)
     
             fig = plt.figure()
             ax = fig.add_subplot()
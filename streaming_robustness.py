@@ -0,0 +1,205 @@
+import os
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+
+from lif_engine import LIFEngine
+from simulator_launcher import SimulatorRun
+
+
+class StreamingRobustness:
+    '''Incremental robustness evaluation of an SNNSequenceControl, following the Task spikes while they are produced.
+
+    Window counts and the bump state of every Task node are updated as spikes arrive, and
+    the transitions of the ground truth are checked in time order: transition k succeeds
+    when node k+1 starts a bump within 3 windows after its stimulus onset while the bump
+    of node k is running or just ended. A trial is finished, and can be stopped, as soon as
+    the deadline of its next expected transition has passed or all transitions succeeded.
+    Windows follow the clock, not the spikes closing them as in calculateRobustness, so for
+    chains that transition in order both give the same counts on dense rasters.'''
+
+    def __init__(self, ssc, trials=None):
+        self.num_trial = ssc.repete if trials is None else trials
+        self.num_node = ssc.length
+        self.base_id = ssc.sim.getNeuron('Ordinal0')['id'] * ssc.population_size
+        self.node_stride = 3 * ssc.population_size
+        self.time_window = ssc.time_window
+        self.ground_truth = ssc.getGroundTruthTransition()
+        self.num_expect = min(len(self.ground_truth), self.num_node - 1)
+        self.num_window = int(np.ceil(ssc.stimulus['total_time'] / 1000 / self.time_window - 1e-9))
+        shape = (self.num_trial, self.num_node)
+        self.window = np.zeros(self.num_trial, dtype=np.int64)
+        self.counts = np.zeros(shape, dtype=np.int64)
+        self.bump_start = np.full(shape, -1)
+        self.last_start = np.full(shape, -1)
+        self.last_end = np.full(shape, -10)
+        self.success = np.zeros(self.num_trial, dtype=np.int64)
+        self.done = np.zeros(self.num_trial, dtype=bool)
+        self.done[:] = self.num_expect == 0
+
+    def resetTrial(self, trial):
+        '''Forget the spikes of one trial, e.g. before running it again.'''
+        self.window[trial] = 0
+        self.counts[trial] = 0
+        self.bump_start[trial] = -1
+        self.last_start[trial] = -1
+        self.last_end[trial] = -10
+        self.success[trial] = 0
+        self.done[trial] = self.num_expect == 0
+
+    def closeWindow(self, trial):
+        w = self.window[trial]
+        counts = self.counts[trial]
+        above = counts / max(counts.sum(), 1) > 0.5
+        running = self.bump_start[trial] >= 0
+        started = above & ~running
+        ended = ~above & running
+        self.bump_start[trial, started] = w
+        self.last_start[trial, started] = w
+        self.bump_start[trial, ended] = -1
+        self.last_end[trial, ended] = w - 1
+        counts[:] = 0
+        self.window[trial] += 1
+
+        k = self.success[trial]
+        if k < self.num_expect and started[k+1]:
+            previous_running = self.bump_start[trial, k] >= 0
+            previous_near = 0 <= self.last_start[trial, k] <= w and (previous_running or w - self.last_end[trial, k] < 3)
+            delay = w - self.ground_truth[k][0]
+            if previous_near and 0 <= delay < 3:
+                self.success[trial] += 1
+        k = self.success[trial]
+        if k >= self.num_expect or w + 1 >= self.ground_truth[k][0] + 3 or self.window[trial] >= self.num_window:
+            self.done[trial] = True
+
+    def feed(self, trial, times, neurons):
+        '''Add the next spikes of one trial, times (s) in increasing order.'''
+        if self.done[trial] or len(times) == 0:
+            return
+        windows = (np.asarray(times) / self.time_window).astype(np.int64)
+        nodes = (np.asarray(neurons, dtype=np.int64) - self.base_id) // self.node_stride
+        valid = (nodes >= 0) & (nodes < self.num_node) & (windows >= self.window[trial])
+        windows, nodes = windows[valid], nodes[valid]
+        bounds = np.flatnonzero(np.diff(windows)) + 1
+        for chunk_windows, chunk_nodes in zip(np.split(windows, bounds), np.split(nodes, bounds)):
+            while self.window[trial] < chunk_windows[0] and not self.done[trial]:
+                self.closeWindow(trial)
+            if self.done[trial]:
+                return
+            self.counts[trial] += np.bincount(chunk_nodes, minlength=self.num_node)
+
+    def feedLines(self, trial, lines):
+        '''Add '<time> <neuron>' text lines of one trial, e.g. read from a pipe or a growing file.'''
+        data = np.array(' '.join(lines).split(), dtype=np.float64).reshape(-1, 2)
+        self.feed(trial, data[:, 0], data[:, 1])
+
+    def advanceTo(self, trial, t):
+        '''Close the windows of one trial that end before time t (s).'''
+        while not self.done[trial] and (self.window[trial] + 1) * self.time_window <= t + 1e-9:
+            self.closeWindow(trial)
+
+    def engineCallback(self, t, records):
+        '''Callback for LIFEngine.run, returns which trials are still worth simulating.'''
+        for trial in np.unique(records['trial']):
+            trial_records = records[records['trial'] == trial]
+            self.feed(trial, trial_records['time'], trial_records['neuron'])
+        for trial in np.flatnonzero(~self.done):
+            self.advanceTo(trial, t / 1000)
+        return ~self.done
+
+    def getRobustness(self):
+        return [0] + [int(np.count_nonzero(self.success >= i)) for i in range(1, self.num_node)]
+
+
+def tailFile(path, process=None, poll=0.02, deadline=None):
+    '''Yield the complete lines appended to a file until the process writing it exits, or until the time.perf_counter() deadline.'''
+    while not os.path.exists(path):
+        if process is not None and process.poll() is not None:
+            return
+        if deadline is not None and time.perf_counter() > deadline:
+            return
+        time.sleep(poll)
+    with open(path, 'r') as stream:
+        pending = ''
+        while True:
+            data = stream.read()
+            if data:
+                pending += data
+                lines = pending.split('\n')
+                pending = lines.pop()
+                if lines:
+                    yield lines
+            elif process is None or process.poll() is not None:
+                if pending.strip():
+                    yield [pending]
+                return
+            elif deadline is not None and time.perf_counter() > deadline:
+                return
+            else:
+                time.sleep(poll)
+
+
+def runStreamedTrial(stream, trial, command, task_file, timeout=None):
+    '''Run one flysim trial while feeding its Task spike file to stream, return its SimulatorRun.
+
+    The process is killed once the trial is finished, which counts as success, or after
+    timeout seconds. stdout is discarded and stderr captured, like SimulatorLauncher does.'''
+    run = SimulatorRun(command)
+    if os.path.exists(task_file):
+        os.remove(task_file)
+    start = time.perf_counter()
+    deadline = None if timeout is None else start + timeout
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=stderr)
+        try:
+            for lines in tailFile(task_file, process, deadline=deadline):
+                stream.feedLines(trial, lines)
+                if stream.done[trial]:
+                    break
+        finally:
+            running = process.poll() is None
+            if running:
+                process.kill()
+            process.wait()
+        if stream.done[trial]:
+            run.returncode = 0
+        elif running:
+            run.timed_out = True
+        else:
+            run.returncode = process.returncode
+        stderr.seek(0)
+        run.stderr = stderr.read().decode(errors='replace')
+    run.duration = time.perf_counter() - start
+    return run
+
+
+def streamRobustness(ssc, engine='numpy', thread=1):
+    '''Simulate an SNNSequenceControl and evaluate its robustness on the fly, stopping failed trials early.
+
+    The numpy engine drops finished trials from its batch. flysim runs one process per trial (seeded with seed+trial when a seed is set), tails its Task
+    spike file and kills it once the trial is finished; the timeout and retries of the
+    FlysimSNN apply to every trial and a trial that still fails raises. Returns (robustness
+    counts, StreamingRobustness).'''
+    stream = StreamingRobustness(ssc)
+    task_file = f'{ssc.log_filename_base}_task.dat'
+    if engine == 'numpy':
+        ssc.sim.outputs = LIFEngine(ssc.sim).run(ssc.repete, stream.engineCallback)
+        ssc.sim.spike_stores = {}
+        return stream.getRobustness(), stream
+    if engine != 'flysim':
+        raise Exception(f'Unknown simulation engine {engine}.')
+    ssc.generateConfProFile()
+    for trial in range(ssc.repete):
+        seed = ssc.sim.seed + trial if ssc.sim.seed else None
+        command = ssc.sim.getFlysimCommand(thread, 1, seed)
+        for attempt in range(ssc.sim.retries + 1):
+            stream.resetTrial(trial)
+            run = runStreamedTrial(stream, trial, command, task_file, ssc.sim.timeout)
+            run.attempts = attempt + 1
+            if run.ok:
+                break
+        if not run.ok:
+            raise Exception(run.getError())
+    return stream.getRobustness(), stream
@@ -0,0 +1,111 @@
+import itertools
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import profiling
+from allocation import resolveAllocation
+from sim_cache import SimulationCache
+
+
+class SweepResult:
+    '''Results of a parameter sweep, labeled by the values of every grid axis.'''
+
+    def __init__(self, axes, values):
+        self.axes = axes
+        self.values = values
+
+    def getAxis(self, name):
+        return self.axes[name]
+
+    def select(self, **fixed):
+        index = []
+        axes = {}
+        for name, values in self.axes.items():
+            if name in fixed:
+                index.append(list(values).index(fixed[name]))
+            else:
+                index.append(slice(None))
+                axes[name] = values
+        return SweepResult(axes, self.values[tuple(index)])
+
+    def heatmap(self, item=None):
+        '''Return a 2-D grid with the first axis reversed, the row order used by the imshow plots of the sweeps.'''
+        if len(self.axes) != 2:
+            raise Exception('A heatmap needs exactly two free axes, select the others first.')
+        values = self.values if item is None else self.values[..., item]
+        return np.flipud(values)
+
+
+def simulateCell(cell, thread=1, engine='flysim', cache=None):
+    if hasattr(cell, 'startSimulation'):
+        cell.startSimulation(thread, engine, cache)
+    else:
+        if engine == 'flysim':
+            cell.generateConf()
+            cell.generatePro()
+        cell.start(thread, engine, cache=cache)
+
+
+def robustness(cell):
+    return cell.calculateRobustness()
+
+
+def runCell(build, evaluate, params, thread, engine, scratch_root, keep, cache_dir, profile_dir=None):
+    '''Build, simulate and evaluate one cell inside its own scratch directory.
+    With profile_dir, the phases of the cell are profiled and its run record is saved there.'''
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='cell_', dir=scratch_root)
+    os.chdir(workdir)
+    profiler = profiling.enable(profiling.Profiler(f'cell {params}')) if profile_dir else None
+    try:
+        with profiling.phase('cell', **params):
+            with profiling.phase('build'):
+                cell = build(**params)
+            cache = SimulationCache(cache_dir) if cache_dir else None
+            simulateCell(cell, thread, engine, cache)
+            with profiling.phase('evaluate'):
+                return evaluate(cell)
+    finally:
+        os.chdir(cwd)
+        if profiler is not None:
+            profiling.disable()
+            profiler.saveJson(os.path.join(profile_dir, os.path.basename(workdir) + '.json'))
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def runCells(cells, build, evaluate=robustness, workers=None, thread=None, engine='flysim', scratch_root=None, keep=False, cache_dir=None, profile_dir=None):
+    '''Run build(**params) for every params dict of cells across a process pool, results in the order of cells.
+    workers and thread left as None come from the allocation plan saved for cells like these, see allocation.py.'''
+    if cache_dir:
+        cache_dir = os.path.abspath(cache_dir)
+    if profile_dir:
+        profile_dir = os.path.abspath(profile_dir)
+        os.makedirs(profile_dir, exist_ok=True)
+    workers, thread = resolveAllocation(lambda: build(**cells[0]), engine, workers, thread)
+    if workers == 1:
+        return [runCell(build, evaluate, params, thread, engine, scratch_root, keep, cache_dir, profile_dir) for params in cells]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(runCell, build, evaluate, params, thread, engine, scratch_root, keep, cache_dir, profile_dir) for params in cells]
+        return [future.result() for future in futures]
+
+
+def runSweep(grid, build, evaluate=robustness, workers=None, thread=None, engine='flysim', scratch_root=None, keep=False, cache_dir=None, profile_dir=None):
+    '''Run build(**params) for every cell of the grid {name: values} across a process pool.
+
+    build and evaluate must be picklable, i.e. module level functions. Every cell runs in
+    a fresh directory under scratch_root, so the conf, pro and dat files of concurrent
+    cells never collide. The evaluated results are returned as a SweepResult whose values
+    have one axis per grid entry, followed by the axes of the evaluated result. With
+    cache_dir, all cells share one SimulationCache so repeated cells are not re-simulated.
+    With profile_dir, every cell saves its profiling record there, see profiling.py.'''
+    axes = {name: list(values) for name, values in grid.items()}
+    cells = [dict(zip(axes, combination)) for combination in itertools.product(*axes.values())]
+    results = runCells(cells, build, evaluate, workers, thread, engine, scratch_root, keep, cache_dir, profile_dir)
+    shape = tuple(len(values) for values in axes.values())
+    results = np.array(results)
+    return SweepResult(axes, results.reshape(shape + results.shape[1:]))
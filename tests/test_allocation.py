@@ -0,0 +1,13 @@
+import allocation
+from allocation import resolveAllocation
+
+
+def test_without_plan_uses_the_cores_of_the_process(tmp_path, monkeypatch):
+    monkeypatch.setattr(allocation, 'getCoreCount', lambda: 3)
+    monkeypatch.setattr(allocation.os, 'cpu_count', lambda: 64)
+    workers, thread = resolveAllocation(None, 'numpy', path=str(tmp_path / 'plans.json'))
+    assert (workers, thread) == (3, 1)
+
+
+def test_given_allocation_is_kept(tmp_path):
+    assert resolveAllocation(None, 'flysim', 5, 2, path=str(tmp_path / 'plans.json')) == (5, 2)
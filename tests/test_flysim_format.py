@@ -0,0 +1,15 @@
+import os
+import subprocess
+import sys
+
+import flysim_format
+
+PACKAGE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_flysim_target_does_not_depend_on_the_working_directory(tmp_path):
+    # Imported from another directory, the binary is still looked up next to the module.
+    output = subprocess.run([sys.executable, '-c', 'import flysim_format; print(flysim_format.FLYSIM_TARGET)'], cwd=tmp_path,
+                            env={**os.environ, 'PYTHONPATH': PACKAGE}, capture_output=True, text=True, check=True).stdout.strip()
+    assert output == os.path.join(PACKAGE, 'simulators', 'sim08_15', 'flysim.out')
+    assert flysim_format.FlysimSNN(100, 1).flysim_target == output
@@ -0,0 +1,25 @@
+import io
+import os
+
+import pytest
+
+from flysim_parser import NETWORK_DIRECTORY, checkRoundTrip, findNetworks, loadNetwork
+
+NETWORKS = findNetworks()
+
+
+def test_networks_are_found():
+    assert NETWORKS, f'No conf file found in {NETWORK_DIRECTORY}.'
+
+
+@pytest.mark.parametrize('conf_name, pro_name', NETWORKS, ids=[os.path.relpath(conf_name, NETWORK_DIRECTORY) for conf_name, _ in NETWORKS])
+def test_network_round_trip(conf_name, pro_name):
+    with open(conf_name, 'r') as stream:
+        conf_text = stream.read()
+    pro_text = None
+    if pro_name:
+        with open(pro_name, 'r') as stream:
+            pro_text = stream.read()
+    snn = loadNetwork(io.StringIO(conf_text), None if pro_text is None else io.StringIO(pro_text))
+    checks = checkRoundTrip(snn, conf_text, pro_text)
+    assert all(checks.values()), [check for check, passed in checks.items() if not passed]
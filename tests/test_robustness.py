@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from benchmark_robustness import synthesizeTaskSpikes
+from lif_engine import LIFEngine
+from ssc import SNNSequenceControl
+
+
+def buildChain(records=None, num_trial=8):
+    ssc = SNNSequenceControl(6, transitions=5, experiment_time=4000, repetition=num_trial)
+    ssc.setTransitionPeriod(500, 50, 500)
+    if records is not None:
+        ssc.sim.outputs[f'{ssc.log_filename_base}_task.dat'] = records
+    return ssc
+
+
+@pytest.mark.parametrize('rate, background, silence', [(100, 2, 0.0), (20, 0, 0.0), (5, 0, 0.0), (2, 0, 0.0), (10, 0, 0.15), (30, 1, 0.3)],
+                         ids=['dense', 'medium', 'sparse', 'very sparse', 'multi-window gaps', 'long gaps'])
+@pytest.mark.parametrize('seed', [1, 2])
+def test_vectorized_robustness_matches_the_loop(rate, background, silence, seed):
+    ssc = buildChain()
+    ssc.sim.outputs[f'{ssc.log_filename_base}_task.dat'] = synthesizeTaskSpikes(ssc, rate, background, seed=seed, silence=silence)
+    assert ssc.calculateRobustness() == ssc.calculateRobustnessLegacy()
+
+
+def test_spikes_on_window_ends_and_empty_trials():
+    ssc = buildChain()
+    records = synthesizeTaskSpikes(ssc, 10, 0, seed=3)
+    # Times on the 0.1 s window ends, one trial without spikes and one with a single spike.
+    records['time'] = np.round(records['time'], 1)
+    records = records[(records['trial'] != 2) & ((records['trial'] != 5) | (np.arange(len(records)) == np.flatnonzero(records['trial'] == 5)[0]))]
+    ssc.sim.outputs[f'{ssc.log_filename_base}_task.dat'] = records[np.lexsort((records['time'], records['trial']))]
+    assert ssc.calculateRobustness() == ssc.calculateRobustnessLegacy()
+
+
+def test_no_spikes():
+    ssc = buildChain(np.zeros(0, dtype=LIFEngine.record_dtype))
+    assert ssc.calculateRobustness() == ssc.calculateRobustnessLegacy() == [0] * 6
@@ -0,0 +1,62 @@
+import pytest
+
+from flysim_format import FlysimSNN
+from sim_cache import SimulationCache
+
+NEURON = {'n': 10, 'c': 0.5, 'leakyC': 2.5, 'taum': 20, 'threshold': -50, 'restpot': -70, 'resetpot': -55,
+          'refracperiod': 2, 'spikedly': 0, 'selfconnect': False}
+RECEPTOR = {'tau': 2, 'revpot': 0, 'freqext': 2.4, 'meanexteff': 2.1, 'meanextconn': 1.0}
+CONNECTION = {'mean_effect': 1.5, 'weight': 1.0, 'connectivity': 1.0}
+
+
+def build(neuron={}, receptor={}, connection={}, seed=1, iterations=2):
+    snn = FlysimSNN(100, iterations, 'cache_key', seed)
+    for name in ('A', 'B'):
+        snn.addNeuron(name, **{**NEURON, **neuron})
+        snn.addReceptor(name, 'AMPA', **{**RECEPTOR, **receptor})
+    snn.addCoonection('A', 'B', 'AMPA', **{**CONNECTION, **connection})
+    snn.addStimulus('spike', (10, 50), 'A', 'AMPA', 100)
+    snn.defineOutput('Spike', 'cache_key.dat', 'AllPopulation')
+    return snn
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SimulationCache(tmp_path)
+
+
+def changed(value):
+    return not value if isinstance(value, bool) else value * 2 + 1
+
+
+@pytest.mark.parametrize('group, name', [('neuron', name) for name in NEURON] + [('receptor', name) for name in RECEPTOR] +
+                         [('connection', name) for name in CONNECTION])
+def test_every_parameter_changes_the_key(cache, group, name):
+    default = {'neuron': NEURON, 'receptor': RECEPTOR, 'connection': CONNECTION}[group]
+    key = cache.getKey(build(), 'numpy')
+    assert cache.getKey(build(**{group: {name: changed(default[name])}}), 'numpy') != key
+
+
+def test_protocol_seed_trials_and_engine_change_the_key(cache):
+    key = cache.getKey(build(), 'numpy')
+    assert cache.getKey(build(), 'numpy') == key
+    assert cache.getKey(build(seed=2), 'numpy') != key
+    assert cache.getKey(build(iterations=3), 'numpy') != key
+    assert cache.getKey(build(), 'flysim') != key
+    snn = build()
+    snn.addStimulus('spike', (60, 70), 'B', 'AMPA', 100)
+    assert cache.getKey(snn, 'numpy') != key
+
+
+def test_parameters_missing_from_the_conf_text_do_not_collide(cache):
+    first = build(neuron={'refracperiod': 2}, connection={'connectivity': 1.0})
+    second = build(neuron={'refracperiod': 20}, connection={'connectivity': 0.1})
+    assert first.getAllConf() == second.getAllConf()
+    assert cache.getKey(first, 'numpy') != cache.getKey(second, 'numpy')
+
+
+def test_spike_count_does_not_change_the_key(cache):
+    snn = build()
+    key = cache.getKey(snn, 'numpy')
+    snn.getNeuron('A')['spike_count'] = 5
+    assert cache.getKey(snn, 'numpy') == key
@@ -0,0 +1,59 @@
+import os
+import sys
+
+from flysim_format import FlysimSNN
+from simulator_launcher import runCommands, runNetworks
+
+STAND_IN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'simulators', 'stand_in_flysim.py')
+
+
+def buildNetworks(directory, count=2):
+    networks, directories = [], []
+    for i in range(count):
+        snn = FlysimSNN(300, 1, 'launcher', seed=i + 1)
+        snn.flysim_target = STAND_IN
+        snn.addNeuron('Task', n=10)
+        snn.addReceptor('Task', 'AMPA', tau=20, meanexteff=10.5)
+        snn.addStimulus('spike', (50, 150), 'Task', 'AMPA', 500)
+        snn.defineOutput('Spike', 'launcher.dat', 'Task')
+        directories.append(directory / str(i))
+        directories[-1].mkdir()
+        networks.append(snn)
+    return networks, directories
+
+
+def test_success(tmp_path):
+    networks, directories = buildNetworks(tmp_path)
+    runs = runNetworks(networks, directories, timeout=60)
+    assert [run.ok for run in runs] == [True, True]
+    assert [run.attempts for run in runs] == [1, 1]
+    for directory in directories:
+        assert (directory / 'launcher.conf').exists()
+        assert (directory / 'launcher.dat').exists()
+
+
+def test_timeout_kills_every_attempt(tmp_path, monkeypatch):
+    monkeypatch.setenv('STAND_IN_HANG', '1')
+    networks, directories = buildNetworks(tmp_path, 1)
+    run, = runNetworks(networks, directories, timeout=0.5, retries=1)
+    assert not run.ok
+    assert run.timed_out and run.returncode is None
+    assert run.attempts == 2
+    assert 'timed out after 2 attempts' in run.getError()
+    assert run.duration < 30
+
+
+def test_crash_is_retried_and_reported(tmp_path, monkeypatch):
+    monkeypatch.setenv('STAND_IN_CRASH', '1')
+    networks, directories = buildNetworks(tmp_path, 1)
+    run, = runNetworks(networks, directories, timeout=60, retries=2)
+    assert not run.ok and not run.timed_out
+    assert run.returncode == 1 and run.attempts == 3
+    assert 'Segmentation fault' in run.stderr
+
+
+def test_retry_succeeds_after_a_failed_attempt(tmp_path):
+    # Fails on the first attempt only, it leaves a marker for the next one.
+    script = 'import os, sys\nif not os.path.exists("marker"):\n    open("marker", "w").close()\n    sys.exit(1)\n'
+    run, = runCommands([[sys.executable, '-c', script]], [str(tmp_path)], timeout=60, retries=1)
+    assert run.ok and run.attempts == 2